@@ -0,0 +1,91 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''
+Measure the time and memory to draw a batch of charts with FinPlot.plotChart from random
+candles. No api is called. The memory is the peak resident size of the process, so it should
+stop growing after the first few charts.
+
+    python benchmarks/bench_chart.py
+    python benchmarks/bench_chart.py -n 300 --candles 500
+
+@author: Mike Petersen
+
+@creation_date: 10/18/26
+'''
+import argparse
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from structjour.stock.graphstuff import FinPlot   # noqa: E402
+
+
+def makeCandles(n, seed=7):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 0.2, n))
+    opn = np.r_[100, close[:-1]]
+    high = np.maximum(opn, close) + rng.uniform(0, 0.2, n)
+    low = np.minimum(opn, close) - rng.uniform(0, 0.2, n)
+    volume = rng.integers(1000, 50000, n).astype(float)
+    index = pd.date_range('2020-11-30 04:00', periods=n, freq='1min')
+    return pd.DataFrame({'open': opn, 'high': high, 'low': low, 'close': close, 'volume': volume},
+                        index=index)
+
+
+def peakMB():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time drawing a batch of charts.')
+    parser.add_argument('-n', type=int, default=100, help='Charts to draw')
+    parser.add_argument('--candles', type=int, default=500, help='Candles in each chart')
+    args = parser.parse_args(argv)
+
+    df = makeCandles(args.candles)
+    fp = FinPlot()
+    fp.chartSet.setValue('interactive', False)
+    outdir = tempfile.mkdtemp()
+    times = []
+    memory = []
+    try:
+        for i in range(args.n):
+            save = os.path.join(outdir, f'chart{i}.png')
+            t = time.perf_counter()
+            fp.plotChart('SQ', 'bench', df, None, df.index[0], df.index[-1], 1, save=save)
+            times.append((time.perf_counter() - t) * 1000)
+            memory.append(peakMB())
+    finally:
+        shutil.rmtree(outdir)
+    print(f'{args.n} charts of {args.candles} candles')
+    print(f'first chart ms {times[0]:8.1f}')
+    print(f'median ms      {statistics.median(times):8.1f}')
+    print(f'peak MB after 10% / 100%: {memory[len(memory) // 10]:.0f} / {memory[-1]:.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''
+Measure the time to import the stock modules in a fresh interpreter, and list the heavy
+libraries each import drags in. pandas is imported before the clock starts because every module
+needs it.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py structjour.stock.myFinhub -n 20
+
+@author: Mike Petersen
+
+@creation_date: 10/18/26
+'''
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MODULES = [
+    'structjour.stock.apichooser',
+    'structjour.stock.utilities',
+    'structjour.stock.myFinhub',
+    'structjour.stock.mytiingo',
+    'structjour.stock.graphstuff',
+]
+
+# Libraries that should only be imported when they are used. pandas imports the core of
+# pyarrow itself when it is installed, so the bar store's pyarrow is marked by pyarrow.parquet
+HEAVY = ['sqlalchemy', 'aiohttp', 'pyarrow.parquet', 'matplotlib.pyplot', 'PyQt5.QtWidgets', 'ibapi',
+         'structjour.stock.mybarchart', 'structjour.stock.myalphavantage',
+         'structjour.stock.myFinhub', 'structjour.stock.mytiingo', 'structjour.stock.myib']
+
+CHILD = '''
+import importlib, json, sys, time
+import pandas
+t = time.perf_counter()
+importlib.import_module(sys.argv[1])
+t = time.perf_counter() - t
+print(json.dumps({'seconds': t, 'loaded': [m for m in json.loads(sys.argv[2]) if m in sys.modules]}))
+'''
+
+
+def timeImport(module, root):
+    '''Import module in a new interpreter. Return (seconds, [heavy modules loaded])'''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([root, env.get('PYTHONPATH', '')])
+    env.setdefault('MPLBACKEND', 'Agg')
+    out = subprocess.run([sys.executable, '-c', CHILD, module, json.dumps(HEAVY)], env=env,
+                         capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f'Failed to import {module}:\n{out.stderr}')
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    return result['seconds'], result['loaded']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the imports of the stock modules.')
+    parser.add_argument('modules', nargs='*', default=MODULES)
+    parser.add_argument('-n', type=int, default=10, help='Imports of each module')
+    args = parser.parse_args(argv)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    print(f'{"module":40} {"median ms":>10} {"min ms":>8}  heavy imports')
+    for module in args.modules:
+        times = []
+        for i in range(args.n):
+            seconds, loaded = timeImport(module, root)
+            times.append(seconds * 1000)
+        print(f'{module:40} {statistics.median(times):10.1f} {min(times):8.1f}  {", ".join(loaded)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''
+The settings of structjour without a hard dependency on Qt. getSettings returns an object with
+the QSettings methods the program uses (value, setValue, remove and contains). The values come
+from a backend:
+
+    QSettingsBackend   The desktop app's QSettings. Reads are cached for a couple of seconds
+    FileBackend        A JSON or TOML file, e.g. for a chart worker on a server
+    DictBackend        In memory. For tests or a process that sets everything itself
+
+The backend is chosen on first use: the file named by the environment variable
+STRUCTJOUR_CONFIG if it is set, otherwise QSettings if PyQt5 is installed, otherwise memory.
+Environment variables override any backend, e.g. STRUCTJOUR_STOCKAPI_APIPREF=fh,tgo. A file
+or a variable groups the keys into sections named for the last part of the QSettings
+organization, 'stockapi' and 'chart', and 'main' for 'zero_substance':
+
+    {"main": {"tradeDb": "/data/trades.sqlite"},
+     "stockapi": {"APIPref": "fh,tgo", "useBarStore": true},
+     "chart": {"getmas": [[[9, 9, "red"], [20, 20, "blue"]], []], "afterhours": false}}
+
+@author: Mike Petersen
+
+@creation_date: 10/18/26
+'''
+import json
+import logging
+import os
+import threading
+import time
+
+ENV_CONFIG = 'STRUCTJOUR_CONFIG'
+ENV_PREFIX = 'STRUCTJOUR_'
+
+# Seconds a value read from QSettings is reused. Qt dialogs write QSettings directly
+QSETTINGS_TTL = 2.0
+
+MISSING = object()
+
+
+def section(org):
+    '''Return the section name of a QSettings organization'''
+    return org.split('/')[-1] if '/' in org else 'main'
+
+
+def convert(value, type):
+    '''Convert a stored value the way QSettings.value does for the type argument'''
+    if type is None or value is None:
+        return value
+    if type is bool:
+        if isinstance(value, str):
+            return value.strip().lower() in ('true', '1', 'yes', 'on')
+        return bool(value)
+    if type is list:
+        if isinstance(value, (list, tuple)):
+            return list(value)
+        return [value]
+    return type(value)
+
+
+class DictBackend:
+    '''Settings in a dict {section: {key: value}}'''
+    def __init__(self, data=None):
+        self.data = data if data is not None else dict()
+        self.lock = threading.Lock()
+
+    def get(self, org, app, key):
+        return self.data.get(section(org), {}).get(key, MISSING)
+
+    def set(self, org, app, key, value):
+        with self.lock:
+            self.data.setdefault(section(org), {})[key] = value
+
+    def remove(self, org, app, key):
+        with self.lock:
+            self.data.get(section(org), {}).pop(key, None)
+
+
+class FileBackend(DictBackend):
+    '''
+    Settings read once from a JSON or TOML file. Changes are written back to a JSON file. A
+    TOML file is not changed; its changes last until the program ends.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.toml = path.lower().endswith('.toml')
+        data = dict()
+        if os.path.exists(path):
+            if self.toml:
+                import tomllib
+                with open(path, 'rb') as f:
+                    data = tomllib.load(f)
+            else:
+                with open(path) as f:
+                    data = json.load(f)
+        super().__init__(data)
+
+    def set(self, org, app, key, value):
+        super().set(org, app, key, value)
+        self.save()
+
+    def remove(self, org, app, key):
+        super().remove(org, app, key)
+        self.save()
+
+    def save(self):
+        if self.toml:
+            return
+        with self.lock:
+            tmp = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.data, f, indent=2, default=str)
+            os.replace(tmp, self.path)
+
+
+class QSettingsBackend:
+    '''
+    The desktop app's QSettings. Each value read is reused for ttl seconds so the hot paths
+    do not go through Qt on every call. Writes through this backend are seen at once.
+    '''
+    def __init__(self, ttl=QSETTINGS_TTL, clock=time.monotonic):
+        from PyQt5.QtCore import QSettings
+        self.QSettings = QSettings
+        self.ttl = ttl
+        self.clock = clock
+        self.settings = dict()
+        self.cache = dict()
+        self.lock = threading.Lock()
+
+    def qsettings(self, org, app):
+        qs = self.settings.get((org, app))
+        if qs is None:
+            qs = self.settings[(org, app)] = self.QSettings(org, app)
+        return qs
+
+    def get(self, org, app, key):
+        now = self.clock()
+        entry = self.cache.get((org, app, key))
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        with self.lock:
+            qs = self.qsettings(org, app)
+            value = qs.value(key) if qs.contains(key) else MISSING
+            self.cache[(org, app, key)] = (value, now + self.ttl)
+        return value
+
+    def set(self, org, app, key, value):
+        with self.lock:
+            self.qsettings(org, app).setValue(key, value)
+            self.cache.pop((org, app, key), None)
+
+    def remove(self, org, app, key):
+        with self.lock:
+            self.qsettings(org, app).remove(key)
+            self.cache.pop((org, app, key), None)
+
+    def invalidate(self):
+        with self.lock:
+            self.cache.clear()
+
+
+class EnvBackend:
+    '''
+    Environment variables STRUCTJOUR_<SECTION>_<KEY> over another backend. The values are
+    parsed as JSON if they can be, otherwise they are strings.
+    '''
+    def __init__(self, backend, environ=None, prefix=ENV_PREFIX):
+        self.backend = backend
+        self.environ = environ if environ is not None else os.environ
+        self.prefix = prefix
+
+    def name(self, org, key):
+        return f'{self.prefix}{section(org)}_{key}'.upper()
+
+    def get(self, org, app, key):
+        value = self.environ.get(self.name(org, key))
+        if value is None:
+            return self.backend.get(org, app, key)
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+
+    def set(self, org, app, key, value):
+        self.backend.set(org, app, key, value)
+
+    def remove(self, org, app, key):
+        self.backend.remove(org, app, key)
+
+
+BACKEND = None
+_backendLock = threading.Lock()
+
+
+def defaultBackend():
+    '''The backend for this process, see the module docstring'''
+    path = os.environ.get(ENV_CONFIG)
+    if path:
+        backend = FileBackend(path)
+    else:
+        try:
+            backend = QSettingsBackend()
+        except ImportError:
+            logging.info('PyQt5 is not installed. The settings are kept in memory')
+            backend = DictBackend()
+    return EnvBackend(backend)
+
+
+def getBackend():
+    global BACKEND
+    if BACKEND is None:
+        with _backendLock:
+            if BACKEND is None:
+                BACKEND = defaultBackend()
+    return BACKEND
+
+
+def setBackend(backend, env=True):
+    '''
+    Use backend for the settings of this process.
+    :params env: Let environment variables override backend
+    '''
+    global BACKEND
+    with _backendLock:
+        BACKEND = EnvBackend(backend) if env else backend
+
+
+class Settings:
+    '''
+    The settings of one QSettings organization and application. The backend is looked up on
+    each call, so the object can be created before the backend is chosen.
+    '''
+    def __init__(self, org, app='structjour', backend=None):
+        self.org = org
+        self.app = app
+        self.backend = backend
+
+    def getBackend(self):
+        return self.backend if self.backend is not None else getBackend()
+
+    def value(self, key, defaultValue=None, type=None):
+        value = self.getBackend().get(self.org, self.app, key)
+        if value is MISSING:
+            return defaultValue
+        return convert(value, type)
+
+    def setValue(self, key, value):
+        self.getBackend().set(self.org, self.app, key, value)
+
+    def remove(self, key):
+        self.getBackend().remove(self.org, self.app, key)
+
+    def contains(self, key):
+        return self.getBackend().get(self.org, self.app, key) is not MISSING
+
+
+def getSettings(org, app='structjour'):
+    '''Get the settings of a QSettings organization and application'''
+    return Settings(org, app)
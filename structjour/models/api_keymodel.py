@@ -24,6 +24,7 @@ sqlalchemy models for inspire quotes
 the tokens for REST access to stock data
 '''
 import logging
+import threading
 from sqlalchemy import Column, String, Integer
 from structjour.models.meta import Base, ModelBase
 
@@ -33,13 +34,52 @@ class ApiKey(Base):
     api = Column(String, unique=True, nullable=False)
     key = Column(String)
 
+    # (db file, {api: key}) The keys are read with one query and kept until a key changes
+    _keys = None
+    _keysLock = threading.Lock()
+
+    @classmethod
+    def loadKeys(cls):
+        '''
+        Return the dict {api: key} for the current db, querying the table the first time.
+        The dict is shared, don't change it.
+        '''
+        db = ModelBase.settings.value('tradeDb')
+        cached = cls._keys
+        if cached is not None and cached[0] == db:
+            return cached[1]
+        with cls._keysLock:
+            cached = cls._keys
+            if cached is not None and cached[0] == db:
+                return cached[1]
+            ModelBase.connect(new_session=True)
+            session = ModelBase.session
+            if session is None:
+                return {}
+            try:
+                keys = {api: key for api, key in session.query(ApiKey.api, ApiKey.key)}
+            finally:
+                session.close()
+            cls._keys = (db, keys)
+        return keys
+
+    @classmethod
+    def getKeys(cls):
+        '''Return a dict {api: key} of all the keys'''
+        return dict(cls.loadKeys())
+
+    @classmethod
+    def invalidate(cls):
+        '''Read the keys from the db on the next request'''
+        cls._keys = None
+
     @classmethod
     def getKey(cls, api, keyonly=True):
+        if keyonly:
+            return cls.loadKeys().get(api)
         ModelBase.connect(new_session=True)
         session = ModelBase.session
         q = session.query(ApiKey).filter_by(api=api).one_or_none()
-        if keyonly:
-            return q.key if q else None
         return q
 
     @classmethod
@@ -47,21 +87,19 @@ class ApiKey(Base):
         return cls.addKey(api, key)
 
     @classmethod
-    def addKey(self, api, key=''):
+    def addKey(cls, api, key=''):
         ModelBase.connect(new_session=True)
         session = ModelBase.session
         q = session.query(ApiKey).filter_by(api=api).one_or_none()
         if q:
             q.key = key
             session.add(q)
-            session.commit()
-            session.close()
-            return
-        
-        newkey = ApiKey(api=api, key=key)
-        session.add(newkey)
+        else:
+            session.add(ApiKey(api=api, key=key))
         session.commit()
         session.close()
+        # After the commit, so a reader can't cache the old key in between
+        cls.invalidate()
 
     @classmethod
     def removeKey(cls, api):
@@ -72,6 +110,7 @@ class ApiKey(Base):
             ModelBase.session.delete(q)
             ModelBase.session.commit()
             ModelBase.session.close()
+            cls.invalidate()
 
 def removekey():
     a = ApiKey()
@@ -23,11 +23,12 @@ sqlalchemy models for strategy tables
 
 # import logging
 
-from PyQt5.QtCore import QSettings
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import MetaData, create_engine, Column, Integer, String, Sequence
 from sqlalchemy.orm import sessionmaker
 
+from structjour.config import getSettings
+
 Base = declarative_base()
 Session = sessionmaker()
 
@@ -53,7 +54,7 @@ class ModelBase:
     Contains common methods for and static variables used by sqlalchemy stuff. 
     '''
 
-    settings = QSettings('zero_substance', 'structjour')
+    settings = getSettings('zero_substance', 'structjour')
     metadata = MetaData()
     db = None
     session = None
@@ -20,38 +20,115 @@ Choose which API intraday call to get chart data based on rules
 
 @creation_date: 3/3/20
 '''
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import datetime as dt
+import functools
+import importlib
 import logging
 import pandas as pd
 import requests
-from structjour.stock.utilities import checkForIbapi, getLimitReached, ManageKeys
-from structjour.stock import myalphavantage as mav
-from structjour.stock import mybarchart as bc
-from structjour.stock import myFinhub as fh
-from structjour.stock.mytiingo import get_intraday as get_tgo_intraday
-if checkForIbapi():
-    from structjour.stock import myib as ib
+from structjour.stock.nysecalendar import getCalendar
+from structjour.stock.ratelimit import getLimiter, orderByBudget
+from structjour.stock.singleflight import getSingleFlight
+from structjour.stock.utilities import (checkForIbapi, excludeAfterHours, getLimitReached, getMASettings,
+                                      ManageKeys)
+from structjour.stock.intradaycache import copyResult, getIntradayCache
+from structjour.stock.barstore import (BarStore, dailyVwap, dayRuns, getBarStoreDir, getBarStoreFormat,
+                                      isClosedDay, joinMas, maColumns, sessionDays, splitMas, storeInterval)
+
+# token: (module, data method). A module is imported the first time its api is used
+PROVIDERS = {
+    'bc': ('structjour.stock.mybarchart', 'getbc_intraday'),
+    'av': ('structjour.stock.myalphavantage', 'getmav_intraday'),
+    'fh': ('structjour.stock.myFinhub', 'getFh_intraday'),
+    'tgo': ('structjour.stock.mytiingo', 'get_intraday'),
+    'ib': ('structjour.stock.myib', 'getib_intraday'),
+}
+# The apis with a coroutine data method
+ASYNC_PROVIDERS = {
+    'tgo': ('structjour.stock.mytiingo', 'aget_intraday'),
+}
+
+
+def loadProvider(token, providers=PROVIDERS):
+    '''
+    Import the module of the api token and return its data method.
+    :return: The method or None if token is unknown or its library is not installed
+    '''
+    if token not in providers:
+        return None
+    if token == 'ib' and not checkForIbapi():
+        return None
+    module, name = providers[token]
+    return getattr(importlib.import_module(module), name)
+
+
+def asyncProvider(method):
+    '''Wrap a blocking provider function so it can be awaited. It runs in the default executor'''
+    async def provider(symbol, start, end, minutes, key=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(method, symbol, start, end,
+                                                                  minutes, key=key))
+    return provider
+
+
+def validIntraday(df):
+    '''Return True if df is a usable, time ordered DataFrame of candles'''
+    if not isinstance(df, pd.DataFrame) or df.empty:
+        return False
+    if not set(['open', 'high', 'low', 'close', 'volume']).issubset(df.columns):
+        return False
+    return df.index.is_monotonic_increasing
 
 
 class APIChooser:
-    def __init__(self, apiset, orprefs=None, keydict={}):
+    def __init__(self, apiset, orprefs=None, keydict={}, store=None, hedge=None, cache=None,
+                 flight=None):
         '''
         The currenly supported apis are barchart, alphavantage, finnhub,
         tiingo and ibapi
         These are represented by the tokens bc, av, fh, tgo and ib
         :params apiset: QSettings with key 'APIPref'
         :params orprefs: List: Override the api prefs in settings
+        :params store: BarStore: The local bar store to consult before calling the apis. By
+            default one is created at getBarStoreDir() unless the setting 'useBarStore' is False
+        :params hedge: int: The number of apis to request at once, the first good response
+            wins. Defaults to the setting 'hedgeCount' or 1, which tries the apis one at a time.
+        :params cache: IntradayCache: The in memory cache of results. Defaults to the process
+            wide cache unless the setting 'useIntradayCache' is False
+        :params flight: SingleFlight: Coalesces identical api calls made at the same time.
+            Defaults to the process wide one
         '''
         self.apiset = apiset
         self.orprefs = orprefs
         self.preferences = self.getPreferences()
         self.api = self.preferences[0]
-        self.keydict = keydict
-        if len(self.keydict) == 0:
-            mk = ManageKeys()
+        # Looked up in the database on first use if not given
+        self._keydict = keydict if keydict else None
+        self.store = store
+        if self.store is None and self.apiset.value('useBarStore', True, bool):
+            self.store = BarStore(getBarStoreDir(self.apiset), getBarStoreFormat(self.apiset))
+        self.hedge = hedge if hedge else self.apiset.value('hedgeCount', 1, int)
+        self.cache = cache
+        if self.cache is None and self.apiset.value('useIntradayCache', True, bool):
+            self.cache = getIntradayCache()
+        self.flight = flight if flight is not None else getSingleFlight()
+
 
-            self.keydict = mk.getKeyDict()
+    @property
+    def keydict(self):
+        if self._keydict is None:
+            self._keydict = ManageKeys().getKeyDict()
+        return self._keydict
 
+    @keydict.setter
+    def keydict(self, keydict):
+        self._keydict = keydict
+
+    def getKey(self, token):
+        '''Return the api key of token, None if there is none'''
+        return self.keydict[token] if token in self.keydict else None
 
     def getPreferences(self):
         if self.orprefs:
@@ -95,7 +172,7 @@ class APIChooser:
         # Rule 1a Barchart will not return yesterdays data after 12 till 1630
         tradeday = pd.Timestamp(start.year, start.month, start.day)
         todayday = pd.Timestamp(n.year, n.month, n.day)
-        yday = todayday - pd.Timedelta(days=1)
+        yday = getCalendar().previousSession(todayday)
         y = pd.Timestamp(yday.year, yday.month, yday.day, 11, 59)
         if tradeday == todayday and n < nclose and 'bc' in suggestedApis:
             suggestedApis.remove('bc')
@@ -123,18 +200,23 @@ class APIChooser:
 
         # Rule 3 Don't call ib if the library is not installed
         # Rule 4 Don't call ib if its not connected
-        if self.apiset.value('gotibapi', type=bool):
-            if 'ib' in suggestedApis and not ib.isConnected():
+        if 'ib' in suggestedApis:
+            if not checkForIbapi():
+                suggestedApis.remove('ib')
+                violatedRules.append('IBAPI is not installed')
+            elif not importlib.import_module(PROVIDERS['ib'][0]).isConnected():
                 suggestedApis.remove('ib')
                 violatedRules.append('IBAPI is not connected.')
-        elif 'ib' in suggestedApis:
-            suggestedApis.remove('ib')
-            violatedRules.append('IBAPI is not installed')
 
         # Rule 5 No data is available for the future
         if start > n:
             suggestedApis = []
             violatedRules.append('No data is available for the future.')
+        # Rule 5a No data is available when the market was closed the whole time
+        elif start <= end and not sessionDays(start, end):
+            suggestedApis = []
+            violatedRules.append('The market was closed from {} to {}.'.format(
+                start.strftime("%b %d"), end.strftime("%b %d")))
         # Rule No 6 Don't call barchart if there is no apikey in settings
         # Rule No 6 Don't call alphavantage if there is no apikey in settings
         # Rule No 6 Don't call finnhub if there is no api key in settings
@@ -157,16 +239,19 @@ class APIChooser:
             suggestedApis.remove('tgo')
             violatedRules.append('There is no apikey in the database for tiingo')
 
-        # Rule No 7 API limit has been reached [bc, av, fh]
+        # Rule No 7 API limit has been reached [bc, av, fh, tgo]
+        # or a request would wait too long for the rate limit
         deleteme = []
         for token in suggestedApis:
             if token == 'ib' or token is None:
                 continue
-            if getLimitReached(token, self.apiset):
+            if getLimitReached(token):
                 deleteme.append(token)
                 violatedRules.append(f'You have reached your quota for {token}')
         for token in deleteme:
             suggestedApis.remove(token)
+        # Apis that can go now and have budget to spare go first, in the preferred order
+        suggestedApis = orderByBudget(suggestedApis, getLimiter())
         api = api in suggestedApis if api else False
 
         self.api = suggestedApis[0] if suggestedApis else None
@@ -174,40 +259,296 @@ class APIChooser:
 
         return(api, violatedRules, suggestedApis)
 
-    def apiChooser(self):
+    def apiChooser(self, api=None):
         '''
         Get a data method as set in self.api
+        :params api: Get the method for this api token instead of self.api
         :return the method
         '''
-        # self.api = api
-        if self.api == 'bc':
-            # retrieves previous biz day until about 16:30
-            return bc.getbc_intraday
-        if self.api == 'av':
-            return mav.getmav_intraday
-        if self.api == 'ib':
-            return ib.getib_intraday
-        if self.api == 'fh':
-            return fh.getFh_intraday
-        if self.api == 'tgo':
-            return get_tgo_intraday
-
-        return None
+        api = api if api else self.api
+        return loadProvider(api)
 
     def get_intraday(self, symbol, start=None, end=None, minutes=5, showUrl=False):
+        if self.cache is None:
+            return self.getIntradayUncached(symbol, start, end, minutes)
+        key = self.cacheKey(symbol, start, end, minutes)
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.api, result = cached
+            return result
+        meta, df, ma = self.getIntradayUncached(symbol, start, end, minutes)
+        if validIntraday(df):
+            self.cache.put(key, self.api, meta, df, ma, end)
+        return meta, df, ma
+
+    def cacheKey(self, symbol, start, end, minutes):
+        '''The key of a result in the cache. It includes the settings that change the result'''
+        mas, vwap = getMASettings()
+        return (symbol.upper(), pd.Timestamp(start) if start is not None else None,
+                pd.Timestamp(end) if end is not None else None,
+                storeInterval(minutes, not excludeAfterHours()),
+                tuple(self.getPreferences()), tuple(mas.keys()), bool(vwap))
+
+    def getIntradayUncached(self, symbol, start=None, end=None, minutes=5):
+        if self.store and start is not None and end is not None:
+            result = self.getStoredIntraday(symbol, start, end, minutes)
+            if result:
+                return result
+
         api, vr, suggested = self.apiChooserList(start, end)
+        if self.hedge > 1 and len(suggested) > 1:
+            hedged = suggested[:self.hedge]
+            result = self.getHedgedIntraday(hedged, symbol, start, end, minutes)
+            if result:
+                return result
+            suggested = suggested[self.hedge:]
+
         for token in suggested:
             self.api = token
             try:
-                dakey = self.keydict[self.api] if self.api in self.keydict else None
-                meta, df, ma = self.apiChooser()(symbol, start, end, minutes, key=dakey)
+                meta, df, ma = self.fetchIntraday(symbol, start, end, minutes, token)
+            except requests.exceptions.Timeout as ex:
+                logging.warning(f'Request to {token} timed out: {ex}')
+                continue
             except requests.exceptions.ConnectionError as ex:
                 message = "Please check your internet connection\n" + str(ex)
 
                 meta = {'code': 666, 'message': message}
                 logging.error(message)
-                return meta, pd.DataFrame, None
-            if not df.empty:
+                return meta, pd.DataFrame(), None
+            if validIntraday(df):
                 return meta, df, ma
         msg = f'Failed to retrieve data from APIS: {self.preferences}'
         return {'code': 666, 'message': msg}, pd.DataFrame(), None
+
+    def getHedgedIntraday(self, tokens, symbol, start, end, minutes):
+        '''
+        Request the data from each api in tokens at the same time and return the first good
+        response. The slower requests are abandoned; their results are discarded. An api that
+        raises, whether from the network or from a response it could not read, counts as one
+        that returned nothing.
+        :return: (meta, df, maDict) or None if none of the apis returned data
+        '''
+        pool = ThreadPoolExecutor(max_workers=len(tokens))
+        futures = {pool.submit(self.fetchIntraday, symbol, start, end, minutes, token): token
+                   for token in tokens}
+        try:
+            for future in as_completed(futures):
+                token = futures[future]
+                try:
+                    meta, df, ma = future.result()
+                except Exception as ex:
+                    logging.warning(f'Hedged request to {token} failed: {ex!r}')
+                    continue
+                if validIntraday(df):
+                    self.api = token
+                    return meta, df, ma
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        return None
+
+    def getStoredIntraday(self, symbol, start, end, minutes):
+        '''
+        Retrieve the chart data from the local bar store if every day in the request is there
+        for one of the preferred apis.
+        :return: (meta, df, maDict) or None if the store cannot satisfy the request
+        '''
+        start = pd.Timestamp(start)
+        end = pd.Timestamp(end)
+        days = sessionDays(start, end)
+        if not days or not isClosedDay(days[-1]):
+            return None
+        mas, vwap = getMASettings()
+        windows = list(mas.keys())
+        columns = maColumns(windows, bool(vwap))
+        interval = storeInterval(minutes, not excludeAfterHours())
+        for token in self.getPreferences():
+            if token is None:
+                continue
+            found, missing = self.store.getDays(symbol, token, interval, days, start, end, columns)
+            if missing:
+                continue
+            result = self.mergeStored(found, windows, start, end)
+            if result is None:
+                continue
+            self.api = token
+            meta = {'code': 200, 'message': f'Retrieved {symbol} from the local bar store ({token})'}
+            return (meta,) + result
+        return None
+
+    def mergeStored(self, frames, windows, start, end):
+        '''
+        Concatenate the stored days and trim them to start and end.
+        :params frames: dict {day: DataFrame} from the store
+        :return: (df, maDict) or None if the stored days lack the data
+        '''
+        frame = pd.concat([frames[day] for day in sorted(frames)])
+        frame = frame.loc[(frame.index >= start) & (frame.index <= end)]
+        if frame.empty:
+            return None
+        df, maDict = splitMas(frame, windows)
+        if maDict is None:
+            return None
+        return df, maDict
+
+    def fetchIntraday(self, symbol, start, end, minutes, token=None):
+        '''
+        Call the api in token (default self.api). If the store is in use and the request covers
+        only completed days, request just the days missing from the store, one call per run of
+        consecutive days, store what comes back and merge it with the stored days.
+        '''
+        token = token if token else self.api
+        method = self.apiChooser(token)
+        dakey = self.getKey(token)
+        plan = self.planFetch(symbol, start, end, minutes, token)
+        if plan is None:
+            return self.callApi(method, token, symbol, start, end, minutes, dakey)
+        found, runs = plan
+        results = [self.callApi(method, token, symbol, rstart, rend, minutes, dakey)
+                   for rstart, rend in runs]
+        return self.mergeFetched(symbol, start, end, minutes, token, found, runs, results)
+
+    def flightKey(self, token, symbol, start, end, minutes):
+        return (token, symbol.upper(), pd.Timestamp(start) if start is not None else None,
+                pd.Timestamp(end) if end is not None else None, minutes)
+
+    def callApi(self, method, token, symbol, start, end, minutes, key=None):
+        '''
+        Call the data method of token. If the same call is in progress in another thread or
+        task, wait for its result instead. Each caller that shares a result gets a copy.
+        '''
+        return self.flight.do(self.flightKey(token, symbol, start, end, minutes),
+                              functools.partial(method, symbol, start, end, minutes, key=key),
+                              share=lambda result: copyResult(*result))
+
+    def planFetch(self, symbol, start, end, minutes, token):
+        '''
+        Find the days of the request missing from the store. A day stored without a moving
+        average now in the settings is missing, so it is fetched again and replaced.
+        :return: (found, runs) found is {day: DataFrame} from the store and runs is a list of
+            (start, end) to request from the api. None if the store does not apply.
+        '''
+        if not self.store or start is None or end is None:
+            return None
+        days = sessionDays(start, end)
+        if not days or not isClosedDay(days[-1]):
+            return None
+        mas, vwap = getMASettings()
+        found, missing = self.store.getDays(symbol, token, storeInterval(minutes, not excludeAfterHours()),
+                                            days, columns=maColumns(mas.keys(), bool(vwap)))
+        runs = [(run[0], run[-1] + pd.Timedelta(hours=23, minutes=59, seconds=59))
+                for run in dayRuns(missing)]
+        return found, runs
+
+    def mergeFetched(self, symbol, start, end, minutes, token, found, runs, results):
+        '''
+        Store the api results for runs and merge them with the stored days in found. VWAP is
+        computed again for each day so a run of several days is stored as single days would be.
+        :return: (meta, df, maDict)
+        '''
+        start = pd.Timestamp(start)
+        end = pd.Timestamp(end)
+        windows = list(getMASettings()[0].keys())
+        interval = storeInterval(minutes, not excludeAfterHours())
+        meta = {'code': 200, 'message': f'Retrieved {symbol} from the local bar store ({token})'}
+        for (rstart, rend), (meta, df, ma) in zip(runs, results):
+            if df.empty:
+                if rstart <= start.normalize() and rend >= end.normalize():
+                    return meta, df, ma
+                continue
+            frame = dailyVwap(joinMas(df, ma))
+            self.store.putFrame(symbol, token, interval, frame)
+            for day, daydf in frame.groupby(frame.index.normalize()):
+                found[day] = daydf
+        if not found:
+            return meta, pd.DataFrame(), None
+        result = self.mergeStored(found, windows, start, end)
+        if result is None:
+            return meta, pd.DataFrame(), None
+        return (meta,) + result
+
+    def aapiChooser(self, api=None):
+        '''
+        Get a coroutine function for the data method of api. Tiingo is natively async. The
+        others run in the default executor.
+        '''
+        api = api if api else self.api
+        if api in ASYNC_PROVIDERS:
+            return loadProvider(api, ASYNC_PROVIDERS)
+        method = self.apiChooser(api)
+        return asyncProvider(method) if method else None
+
+    async def afetchIntraday(self, symbol, start, end, minutes, token=None):
+        '''
+        The coroutine version of fetchIntraday. The runs of missing days are requested together.
+        The key lookup and the store run in the default executor.
+        '''
+        token = token if token else self.api
+        method = self.aapiChooser(token)
+        loop = asyncio.get_running_loop()
+        dakey = await loop.run_in_executor(None, self.getKey, token)
+        plan = await loop.run_in_executor(None, self.planFetch, symbol, start, end, minutes, token)
+        if plan is None:
+            return await self.acallApi(method, token, symbol, start, end, minutes, dakey)
+        found, runs = plan
+        results = await asyncio.gather(*[self.acallApi(method, token, symbol, rstart, rend, minutes, dakey)
+                                         for rstart, rend in runs])
+        return await loop.run_in_executor(None, self.mergeFetched, symbol, start, end, minutes, token,
+                                          found, runs, results)
+
+    async def acallApi(self, method, token, symbol, start, end, minutes, key=None):
+        '''The coroutine version of callApi. Shares calls with the threads as well'''
+        return await self.flight.ado(self.flightKey(token, symbol, start, end, minutes),
+                                     functools.partial(method, symbol, start, end, minutes, key=key),
+                                     share=lambda result: copyResult(*result))
+
+    async def aget_intraday(self, symbol, start=None, end=None, minutes=5):
+        '''
+        The coroutine version of get_intraday. The apis are tried one at a time in the order
+        of apiChooserList. Each api waits on its rate limit without blocking the loop. The
+        settings, the bar store and the IB connection check run in the default executor.
+        :return: (meta, df, maDict)
+        '''
+        loop = asyncio.get_running_loop()
+        key = None
+        if self.cache is not None:
+            key = await loop.run_in_executor(None, self.cacheKey, symbol, start, end, minutes)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached[1]
+        if self.store and start is not None and end is not None:
+            result = await loop.run_in_executor(None, self.getStoredIntraday, symbol, start, end, minutes)
+            if result:
+                return result
+
+        api, vr, suggested = await loop.run_in_executor(None, self.apiChooserList, start, end)
+        for token in suggested:
+            try:
+                meta, df, ma = await self.afetchIntraday(symbol, start, end, minutes, token)
+            except requests.exceptions.Timeout as ex:
+                logging.warning(f'Request to {token} timed out: {ex}')
+                continue
+            except requests.exceptions.ConnectionError as ex:
+                message = "Please check your internet connection\n" + str(ex)
+                logging.error(message)
+                return {'code': 666, 'message': message}, pd.DataFrame(), None
+            if validIntraday(df):
+                if key is not None:
+                    self.cache.put(key, token, meta, df, ma, end)
+                return meta, df, ma
+        msg = f'Failed to retrieve data from APIS: {self.preferences}'
+        return {'code': 666, 'message': msg}, pd.DataFrame(), None
+
+    async def aget_intraday_many(self, jobs, concurrency=10):
+        '''
+        Get many symbol/time windows concurrently.
+        :params jobs: A list of (symbol, start, end, minutes)
+        :params concurrency: The most requests in progress at once. The rate limits still apply
+        :return: A list of (meta, df, maDict) in the order of jobs
+        '''
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(job):
+            async with semaphore:
+                return await self.aget_intraday(*job)
+        return await asyncio.gather(*[one(job) for job in jobs])
@@ -0,0 +1,271 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''
+Load the bar store ahead of time for a list of symbols and a date range. Each symbol is given
+to one api. The days are split into chunks sized for that api and requested one chunk at a
+time, waiting on the api's rate limit. The apis work in parallel. The days finished are
+written to a progress file so an interrupted run picks up where it left off.
+
+    python -m structjour.stock.backfill SQ AAPL --start 2020-11-02 --end 2020-11-30 --minutes 1
+
+@author: Mike Petersen
+
+@creation_date: 10/18/26
+'''
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+from structjour.config import getSettings
+from structjour.stock.apichooser import APIChooser
+from structjour.stock.barstore import (BarStore, getBarStoreDir, getBarStoreFormat, isClosedDay, sessionDays,
+                                      storeInterval)
+from structjour.stock.nysecalendar import getCalendar
+from structjour.stock.ratelimit import getLimiter
+from structjour.stock.utilities import excludeAfterHours
+
+
+def chunkDays(token, minutes):
+    '''
+    Return the number of trading days to request from the api at once. Each api also gets data
+    before the start of a request for the moving averages.
+    '''
+    if token == 'bc':
+        # getbc_intraday requests everything from the lookback to today
+        return 30
+    if token == 'av':
+        # The full output is the latest week or two, whatever the start
+        return 7
+    if token == 'fh':
+        # Keep the from/to window to a few thousand candles
+        return min(20, 5 * minutes)
+    if token == 'ib':
+        from structjour.stock import myib as ib
+        days = 5 if minutes < 5 else 20
+        # getib_intraday asks for a day more than the window
+        if not ib.validateDurString(f'{days + 1} D'):
+            raise ValueError(f'Bad IB duration for {days} days')
+        return days
+    return 5
+
+
+def makeChunks(days, size):
+    '''
+    Split a sorted list of sessions into lists of at most size consecutive sessions.
+    '''
+    cal = getCalendar()
+    chunks = []
+    for day in days:
+        if (chunks and len(chunks[-1]) < size
+                and cal.sessionIndex(day) - cal.sessionIndex(chunks[-1][-1]) == 1):
+            chunks[-1].append(day)
+        else:
+            chunks.append([day])
+    return chunks
+
+
+def requestInterval(token, limiter):
+    '''Return the seconds between requests the tightest rate limit of token allows'''
+    return max([b.period / b.capacity for b in limiter.buckets.get(token, [])], default=1)
+
+
+def assignApis(symbols, tokens, limiter):
+    '''
+    Give each symbol to one of tokens, spreading the symbols so the apis finish at about the
+    same time given their rate limits. Ties go to the earlier token.
+    :return: dict {token: [symbols]}
+    '''
+    load = {token: limiter.wait(token) for token in tokens}
+    assigned = defaultdict(list)
+    for symbol in symbols:
+        token = min(tokens, key=lambda t: (load[t] + requestInterval(t, limiter), tokens.index(t)))
+        load[token] += requestInterval(token, limiter)
+        assigned[token].append(symbol)
+    return assigned
+
+
+class Progress:
+    '''
+    The days finished for each symbol, api and interval, saved in a json file. A day is
+    finished when it is stored or the api had no data for it.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = defaultdict(set)
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    for key, days in json.load(f).get('done', {}).items():
+                        self.done[key] = set(days)
+            except (OSError, ValueError) as ex:
+                logging.warning(f'Failed to read backfill progress {path}: {ex}')
+
+    def key(self, symbol, token, minutes):
+        return f'{symbol.upper()} {token} {minutes}'
+
+    def isDone(self, symbol, token, minutes, day):
+        return day.strftime('%Y%m%d') in self.done[self.key(symbol, token, minutes)]
+
+    def finish(self, symbol, token, minutes, days):
+        with self.lock:
+            self.done[self.key(symbol, token, minutes)].update(d.strftime('%Y%m%d') for d in days)
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        d = {'done': {key: sorted(days) for key, days in self.done.items()}}
+        tmp = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(tmp, 'w') as f:
+            json.dump(d, f)
+        os.replace(tmp, self.path)
+
+
+class Backfill:
+    '''
+    Fill the bar store for symbols from start to end.
+    '''
+    def __init__(self, symbols, start, end, minutes=1, apis=None, progress=None, chooser=None,
+                 limiter=None):
+        '''
+        :params symbols: A list of tickers
+        :params start: The first day
+        :params end: The last day. Days that have not ended are skipped
+        :params minutes: The candle interval
+        :params apis: A list of api tokens to use. Defaults to the APIPref setting
+        :params progress: The path of the progress file. None does not save progress
+        :params chooser: APIChooser with a BarStore. Created from settings by default
+        '''
+        self.symbols = [s.upper() for s in symbols]
+        self.minutes = minutes
+        # The store and the progress keep the bars with after hours data apart
+        self.interval = storeInterval(minutes, not excludeAfterHours())
+        self.days = [d for d in sessionDays(start, end) if isClosedDay(d)]
+        if chooser is None:
+            apiset = getSettings('zero_substance/stockapi', 'structjour')
+            store = BarStore(getBarStoreDir(apiset), getBarStoreFormat(apiset))
+            chooser = APIChooser(apiset, orprefs=apis, store=store)
+        self.chooser = chooser
+        self.limiter = limiter if limiter is not None else getLimiter()
+        self.progress = Progress(progress)
+        self.failed = []
+
+    def tokens(self):
+        '''The apis that can serve the whole range, as apiChooserList decides'''
+        if not self.days:
+            return []
+        start = self.days[0]
+        end = self.days[-1] + pd.Timedelta(hours=16)
+        api, rules, suggested = self.chooser.apiChooserList(start, end)
+        for rule in rules:
+            logging.info(rule)
+        return [t for t in suggested if t is not None]
+
+    def run(self):
+        '''
+        Run the backfill. Blocks until it is done.
+        :return: A list of (symbol, token, first day, last day) for the chunks that failed
+        '''
+        tokens = self.tokens()
+        if not tokens:
+            logging.error('No api can serve the requested days')
+            return self.failed
+        assigned = assignApis(self.symbols, tokens, self.limiter)
+        with ThreadPoolExecutor(max_workers=len(assigned)) as pool:
+            futures = [pool.submit(self.runApi, token, symbols) for token, symbols in assigned.items()]
+            for future in futures:
+                future.result()
+        return self.failed
+
+    def runApi(self, token, symbols):
+        '''Fetch the chunks for symbols from token, one at a time'''
+        size = chunkDays(token, self.minutes)
+        for symbol in symbols:
+            days = [d for d in self.days if not self.progress.isDone(symbol, token, self.interval, d)]
+            for chunk in makeChunks(days, size):
+                self.runChunk(token, symbol, chunk)
+
+    def runChunk(self, token, symbol, chunk):
+        store = self.chooser.store
+        if all(store.hasDay(symbol, token, self.interval, d) for d in chunk):
+            self.progress.finish(symbol, token, self.interval, chunk)
+            return
+        # Let the provider take the token without hitting its own short wait limit
+        wait = self.limiter.wait(token)
+        while wait > 0:
+            time.sleep(wait)
+            wait = self.limiter.wait(token)
+        start = chunk[0]
+        end = chunk[-1] + pd.Timedelta(hours=23, minutes=59, seconds=59)
+        try:
+            meta, df, ma = self.chooser.fetchIntraday(symbol, start, end, self.minutes, token)
+        except Exception as ex:
+            # A malformed response raises whatever the provider trips on. Retry it on resume
+            logging.warning(f'Backfill of {symbol} from {token} failed: {ex!r}')
+            self.failed.append((symbol, token, chunk[0], chunk[-1]))
+            return
+        if isinstance(meta, dict) and meta.get('code', 200) not in (200, None):
+            logging.warning(f'Backfill of {symbol} from {token} failed: {meta.get("message")}')
+            self.failed.append((symbol, token, chunk[0], chunk[-1]))
+            return
+        logging.info(f'Backfilled {symbol} {chunk[0].date()} to {chunk[-1].date()} from {token}')
+        self.progress.finish(symbol, token, self.interval, chunk)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load the bar store for a list of symbols.')
+    parser.add_argument('symbols', nargs='*', help='The tickers to load')
+    parser.add_argument('--file', help='A file with one ticker per line')
+    parser.add_argument('--start', required=True, help='The first day, e.g. 2020-11-02')
+    parser.add_argument('--end', default=None, help='The last day. Defaults to today')
+    parser.add_argument('--minutes', type=int, default=1, help='The candle interval')
+    parser.add_argument('--apis', default=None, help='Comma separated api tokens, e.g. fh,tgo')
+    parser.add_argument('--progress', default=None,
+                        help='The progress file. Defaults to backfill.json in the bar store')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    symbols = list(args.symbols)
+    if args.file:
+        with open(args.file) as f:
+            symbols.extend(line.strip() for line in f if line.strip())
+    if not symbols:
+        parser.error('No symbols were given')
+    apis = args.apis.replace(' ', '').split(',') if args.apis else None
+    progress = args.progress
+    if progress is None:
+        apiset = getSettings('zero_substance/stockapi', 'structjour')
+        progress = os.path.join(getBarStoreDir(apiset), 'backfill.json')
+    end = args.end if args.end else pd.Timestamp.now()
+    bf = Backfill(symbols, args.start, end, args.minutes, apis, progress)
+    failed = bf.run()
+    for symbol, token, first, last in failed:
+        print(f'Failed: {symbol} {token} {first.date()} to {last.date()}')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,112 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''
+A compact container of candles as parallel NumPy arrays. The time is int64 nanoseconds of naive
+New York time and the prices and volume are float64. Bars can be saved to a .npy file and
+loaded back as a memory map, so the chart code and resampleBars can read the candles without
+pandas and without copying them.
+
+@author: Mike Petersen
+
+@creation_date: 10/18/26
+'''
+import numpy as np
+import pandas as pd
+
+FIELDS = ('time', 'open', 'high', 'low', 'close', 'volume')
+BAR_DTYPE = np.dtype([('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'),
+                      ('close', '<f8'), ('volume', '<f8')])
+
+NS_PER_DAY = 24 * 3600 * 10**9
+
+
+def epochDatenum():
+    '''
+    Return the matplotlib date number of the unix epoch. It depends on the matplotlib version.
+    matplotlib is imported here so the providers can use Bars without it
+    '''
+    import matplotlib.dates as mdates
+    return mdates.date2num(pd.Timestamp('1970-01-01').to_pydatetime())
+
+
+class Bars:
+    '''
+    Candles as parallel arrays. The arrays may be views of a DataFrame, of a memory map or of
+    another Bars. Treat them as read only.
+    '''
+    __slots__ = FIELDS
+
+    def __init__(self, time, open, high, low, close, volume):
+        self.time = time
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    @classmethod
+    def fromFrame(cls, df):
+        '''
+        Get the arrays of a DataFrame of candles indexed by naive time. Columns that are
+        already float64 are not copied.
+        '''
+        index = pd.DatetimeIndex(df.index)
+        return cls(index.asi8,
+                   *[df[col].to_numpy(dtype=np.float64, copy=False) for col in FIELDS[1:]])
+
+    @classmethod
+    def fromRecords(cls, records):
+        '''Get views of the fields of a BAR_DTYPE array'''
+        return cls(*[records[field] for field in FIELDS])
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        '''
+        Load Bars saved with save.
+        :params mmap: Memory map the file instead of reading it
+        '''
+        return cls.fromRecords(np.load(path, mmap_mode='r' if mmap else None))
+
+    def save(self, path):
+        '''Save as a .npy file of BAR_DTYPE records'''
+        records = np.lib.format.open_memmap(path, mode='w+', dtype=BAR_DTYPE, shape=(len(self),))
+        for field in FIELDS:
+            records[field] = getattr(self, field)
+        records.flush()
+        del records
+
+    def toFrame(self):
+        df = pd.DataFrame({col: getattr(self, col) for col in FIELDS[1:]},
+                          index=pd.DatetimeIndex(self.time))
+        return df
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, key):
+        '''Index with a slice or an index array. A slice returns views'''
+        return Bars(*[getattr(self, field)[key] for field in FIELDS])
+
+    def between(self, start=None, end=None):
+        '''Return a view of the bars from start to end inclusive'''
+        lo = 0 if start is None else np.searchsorted(self.time, pd.Timestamp(start).value, 'left')
+        hi = len(self) if end is None else np.searchsorted(self.time, pd.Timestamp(end).value, 'right')
+        return self[lo:hi]
+
+    def dates(self):
+        '''Return the times as matplotlib date numbers'''
+        return self.time / NS_PER_DAY + epochDatenum()
@@ -0,0 +1,350 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''
+A local, disk backed store of intraday bars. Every file holds one trading day of candles for
+one symbol, retrieved from one api at one resolution. APIChooser consults the store before
+going to the network and only asks the apis for the days it does not have.
+Only days whose session has ended are stored. Today's data is still changing.
+With pyarrow installed the days are written as uncompressed Feather (Arrow IPC) files, which
+are read with a memory map and no parsing, or as Parquet. Without it they are pickled. Files
+in any of the formats are read, so changing the format does not lose the stored days.
+
+@author: Mike Petersen
+
+@creation_date: 10/18/26
+'''
+import logging
+import os
+import threading
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+from structjour.stock.nysecalendar import getCalendar
+
+# file extension for each format
+FORMATS = {'feather': '.feather', 'parquet': '.parquet', 'pkl': '.pkl'}
+DEFAULT_FORMAT = 'feather' if pa is not None else 'pkl'
+
+# The name of the time column in the columnar files
+TIME = 'time'
+
+# The latest after hours data ends at 20:00 New York time
+SESSION_END = 20
+
+# VWAP begins at the regular open
+VWAP_BEGIN = pd.Timedelta(hours=9, minutes=30)
+
+
+def getBarStoreDir(apiset=None):
+    '''
+    Get the root directory of the bar store. Set it with the QSettings key 'barStoreDir'
+    :params apiset: QSettings('zero_substance/stockapi', 'structjour') or None
+    '''
+    d = apiset.value('barStoreDir', None) if apiset is not None else None
+    if not d:
+        d = os.path.join(os.path.expanduser('~'), '.structjour', 'bars')
+    return d
+
+
+def getBarStoreFormat(apiset=None):
+    '''
+    Get the file format of the bar store, one of FORMATS. Set it with the QSettings key
+    'barStoreFormat'. Feather and Parquet require pyarrow.
+    '''
+    fmt = apiset.value('barStoreFormat', None) if apiset is not None else None
+    if fmt not in FORMATS or (fmt != 'pkl' and pa is None):
+        fmt = DEFAULT_FORMAT
+    return fmt
+
+
+def nyNow():
+    '''Return a naive Timestamp showing the time in New York right now'''
+    return pd.Timestamp.now('US/Eastern').tz_localize(None)
+
+
+def isClosedDay(day, now=None):
+    '''
+    Return True if the trading day has ended, including after hours, and its data will no
+    longer change.
+    :params day: A datetime object or time string within the day
+    :params now: A naive Timestamp in New York time. Defaults to right now.
+    '''
+    now = nyNow() if now is None else pd.Timestamp(now)
+    day = pd.Timestamp(day).normalize()
+    return now >= day + pd.Timedelta(hours=SESSION_END)
+
+
+def sessionDays(start, end):
+    '''
+    Return the list of NYSE sessions (normalized Timestamps) touched by the time range start to
+    end.
+    '''
+    return getCalendar().sessions(start, end)
+
+
+def dayRuns(days):
+    '''
+    Group a sorted list of sessions into runs of consecutive sessions.
+    :return: A list of lists of days
+    '''
+    cal = getCalendar()
+    runs = []
+    for day in days:
+        if runs and cal.sessionIndex(day) - cal.sessionIndex(runs[-1][-1]) == 1:
+            runs[-1].append(day)
+        else:
+            runs.append([day])
+    return runs
+
+
+def storeInterval(minutes, afterHours=True):
+    '''
+    Return the resolution key of the store for candles of minutes. Bars requested without the
+    after hours data are kept apart from those with it, which is the default.
+    '''
+    return minutes if afterHours else f'{minutes}rth'
+
+
+def maColumn(key):
+    '''Return the column name used to store the moving average with maDict key {key}'''
+    return 'vwap' if key == 'vwap' else f'ma{key}'
+
+
+def maColumns(windows, vwap=False):
+    '''Return the columns a stored day needs for the moving average windows and VWAP'''
+    return [maColumn(w) for w in windows] + (['vwap'] if vwap else [])
+
+
+def joinMas(df, maDict):
+    '''Return a copy of df with the series in maDict added as columns'''
+    frame = df.copy()
+    if maDict:
+        for key, series in maDict.items():
+            frame[maColumn(key)] = series
+    return frame
+
+
+def dailyVwap(frame):
+    '''
+    Return frame with its vwap column computed again for each day from that day's open. An api
+    call covering several days begins VWAP at the open of one day and carries it across the
+    others, so the days of the frame can not be stored with it as they are.
+    '''
+    if frame.empty or 'vwap' not in frame.columns:
+        return frame
+    frame = frame.copy()
+    days = frame.index.normalize()
+    inSession = frame.index >= days + VWAP_BEGIN
+    volume = frame['volume'].where(inSession, 0)
+    price = (frame['high'] + frame['low'] + frame['close']) / 3
+    cumVol = volume.groupby(days).cumsum()
+    cumVolPrice = (volume * price).groupby(days).cumsum()
+    frame['vwap'] = (cumVolPrice / cumVol).where(inSession)
+    return frame
+
+
+def splitMas(frame, windows):
+    '''
+    Separate the stored bars from the stored moving averages.
+    :params frame: A DataFrame from the store
+    :params windows: The moving average windows required. VWAP is included if it was stored.
+    :return: (df, maDict) or (df, None) if one of windows was not stored.
+    '''
+    df = frame[['open', 'high', 'low', 'close', 'volume']]
+    maDict = dict()
+    for window in windows:
+        col = maColumn(window)
+        if col not in frame.columns:
+            return df, None
+        maDict[window] = frame[col]
+    if 'vwap' in frame.columns:
+        vwap = frame['vwap']
+        # VWAP begins at the open. Like myib, exclude it if the chart begins before it does
+        first = vwap.first_valid_index()
+        if first is not None and first <= df.index[0]:
+            maDict['vwap'] = vwap
+    return df, maDict
+
+
+def writeBars(path, fmt, df):
+    '''Write df to path in fmt. The columnar formats keep the index in the column TIME'''
+    if fmt == 'pkl':
+        df.to_pickle(path)
+        return
+    table = pa.Table.from_pandas(df.rename_axis(TIME).reset_index(), preserve_index=False)
+    if fmt == 'feather':
+        # Uncompressed so it can be memory mapped and read without decoding
+        feather.write_feather(table, path, compression='uncompressed')
+    else:
+        pq.write_table(table, path)
+
+
+def readBars(path, fmt, start=None, end=None):
+    '''
+    Read a file written by writeBars. Feather is memory mapped. For Parquet the time range is
+    pushed down to the reader.
+    :return: A DataFrame indexed by time
+    '''
+    if fmt == 'pkl':
+        df = pd.read_pickle(path)
+        if start is not None:
+            df = df.loc[df.index >= pd.Timestamp(start)]
+        if end is not None:
+            df = df.loc[df.index <= pd.Timestamp(end)]
+        return df
+    filters = []
+    if start is not None:
+        filters.append((TIME, '>=', pd.Timestamp(start)))
+    if end is not None:
+        filters.append((TIME, '<=', pd.Timestamp(end)))
+    if fmt == 'feather':
+        table = feather.read_table(path, memory_map=True)
+        if filters:
+            mask = None
+            for col, op, value in filters:
+                m = (pc.greater_equal if op == '>=' else pc.less_equal)(table[col], pa.scalar(value, table[col].type))
+                mask = m if mask is None else pc.and_(mask, m)
+            table = table.filter(mask)
+    else:
+        table = pq.read_table(path, filters=filters if filters else None, memory_map=True)
+    df = table.to_pandas()
+    df.set_index(TIME, inplace=True)
+    df.index.name = None
+    return df
+
+
+class BarStore:
+    '''
+    Keep intraday bars on disk keyed by symbol, api, resolution and trading day. The frames
+    are stored as they were returned from the api. Any moving average columns stored with the
+    bars are computed by the api call with its full lookback and are kept alongside.
+    '''
+    def __init__(self, root=None, fmt=None):
+        '''
+        :params root: The directory to keep the files in. Defaults to getBarStoreDir()
+        :params fmt: The format to write, one of FORMATS. Defaults to getBarStoreFormat()
+        '''
+        self.root = root if root else getBarStoreDir()
+        self.fmt = fmt if fmt else getBarStoreFormat()
+        if self.fmt not in FORMATS:
+            raise ValueError(f'Not a bar store format: {self.fmt}')
+        if self.fmt != 'pkl' and pa is None:
+            raise ValueError(f'The {self.fmt} format requires pyarrow')
+
+    def dayPath(self, symbol, api, resolution, day, fmt=None):
+        '''Return the file path for one day of bars'''
+        day = pd.Timestamp(day)
+        return os.path.join(self.root, symbol.upper(), api, str(resolution),
+                            day.strftime('%Y%m%d') + FORMATS[fmt if fmt else self.fmt])
+
+    def findDay(self, symbol, api, resolution, day):
+        '''
+        Return (path, fmt) of the stored day, trying this store's format first, or (None, None)
+        '''
+        fmts = [self.fmt] + [f for f in FORMATS if f != self.fmt]
+        for fmt in fmts:
+            if fmt != 'pkl' and pa is None:
+                continue
+            path = self.dayPath(symbol, api, resolution, day, fmt)
+            if os.path.exists(path):
+                return path, fmt
+        return None, None
+
+    def hasDay(self, symbol, api, resolution, day):
+        return self.findDay(symbol, api, resolution, day)[0] is not None
+
+    def getDay(self, symbol, api, resolution, day, start=None, end=None):
+        '''
+        Return a DataFrame for one day of bars or None if it is not in the store
+        :params start: Read only the bars at or after start
+        :params end: Read only the bars at or before end
+        '''
+        path, fmt = self.findDay(symbol, api, resolution, day)
+        if path is None:
+            return None
+        try:
+            return readBars(path, fmt, start, end)
+        except Exception as ex:
+            logging.warning(f'Removing unreadable bar store file {path}: {ex}')
+            os.remove(path)
+            return None
+
+    def putDay(self, symbol, api, resolution, day, df):
+        '''
+        Write one day of bars. The file is replaced atomically so a concurrent reader never sees
+        a partial file. Each thread writes its own temporary file.
+        '''
+        path = self.dayPath(symbol, api, resolution, day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        writeBars(tmp, self.fmt, df)
+        os.replace(tmp, path)
+        # A day is kept in one format
+        for fmt in FORMATS:
+            other = self.dayPath(symbol, api, resolution, day, fmt)
+            if fmt != self.fmt and os.path.exists(other):
+                os.remove(other)
+
+    def getDays(self, symbol, api, resolution, days, start=None, end=None, columns=None):
+        '''
+        Retrieve the stored days
+        :params start: Read only the bars at or after start
+        :params end: Read only the bars at or before end
+        :params columns: The moving average columns required, see maColumns. A day stored
+            without one of them is missing
+        :return: (found, missing) found is a dict {day: DataFrame}. missing is a list of days
+        '''
+        found = {}
+        missing = []
+        for day in days:
+            df = self.getDay(symbol, api, resolution, day, start, end)
+            if df is None or (columns and not set(columns).issubset(df.columns)):
+                missing.append(day)
+            else:
+                found[day] = df
+        return found, missing
+
+    def putFrame(self, symbol, api, resolution, df, now=None):
+        '''
+        Split df into trading days and store each day that has ended. A vwap column must begin
+        at the open of each day, see dailyVwap.
+        :return: The list of days written
+        '''
+        written = []
+        if df is None or df.empty:
+            return written
+        for day, daydf in df.groupby(df.index.normalize()):
+            if not isClosedDay(day, now):
+                continue
+            self.putDay(symbol, api, resolution, day, daydf)
+            written.append(day)
+        return written
+
+    def removeDays(self, symbol, api, resolution, days):
+        for day in days:
+            for fmt in FORMATS:
+                path = self.dayPath(symbol, api, resolution, day, fmt)
+                if os.path.exists(path):
+                    os.remove(path)
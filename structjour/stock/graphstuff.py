@@ -21,22 +21,37 @@ single day minute charts (1,5, 10 min etc)
 
 @creation_date: 1/13/19
 '''
+from collections import OrderedDict
+import contextlib
 import datetime as dt
+import logging
 import os
 import re
+import sys
 
 import matplotlib
-matplotlib.use('Qt5Agg')
+# Draw with Qt when there is a screen. Workers and the command line draw with Agg.
+# MPLBACKEND overrides both
+if 'MPLBACKEND' not in os.environ:
+    if sys.platform in ('win32', 'darwin') or os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'):
+        matplotlib.use('Qt5Agg')
+    else:
+        matplotlib.use('Agg')
 import matplotlib.dates as mdates
 import matplotlib.font_manager as fm
 import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 from matplotlib import markers, style
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.colors import to_rgba_array
+from matplotlib.figure import Figure
 from matplotlib.ticker import FuncFormatter
-from mpl_finance import candlestick_ohlc
 from pandas.plotting import register_matplotlib_converters
-from PyQt5.QtCore import QSettings
 
+from structjour.config import getSettings
+from structjour.stock.bars import Bars
 from structjour.stock.utilities import getMASettings
 
 FILL = 2
@@ -86,6 +101,62 @@ def dummyName(fp, symb, tradenum, begin, end, outdir='out'):
     return name
 
 
+def barVerts(x, bottom, top, width):
+    '''
+    Return the corners of bars centered on x as an (n, 4, 2) array for a PolyCollection
+    :params x: Array of the centers
+    :params bottom: Array or scalar
+    :params top: Array or scalar
+    '''
+    left = x - width / 2
+    right = x + width / 2
+    verts = np.empty((len(x), 4, 2))
+    verts[:, 0, 0] = verts[:, 1, 0] = left
+    verts[:, 2, 0] = verts[:, 3, 0] = right
+    verts[:, 0, 1] = verts[:, 3, 1] = bottom
+    verts[:, 1, 1] = verts[:, 2, 1] = top
+    return verts
+
+
+def barColors(bars, colorup, colordown, colorflat=None):
+    '''
+    Return an (n, 4) rgba array with colorup for the candles that close up, colordown for those
+    that close down and colorflat for the others. colorflat defaults to colorup.
+    '''
+    rgba = to_rgba_array([colorup, colordown, colorup if colorflat is None else colorflat])
+    which = np.where(bars.close > bars.open, 0, np.where(bars.close < bars.open, 1, 2))
+    return rgba[which]
+
+
+def drawCandles(ax, bars, dates, width, colorup='g', colordown='r', alpha=1.0):
+    '''
+    Draw the candles as one collection of wicks and one of bodies. The candles look like
+    those of mpl_finance.candlestick_ohlc, which draws a line and a rectangle per candle.
+    :params dates: The matplotlib date numbers of bars
+    :params width: The width of a body in days
+    '''
+    colors = barColors(bars, colorup, colordown)
+    wicks = np.empty((len(bars), 2, 2))
+    wicks[:, :, 0] = dates[:, None]
+    wicks[:, 0, 1] = bars.low
+    wicks[:, 1, 1] = bars.high
+    ax.add_collection(LineCollection(wicks, colors=colors, linewidths=0.5, zorder=1))
+    bodies = PolyCollection(barVerts(dates, np.minimum(bars.open, bars.close),
+                                     np.maximum(bars.open, bars.close), width),
+                            facecolors=colors, edgecolors=colors, alpha=alpha, zorder=1)
+    ax.add_collection(bodies)
+    ax.autoscale_view()
+
+
+def drawVolume(ax, bars, dates, width, colorup='g', colordown='r', colorflat='k'):
+    '''Draw the volume bars as one collection, anchored at 0 like Axes.bar'''
+    volume = PolyCollection(barVerts(dates, 0, bars.volume, width), edgecolors='none',
+                            facecolors=barColors(bars, colorup, colordown, colorflat))
+    volume.sticky_edges.y.append(0)
+    ax.add_collection(volume)
+    ax.autoscale_view()
+
+
 class FinPlot:
     '''
     Plot stock charts using single day minute interval charts
@@ -93,8 +164,8 @@ class FinPlot:
 
     def __init__(self, mplstyle='dark_background'):
 
-        self.apiset = QSettings('zero_substance/stockapi', 'structjour')
-        self.chartSet = QSettings('zero_substance/chart', 'structjour')
+        self.apiset = getSettings('zero_substance/stockapi', 'structjour')
+        self.chartSet = getSettings('zero_substance/chart', 'structjour')
         self.style = self.chartSet.value('chart')
         self.style = None if self.style == 'No style' else self.style
         self.gridlines = self.getGridLines()
@@ -125,6 +196,10 @@ class FinPlot:
         self.entries = []
         self.exits = []
 
+        # The Figure reused for each chart and the style it was made with
+        self.figure = None
+        self.figureStyle = None
+
     def getGridLines(self):
         y = self.chartSet.value('gridh', False, bool)
         x = self.chartSet.value('gridv', False, bool)
@@ -256,57 +331,154 @@ class FinPlot:
                     it overrides.
         '''
 
-        register_matplotlib_converters()
         start = pd.Timestamp(start)
         end = pd.Timestamp(end)
-        if self.style:
-            style.use(self.style)
 
-        # ############### Prepare data ##############
         # Get the data and prepare the DtaFrames from some stock api
         meta, df, maDict = chooser.get_intraday(symbol, start=start, end=end, minutes=minutes)
         if df.empty:
-            if not isinstance(meta, int):
-                self.apiset.setValue('errorCode', str(meta['code']))
-                self.apiset.setValue('errorMessage', meta['message'])
+            self.setError(meta)
             return None
-        df['date'] = df.index
+        return self.plotChart(symbol, chooser.api, df, maDict, start, end, minutes, dtFormat, save)
+
+    def setError(self, meta):
+        '''Save the error from a failed data request in settings for the caller to display'''
+        if not isinstance(meta, int):
+            self.apiset.setValue('errorCode', str(meta['code']))
+            self.apiset.setValue('errorMessage', meta['message'])
+
+    def graph_candlesticks(self, jobs, chooser, dtFormat="%H:%M"):
+        '''
+        Create a batch of charts. Jobs for the same symbol, day and candle interval share a
+        single data request that covers all of them. A job that fails does not stop the others.
+        :params jobs: A list of dict with the keys symbol, start, end, minutes, save and,
+            optionally, entries and exits (see fp.entries). start and end are required.
+        :params chooser: APIChooser object
+        :params dtFormat: a strftime formt to display the dates on the x axis of the chart
+        :return: A list in the order of jobs of the saved file names. A chart without data is
+            None. A chart that raised an exception, requesting the data or drawing, is the
+            exception.
+        '''
+        groups = OrderedDict()
+        for i, job in enumerate(jobs):
+            start = pd.Timestamp(job['start'])
+            end = pd.Timestamp(job['end'])
+            minutes = job.get('minutes', 1)
+            key = (job['symbol'], start.date(), minutes)
+            groups.setdefault(key, []).append((i, start, end))
+
+        results = [None] * len(jobs)
+        for (symbol, day, minutes), group in groups.items():
+            gstart = min(x[1] for x in group)
+            gend = max(x[2] for x in group)
+            try:
+                meta, df, maDict = chooser.get_intraday(symbol, start=gstart, end=gend, minutes=minutes)
+            except Exception as ex:
+                logging.error(f'Failed to get the data for {symbol} {day}: {ex}')
+                for i, start, end in group:
+                    results[i] = ex
+                continue
+            if df.empty:
+                self.setError(meta)
+                continue
+            for i, start, end in group:
+                job = jobs[i]
+                mask = (df.index >= start) & (df.index <= end)
+                jdf = df.loc[mask].copy()
+                if jdf.empty:
+                    continue
+                jmas = dict()
+                for k, v in (maDict or {}).items():
+                    v = v.loc[(v.index >= start) & (v.index <= end)]
+                    if len(v) == len(jdf):
+                        jmas[k] = v
+                self.entries = job.get('entries', [])
+                self.exits = job.get('exits', [])
+                try:
+                    results[i] = self.plotChart(symbol, chooser.api, jdf, jmas, start, end, minutes,
+                                                dtFormat, job.get('save', 'trade'))
+                except Exception as ex:
+                    logging.error(f'Failed to draw the chart of {symbol} from {start} to {end}: {ex}')
+                    results[i] = ex
+        return results
+
+    def getFigure(self, interactive=False):
+        '''
+        Return an empty Figure for the next chart. Saved charts are drawn on a Figure with an
+        Agg canvas that this FinPlot owns and clears for each chart, so a batch does not build
+        a figure per chart and pyplot never holds them. An interactive chart gets a pyplot
+        figure to show.
+        '''
+        if interactive:
+            return plt.figure()
+        if self.figure is None or self.figureStyle != self.style:
+            self.figure = Figure()
+            FigureCanvasAgg(self.figure)
+            self.figureStyle = self.style
+        else:
+            self.figure.clear()
+        return self.figure
+
+    def plotChart(self, symbol, api, df, maDict, start, end, minutes=1, dtFormat="%H:%M", save='trade'):
+        '''
+        Draw and save the chart from data already retrieved. See graph_candlestick.
+        :params api: The api token that provided the data, shown on the chart
+        :params df: DataFrame of candles from APIChooser.get_intraday
+        :params maDict: The moving averages from APIChooser.get_intraday
+        :return: The name of the saved file or None
+        '''
+        register_matplotlib_converters()
+
+        # ############### Prepare data ##############
         if len(df.index) > self.max_candles:
             print(f"Your graph would have {len(df.index)} candles. Please limit the dates or increse the candle size")
             return None
 
-        df['date'] = df['date'].map(mdates.date2num)
+        interactive = self.chartSet.value('interactive', False, bool)
+        with style.context(self.style) if self.style else contextlib.nullcontext():
+            fig = self.getFigure(interactive)
+            self.drawChart(fig, symbol, api, df, maDict, start, end, minutes, dtFormat)
+            if interactive:
+                plt.show()
+            count = 1
+            saveorig = save
+            while os.path.exists(save):
+                s, ext = os.path.splitext(saveorig)
+                save = '{}({}){}'.format(s, count, ext)
+                count = count + 1
+
+            fig.savefig(save)
+        if interactive:
+            plt.close(fig)
+        return save
 
-        df_ohlc = df[['date', 'open', 'high', 'low', 'close']]
-        df_volume = df[['date', 'volume']]
+    def drawChart(self, fig, symbol, api, df, maDict, start, end, minutes, dtFormat):
+        '''Draw the chart on an empty Figure. See plotChart'''
+        bars = Bars.fromFrame(df)
+        dates = bars.dates()
         # ############### End Prepare data ##############
         # ###### PLOT and Graph #######
         colup = self.chartSet.value('colorup', 'g')
         coldown = self.chartSet.value('colordown', 'r')
-        ax1 = plt.subplot2grid((6, 1), (0, 0), rowspan=5, colspan=1)
+        gs = fig.add_gridspec(6, 1)
+        ax1 = fig.add_subplot(gs[0:5, 0])
         ax1.set_axisbelow(True)
         if self.gridlines[1]:
-            ax1.grid(b=self.gridlines[0], which='major', axis=self.gridlines[1])
+            ax1.grid(self.gridlines[0], which='major', axis=self.gridlines[1])
 
-        ax2 = plt.subplot2grid((6, 1), (5, 0), rowspan=1,
-                               colspan=1, sharex=ax1)
-        fig = plt.gcf()
+        ax2 = fig.add_subplot(gs[5, 0], sharex=ax1)
         fig.subplots_adjust(hspace=0)
 
         # candle width is a percentage of a day
         width = (minutes * 35) / (3600 * 24)
-        candlestick_ohlc(ax1, df_ohlc.values, width, colorup=colup, colordown=coldown, alpha=.99)
-
-        for date, volume, dopen, close in zip(df_volume.date.values, df_volume.volume.values,
-                                              df_ohlc.open.values, df_ohlc.close.values):
-            color = colup if close > dopen else 'k' if close == dopen else coldown
-            ax2.bar(date, volume, width, color=color)
+        drawCandles(ax1, bars, dates, width, colorup=colup, colordown=coldown, alpha=.99)
+        drawVolume(ax2, bars, dates, width, colorup=colup, colordown=coldown)
         # ###### END PLOT and Graph #######
         # ###### ENTRY MARKER STUFF #######
         markersize = self.chartSet.value('markersize', 90)
         edgec = self.chartSet.value('markeredgecolor', '#000000')
         alpha = float(self.chartSet.value('markeralpha', 0.5))
-        tz = df_ohlc.index[0].tzinfo
+        tz = df.index[0].tzinfo
         for entry in self.entries:
 
             e = entry[3]
@@ -319,10 +491,10 @@ class FinPlot:
                 else:
                     e = e.tz_localize(tz)
             # TODO: indexing the candle does not work if there is missing data e.g. a halt
-            candleIndex = int((e - df_ohlc.index[0]).total_seconds() / 60 // minutes)
-            if candleIndex < 0 or candleIndex > (len(df_ohlc) - 1):
+            candleIndex = int((e - df.index[0]).total_seconds() / 60 // minutes)
+            if candleIndex < 0 or candleIndex > (len(bars) - 1):
                 continue
-            x = df_ohlc.index[candleIndex]
+            x = dates[candleIndex]
             y = entry[0]
             if entry[2] == 'B':
                 facec = self.chartSet.value('markercolorup', 'g')
@@ -341,25 +513,25 @@ class FinPlot:
         ax2.yaxis.tick_right()
         # ax1.grid(True, axis='y')
 
-        plt.setp(ax1.get_xticklabels(), visible=False)
+        ax1.xaxis.set_tick_params(labelbottom=False)
         for label in ax2.xaxis.get_ticklabels():
             label.set_rotation(-45)
             label.set_fontsize(8)
         ax2.xaxis.set_major_formatter(mdates.DateFormatter(dtFormat))
         ax2.yaxis.set_major_formatter(FuncFormatter(self.volFormat))
-        plt.locator_params(axis='y', tight=True, nbins=2)
+        ax2.locator_params(axis='y', tight=True, nbins=2)
 
         numcand = ((end - start).total_seconds() / 60) // minutes
         ax2.xaxis.set_major_locator(mdates.MinuteLocator(
             byminute=self.setticks(minutes, numcand)))
 
-        idx = int(len(df_ohlc.date) * .39)
+        idx = int(len(dates) * .39)
 
-        ax1.annotate(f'{symbol} {minutes} minute', (df_ohlc.date[idx], df_ohlc.low.max()),
+        ax1.annotate(f'{symbol} {minutes} minute', (dates[idx], bars.low.max()),
                      xytext=(0.4, 0.85), textcoords='axes fraction', alpha=0.35, size=16)
 
         # annotate the data source.
-        ax2.annotate(f'Data is from {chooser.api}',
+        ax2.annotate(f'Data is from {api}',
             xy=(0.99, 0), xytext=(0, 10),
             xycoords=('axes fraction', 'figure fraction'),
             textcoords='offset points',
@@ -377,41 +549,28 @@ class FinPlot:
             for ma in maSetDict[0]:
                 if ma not in maDict.keys():
                     continue
-                ax1.plot(df_ohlc.date, maDict[ma], lw=1, color=maSetDict[0][ma][1], label=f'{ma}MA')
+                ax1.plot(dates, maDict[ma], lw=1, color=maSetDict[0][ma][1], label=f'{ma}MA')
             if 'vwap' in maDict.keys():
-                ax1.plot(df_ohlc.date, maDict['vwap'], lw=1, color=maSetDict[1][0][1], label='VWAP')
+                ax1.plot(dates, maDict['vwap'], lw=1, color=maSetDict[1][0][1], label='VWAP')
         if self.legend:
             leg = ax1.legend()
             leg.get_frame().set_alpha(0.35)
         # #### Adjust margins and frame
-        top = df_ohlc.high.max()
-        bottom = df_ohlc.low.min()
+        top = bars.high.max()
+        bottom = bars.low.min()
         margin = (top - bottom) * .08
         ax1.set_ylim(bottom=bottom - margin, top=top + (margin * 2))
 
         ad = self.adjust
-        plt.subplots_adjust(left=ad['left'], bottom=ad['bottom'], right=ad['right'],
+        fig.subplots_adjust(left=ad['left'], bottom=ad['bottom'], right=ad['right'],
                             top=ad['top'], wspace=0.2, hspace=0)
 
-        if self.chartSet.value('interactive', False, bool):
-            # plt.savefig('out/figure_1.png')
-            plt.show()
-        count = 1
-        saveorig = save
-        while os.path.exists(save):
-            s, ext = os.path.splitext(saveorig)
-            save = '{}({}){}'.format(s, count, ext)
-            count = count + 1
-
-        fig.savefig(save)
-        return save
-
 
 def localRun():
     '''Just running through the paces'''
     from structjour.stock.apichooser import APIChooser
 
-    apiset = QSettings('zero_substance/stockapi', 'structjour')
+    apiset = getSettings('zero_substance/stockapi', 'structjour')
     chooser = APIChooser(apiset)
 
     fp = FinPlot()
@@ -0,0 +1,323 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''
+Incremental moving averages. The EMA and VWAP for a symbol, api and candle interval are kept
+with their state at the last candle (the last value and the count of closes seen). When the same
+candles come back with more candles appended, only the new candles are computed.
+The state is also written next to the stored bars in the BarStore so a new process can pick up
+from the stored days.
+
+@author: Mike Petersen
+
+@creation_date: 10/18/26
+'''
+from collections import OrderedDict
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from structjour.config import getSettings
+from structjour.stock.barstore import BarStore, getBarStoreDir, getBarStoreFormat, isClosedDay, maColumn
+
+# The number of day end states saved for each key
+STATE_DAYS = 30
+
+
+class EmaState:
+    '''
+    The state of an EMA computed like pandas ewm(span=window, adjust=False, ignore_na=True,
+    min_periods=window) at the candle last.
+    '''
+    def __init__(self, window, value=np.nan, count=0, last=None):
+        self.window = window
+        self.value = value
+        self.count = count
+        self.last = last
+
+
+class VwapState:
+    '''The state of the VWAP that began at begin, at the candle last.'''
+    def __init__(self, begin, cumVol=0.0, cumVolPrice=0.0, last=None):
+        self.begin = begin
+        self.cumVol = cumVol
+        self.cumVolPrice = cumVolPrice
+        self.last = last
+
+
+def ema(closes, window):
+    '''
+    Compute the EMA over closes from the beginning.
+    :params closes: A Series of closing prices
+    :return: (Series, EmaState)
+    '''
+    raw = closes.ewm(span=window, adjust=False, ignore_na=True).mean()
+    count = closes.notna().cumsum()
+    series = raw.where(count >= window)
+    state = EmaState(window, float(raw.iloc[-1]), int(count.iloc[-1]), closes.index[-1])
+    return series, state
+
+
+def extendEma(state, closes):
+    '''
+    Continue the EMA in state over the closes that follow state.last.
+    :params state: EmaState. It is not changed.
+    :params closes: A Series of the new closing prices
+    :return: (Series, EmaState)
+    '''
+    alpha = 2 / (state.window + 1)
+    value = state.value
+    count = state.count
+    vals = closes.values.astype(float)
+    out = np.empty(len(vals))
+    for i, x in enumerate(vals):
+        if not np.isnan(x):
+            value = x if count == 0 else (1 - alpha) * value + alpha * x
+            count += 1
+        out[i] = value if count >= state.window else np.nan
+    last = closes.index[-1] if len(closes) else state.last
+    return pd.Series(out, index=closes.index), EmaState(state.window, value, count, last)
+
+
+def vwapBegin(df, bd=None):
+    '''Return the time VWAP begins, the open of bd or the open of the last day in df.'''
+    tz = df.index[0].tzinfo
+    if not bd:
+        bd = df.index[-1]
+    return pd.Timestamp(year=bd.year, month=bd.month, day=bd.day, hour=9, minute=30, second=0, tz=tz)
+
+
+def vwap(df, begin, state=None):
+    '''
+    Compute VWAP from begin, continuing from state if it is given.
+    :return: (Series, VwapState)
+    '''
+    dfv = df.loc[df.index >= begin]
+    cumVol = dfv['volume'].cumsum()
+    cumVolPrice = (dfv['volume'] * (dfv['high'] + dfv['low'] + dfv['close']) / 3).cumsum()
+    if state is not None:
+        cumVol = cumVol + state.cumVol
+        cumVolPrice = cumVolPrice + state.cumVolPrice
+    series = cumVolPrice / cumVol
+    if len(dfv) == 0:
+        return series, state if state is not None else VwapState(begin)
+    return series, VwapState(begin, float(cumVol.iloc[-1]), float(cumVolPrice.iloc[-1]), dfv.index[-1])
+
+
+class IndicatorEngine:
+    '''
+    Compute moving averages for a key (symbol, api, interval) and keep the result. A later call
+    with the same candles plus new ones only computes the new candles.
+    '''
+    def __init__(self, store=None, maxKeys=64):
+        '''
+        :params store: BarStore. If given, states are saved beside the stored bars and the
+            stored moving averages are used to resume in a new process.
+        :params maxKeys: The number of keys kept in memory
+        '''
+        self.store = store
+        self.maxKeys = maxKeys
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+
+    def movingAverages(self, key, df, windows, useVwap=False, beginDay=None):
+        '''
+        Return the moving averages for df as movingAverage does.
+        :params key: (symbol, api, interval)
+        :params df: DataFrame of candles
+        :params windows: The EMA windows
+        :params useVwap: Include VWAP
+        :params beginDay: The day VWAP begins. Defaults to the last day in df
+        :return: OrderedDict {window: Series, 'vwap': Series}
+        '''
+        prior = self.getPrior(key, df, windows)
+        if prior is None:
+            frame = pd.DataFrame({'close': df['close']})
+            states = dict()
+            for window in windows:
+                frame[maColumn(window)], states[window] = ema(df['close'], window)
+        else:
+            pframe, pstates = prior
+            last = max(pstates[w].last for w in windows) if windows else pframe.index[-1]
+            new = df.loc[df.index > last]
+            ext = pd.DataFrame({'close': new['close']})
+            states = dict()
+            for window in windows:
+                ext[maColumn(window)], states[window] = extendEma(pstates[window], new['close'])
+            cols = ['close'] + [maColumn(w) for w in windows]
+            frame = pd.concat([pframe.loc[pframe.index >= df.index[0], cols], ext])
+
+        if useVwap:
+            begin = vwapBegin(df, beginDay)
+            vstate = prior[1].get('vwap') if prior else None
+            if (vstate is not None and vstate.begin == begin and 'vwap' in prior[0].columns
+                    and vstate.last is not None and vstate.last in df.index):
+                series, states['vwap'] = vwap(df.loc[df.index > vstate.last], begin, vstate)
+                old = prior[0]['vwap']
+                series = pd.concat([old.loc[(old.index >= begin) & (old.index <= vstate.last)], series])
+            else:
+                series, states['vwap'] = vwap(df, begin)
+            frame['vwap'] = series
+
+        self.put(key, frame, states)
+        maDict = OrderedDict()
+        for window in windows:
+            maDict[window] = frame[maColumn(window)].reindex(df.index)
+        if useVwap:
+            maDict['vwap'] = frame['vwap'].loc[frame.index >= begin]
+        return maDict
+
+    def getPrior(self, key, df, windows):
+        '''
+        Find an earlier result for key that df continues.
+        :return: (frame, states) or None
+        '''
+        with self.lock:
+            entry = self.frames.get(key)
+            if entry is not None:
+                self.frames.move_to_end(key)
+        if entry is None:
+            entry = self.loadStored(key, df, windows)
+        if entry is None:
+            return None
+        frame, states = entry
+        if any(w not in states or states[w].last is None for w in windows):
+            return None
+        last = frame.index[-1]
+        if frame.index[0] > df.index[0] or last not in df.index:
+            return None
+        # The candles must be the same candles up to the end of the earlier result
+        overlap = frame.loc[frame.index >= df.index[0], 'close']
+        dfclose = df.loc[df.index <= last, 'close']
+        if len(overlap) != len(dfclose) or not np.allclose(overlap.values, dfclose.values, equal_nan=True):
+            return None
+        return frame, states
+
+    def put(self, key, frame, states):
+        with self.lock:
+            self.frames[key] = (frame, states)
+            self.frames.move_to_end(key)
+            while len(self.frames) > self.maxKeys:
+                self.frames.popitem(last=False)
+        if self.store is not None:
+            self.saveState(key, frame, states)
+
+    def statePath(self, key):
+        symbol, api, interval = key
+        return os.path.join(self.store.root, symbol.upper(), api, str(interval), 'emastate.json')
+
+    def saveState(self, key, frame, states):
+        '''
+        Save the EMA state at the last candle of each completed day in frame. These are the
+        points a new process can resume from using the stored days.
+        '''
+        windows = [w for w, s in states.items() if isinstance(s, EmaState)]
+        if not windows:
+            return
+        path = self.statePath(key)
+        d = self.readState(path)
+        ends = frame.groupby(frame.index.normalize()).tail(1)
+        for ts, row in ends.iterrows():
+            if not isClosedDay(ts):
+                continue
+            dstate = dict()
+            for window in windows:
+                value = row[maColumn(window)]
+                # Before the window fills, count is unknown and the state cannot be used
+                if not np.isnan(value):
+                    dstate[str(window)] = [float(value), str(ts)]
+            d[ts.strftime('%Y%m%d')] = dstate
+        for day in sorted(d)[:-STATE_DAYS]:
+            del d[day]
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(d, f)
+            os.replace(tmp, path)
+        except OSError as ex:
+            logging.warning(f'Failed to save moving average state {path}: {ex}')
+
+    def readState(self, path):
+        if not os.path.exists(path):
+            return dict()
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as ex:
+            logging.warning(f'Failed to read moving average state {path}: {ex}')
+            return dict()
+
+    def loadStored(self, key, df, windows):
+        '''
+        Resume from the latest day end state saved beside the stored bars. The moving averages
+        up to that point are read from the stored days.
+        :return: (frame, states) or None
+        '''
+        if self.store is None or not windows:
+            return None
+        d = self.readState(self.statePath(key))
+        days = sorted(set(df.index.normalize()))
+        resume = None
+        for day in reversed(days):
+            dstate = d.get(day.strftime('%Y%m%d'))
+            if dstate and all(str(w) in dstate for w in windows):
+                resume = day
+                break
+        if resume is None:
+            return None
+        states = dict()
+        for window in windows:
+            value, last = d[resume.strftime('%Y%m%d')][str(window)]
+            states[window] = EmaState(window, value, window, pd.Timestamp(last))
+        symbol, api, interval = key
+        found, missing = self.store.getDays(symbol, api, interval, [x for x in days if x <= resume])
+        if missing:
+            return None
+        frame = pd.concat([found[day] for day in sorted(found)])
+        cols = ['close'] + [maColumn(w) for w in windows]
+        if not set(cols).issubset(frame.columns) or frame.index[-1] != states[windows[0]].last:
+            return None
+        return frame[cols], states
+
+
+ENGINE = None
+_engineLock = threading.Lock()
+
+
+def settingsStore():
+    '''Return the BarStore of the stockapi settings or None if the bar store is not in use'''
+    apiset = getSettings('zero_substance/stockapi', 'structjour')
+    if not apiset.value('useBarStore', True, bool):
+        return None
+    return BarStore(getBarStoreDir(apiset), getBarStoreFormat(apiset))
+
+
+def getEngine(store=None):
+    '''
+    Get the process wide IndicatorEngine. It is created on the first call with store, by
+    default the bar store of the settings if it is in use.
+    '''
+    global ENGINE
+    if ENGINE is None:
+        with _engineLock:
+            if ENGINE is None:
+                ENGINE = IndicatorEngine(store if store is not None else settingsStore())
+    return ENGINE
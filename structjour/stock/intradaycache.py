@@ -0,0 +1,130 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''
+An in memory cache of the results of APIChooser.get_intraday. The size is limited by the bytes
+held, the least recently used results are dropped first. A result for a window whose trading
+day has ended is kept until it is dropped. A result that includes a live session expires after
+a few seconds. Callers get copies so they cannot change what is cached.
+
+@author: Mike Petersen
+
+@creation_date: 10/18/26
+'''
+from collections import OrderedDict
+import copy
+import threading
+import time
+
+import pandas as pd
+
+from structjour.stock.barstore import isClosedDay
+
+MAXBYTES = 64 * 1024 * 1024
+
+# Seconds a result that includes a live session is good for
+LIVE_TTL = 30
+
+
+def frameBytes(df, maDict):
+    '''Return the memory used by df and the series in maDict'''
+    size = int(df.memory_usage(index=True).sum())
+    if maDict:
+        size += sum(int(s.memory_usage(index=True)) for s in maDict.values())
+    return size
+
+
+def copyResult(meta, df, maDict):
+    maCopy = None
+    if maDict is not None:
+        maCopy = OrderedDict((k, s.copy()) for k, s in maDict.items())
+    return copy.deepcopy(meta), df.copy(), maCopy
+
+
+class IntradayCache:
+    '''
+    LRU cache of (meta, df, maDict) with a byte budget.
+    '''
+    def __init__(self, maxBytes=MAXBYTES, liveTtl=LIVE_TTL, clock=time.monotonic):
+        '''
+        :params maxBytes: The most bytes of DataFrames and Series to hold
+        :params liveTtl: Seconds a result with a live window is good for
+        '''
+        self.maxBytes = maxBytes
+        self.liveTtl = liveTtl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+
+    def isClosed(self, end):
+        '''A window is closed if its end is given and the day of end has ended'''
+        return end is not None and isClosedDay(pd.Timestamp(end))
+
+    def get(self, key):
+        '''
+        :return: (api, (meta, df, maDict)) copied from the cache or None
+        '''
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            api, result, size, expires = entry
+            if expires is not None and self.clock() >= expires:
+                del self.entries[key]
+                self.nbytes -= size
+                return None
+            self.entries.move_to_end(key)
+        return api, copyResult(*result)
+
+    def put(self, key, api, meta, df, maDict, end):
+        '''
+        Cache a copy of the result.
+        :params end: The end of the requested window. Determines the time to live
+        '''
+        size = frameBytes(df, maDict)
+        if size > self.maxBytes:
+            return
+        expires = None if self.isClosed(end) else self.clock() + self.liveTtl
+        result = copyResult(meta, df, maDict)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[2]
+            self.entries[key] = (api, result, size, expires)
+            self.nbytes += size
+            while self.nbytes > self.maxBytes:
+                k, entry = self.entries.popitem(last=False)
+                self.nbytes -= entry[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+
+CACHE = None
+_cacheLock = threading.Lock()
+
+
+def getIntradayCache():
+    '''Get the process wide IntradayCache'''
+    global CACHE
+    if CACHE is None:
+        with _cacheLock:
+            if CACHE is None:
+                CACHE = IntradayCache()
+    return CACHE
@@ -0,0 +1,95 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''
+Plan how much history to request before start so the moving averages are warmed up when the
+chart begins. An EMA forgets its seed geometrically. After n candles the seed's weight is
+(1 - alpha)**n, so the lookback is the n that brings that under EMA_TOLERANCE for the longest
+window in the chart settings. The candles are counted in trading sessions, so weekends and the
+hours outside the session are skipped, and so are the holidays in the NYSE calendar.
+
+@author: Mike Petersen
+
+@creation_date: 10/18/26
+'''
+import math
+
+import pandas as pd
+
+from structjour.stock.nysecalendar import getCalendar
+from structjour.stock.utilities import excludeAfterHours, getMASettings
+
+# The most weight the values before the lookback may have in an EMA at start
+EMA_TOLERANCE = 0.01
+
+
+def emaWarmup(window, tolerance=EMA_TOLERANCE):
+    '''
+    Return the number of candles an EMA of window needs before its values are used. At least
+    window because movingAverage sets min_periods to the window.
+    '''
+    if window <= 1:
+        return max(window, 0)
+    alpha = 2 / (window + 1)
+    return max(window, math.ceil(math.log(tolerance) / math.log(1 - alpha)))
+
+
+def lookbackBars(windows=None, tolerance=EMA_TOLERANCE):
+    '''
+    Return the candles needed before start for the longest of windows.
+    :params windows: A list of EMA windows. Defaults to the windows in the chart settings.
+        VWAP begins at the open and needs none.
+    '''
+    if windows is None:
+        windows = list(getMASettings()[0].keys())
+    return max([emaWarmup(w, tolerance) for w in windows], default=0)
+
+
+def lookbackStart(start, minutes, windows=None, afterHours=None, tolerance=EMA_TOLERANCE):
+    '''
+    Return the time to request candles from so the moving averages are warm at start.
+    :params start: Naive New York time of the first candle wanted
+    :params minutes: The candle interval
+    :params windows: A list of EMA windows. Defaults to the chart settings
+    :params afterHours: Count the extended hours. Defaults to the chart settings
+    :return: A naive Timestamp at or before start
+    '''
+    start = pd.Timestamp(start)
+    need = lookbackBars(windows, tolerance)
+    if need == 0:
+        return start
+    if afterHours is None:
+        afterHours = not excludeAfterHours()
+    cal = getCalendar()
+    step = pd.Timedelta(minutes=minutes)
+    day = start.normalize()
+
+    # The candles of start's own session before start
+    if cal.isSession(day):
+        sessionOpen, sessionClose = cal.openClose(day, afterHours)
+        if start > sessionOpen:
+            today = math.floor((min(start, sessionClose) - sessionOpen) / step)
+            if today >= need:
+                return start - need * step
+            need -= today
+    while True:
+        day = cal.previousSession(day)
+        sessionOpen, sessionClose = cal.openClose(day, afterHours)
+        bars = math.ceil((sessionClose - sessionOpen) / step)
+        if bars >= need:
+            # Begin that many candles before the close
+            return sessionOpen + (bars - need) * step
+        need -= bars
@@ -22,14 +22,16 @@ This has a generous free with 60 per second throttle. And it goes back 20 years.
 @creation_date:2018-12-11
 (or so)
 '''
-from dateutil.tz import gettz
-import datetime as dt
 import logging
 import pandas as pd
 import numpy as np
-import requests
+from structjour.stock import transport
+from structjour.stock.lookback import lookbackStart
+from structjour.stock.timenorm import NY2unix, unix2NY
 
-from structjour.stock.utilities import ManageKeys, movingAverage, setLimitReached, getLimitReached
+from structjour.stock.ratelimit import getLimiter
+from structjour.stock.resample import NATIVE, planResolution, resampleBars
+from structjour.stock.utilities import ManageKeys, movingAverage, setLimitReached
 
 
 example = 'https://finnhub.io/api/v1/stock/candle?symbol=AAPL&resolution=1&count=200&token=bm9spbnrh5rb24oaaehg'
@@ -39,14 +41,15 @@ def ni(i):
     '''
     Return a usable interval (called resolution in the api). Note that ni accepts D W and M but structjour
     will never put it in a a request.
-    :return: The given argument if its supported or 1, enabling resample for all other (int) values
+    :return: The given argument if its supported or the largest supported interval that divides
+        it evenly, enabling resample for all other (int) values
     '''
     # These are the accepted values for the 'resolution' parameter
-    supported = [1, 5, 15, 30, 60, 'D', 'W', 'M']
+    supported = NATIVE['fh'] + ['D', 'W', 'M']
     if i in supported:
         return i
     elif isinstance(i, int):
-        return 1
+        return planResolution(i, NATIVE['fh'])
     return 5
 
 
@@ -72,16 +75,11 @@ def getLimits():
 
 def pd2unix(t):
     '''
-    :params t: a naive datetime object
-    :exception: Will raise an assertion error if t is not datetime or has no tzinfo assoatiated.
+    :params t: a naive Timestamp showing New York time
+    :exception: Will raise an assertion error if t is not a Timestamp
     '''
     assert isinstance(t, pd.Timestamp)
-    eastern = gettz("US/Eastern")
-    # assert t.tzinfo is not None
-    offset = eastern.utcoffset(t).total_seconds()
-
-    epoc = dt.datetime(1970, 1, 1)
-    return (t - epoc).total_seconds() - offset
+    return NY2unix(t)
 
 
 def unix2pd(t, tzstring="US/Eastern"):
@@ -90,11 +88,7 @@ def unix2pd(t, tzstring="US/Eastern"):
     :params t: int: Finnhubs unix time
     '''
     assert isinstance(t, (int, np.integer))
-    eastern = gettz(tzstring)
-    chk_tz = pd.to_datetime(t, unit='s')
-    actual_time = chk_tz + pd.Timedelta(seconds=eastern.utcoffset(chk_tz).total_seconds())
-
-    return actual_time
+    return pd.Timestamp(t, unit='s', tz='UTC').tz_convert(tzstring).tz_localize(None)
 
 
 def getStartForRequest(start, end, interval):
@@ -104,14 +98,13 @@ def getStartForRequest(start, end, interval):
         3) converts to unix timestamp
     :start: A Naive pd.Timestamp
     :interval: int-- Users requested candle interval
-    :return: A uniz epoch that will request enough data to calculate a 200 MA for the given interval
+    :return: A uniz epoch that will request enough data to warm up the moving averages in the
+        chart settings for the given interval
     '''
     assert isinstance(start, pd.Timestamp)
     assert isinstance(end, pd.Timestamp)
 
-    delt = pd.Timedelta(minutes=interval * 2000)
-
-    rstart = start - delt
+    rstart = lookbackStart(start, interval)
     rstart = int(pd2unix(rstart))
     rend = int(pd2unix(end))
     return rstart, rend
@@ -136,7 +129,7 @@ def fh_intraday(base, symbol, start, end, resolution, showUrl=False, key=None):
 
     params['token'] = key if key else getApiKey()
     
-    response = requests.get(base, params=params)
+    response = transport.get(base, params=params)
     if showUrl:
         logging.info(response.url)
 
@@ -166,9 +159,7 @@ def getdf(j):
     and set it as index in the df.
     :params j: The json object from request. j['t'] is the unix time array
     '''
-    j['time'] = []
-    for v in j['t']:
-        j['time'].append(unix2pd(v))
+    j['time'] = unix2NY(j['t'])
 
     d = {'timestamp': j['time'], 'open': j['o'], 'high': j['h'], 'low': j['l'],
          'close': j['c'], 'volume': j['v']}
@@ -182,13 +173,7 @@ def getdf(j):
 
 def resample(df, minutes, resolution):
     if minutes != resolution:
-        srate = f'{minutes}T'
-        df_ohlc = df[['open']].resample(srate).first()
-        df_ohlc['high'] = df[['high']].resample(srate).max()
-        df_ohlc['low'] = df[['low']].resample(srate).min()
-        df_ohlc['close'] = df[['close']].resample(srate).last()
-        df_ohlc['volume'] = df[['volume']].resample(srate).sum()
-        df = df_ohlc.copy()
+        df = resampleBars(df, minutes)
     return df
 
 
@@ -249,7 +234,7 @@ def getFh_intraday(symbol, start=None, end=None, minutes=5, showUrl=True, key=No
     :params start: Time string or naive pandas timestamp or naive datetime object.
     :params end: Time string or naive pandas timestamp or naive datetime object.
     '''
-    if getLimitReached('fh'):
+    if not getLimiter().acquire('fh'):
         msg = 'Finnhub limit was reached'
         logging.info(msg)
         return {'code': 666, 'message': msg}, pd.DataFrame(), None
@@ -280,7 +265,7 @@ def getFh_intraday(symbol, start=None, end=None, minutes=5, showUrl=True, key=No
     # remove candles that lack data
     df = df[df['open'] > 0]
 
-    maDict = movingAverage(df.close, df, start)
+    maDict = movingAverage(df.close, df, start, key=(symbol, 'fh', minutes))
     meta, df, maDict = trimit(df, maDict, start, end, meta)
 
     return meta, df, maDict
@@ -32,9 +32,11 @@ Calls the RESTapi for intraday. There is a limit on the free API of 5 calls per
 import datetime as dt
 import logging
 import time
-import requests
 import pandas as pd
-from structjour.stock.utilities import ManageKeys, movingAverage, setLimitReached, getLimitReached
+from structjour.stock import transport
+from structjour.stock.ratelimit import getLimiter
+from structjour.stock.resample import NATIVE, planResolution, resampleBars
+from structjour.stock.utilities import ManageKeys, movingAverage, setLimitReached
 
 BASE_URL = 'https://www.alphavantage.co/query?'
 EXAMPLES = {
@@ -124,20 +126,13 @@ def ni(i):
         i = 60
 
     resamp = False
-    if i in [1, 5, 15, 30, 60]:
-        return resamp, {1: ('1min', 1, 1), 5: ('5min', 5, 5), 15: ('15min', 15, 15), 30: ('30min', 30, 30), 60: ('60min', 60, 60)}[i]
+    if i in NATIVE['av']:
+        return resamp, (f'{i}min', i, i)
     resamp = True
     if isinstance(i, int):
-        ret = '60min', 60, i
-        if i < 5:
-            ret = ('1min', 1, i)
-        elif i < 15:
-            ret = ('5min', 5, i)
-        elif i < 30:
-            ret = ('15min', 15, i)
-        elif i < 60:
-            ret = ('30min', 30, i)
-        return resamp, ret
+        # The largest native interval that divides evenly into the requested one
+        n = planResolution(i, NATIVE['av'])
+        return resamp, (f'{n}min', n, i)
     logging.warning(
         f"interval={i} is not supported by alphavantage. Setting to 1min candle as if it were requested")
     return False, ('1min', 1, 1)
@@ -170,7 +165,7 @@ def getmav_intraday(symbol, start=None, end=None, minutes=None, showUrl=False, k
          low, close, volume and indexed by pd timestamp. If not specified, this
          will return a weeks data.
     '''
-    if getLimitReached('av'):
+    if not getLimiter().acquire('av'):
         msg = 'AlphaVantage limit was reached'
         logging.info(msg)
         return {'code': 666, 'message': msg}, pd.DataFrame(), None
@@ -195,7 +190,7 @@ def getmav_intraday(symbol, start=None, end=None, minutes=None, showUrl=False, k
     params['apikey'] = key if key else getKey()
 
     request_url = f"{BASE_URL}"
-    response = requests.get(request_url, params=params)
+    response = transport.get(request_url, params=params)
     if showUrl:
         logging.info(response.url)
 
@@ -258,15 +253,9 @@ def getmav_intraday(symbol, start=None, end=None, minutes=None, showUrl=False, k
     #     df.index[i] = df.index[i] - delt
 
     if resamp:
-        srate = f'{original_minutes}T'
-        df_ohlc = df[['open']].resample(srate).first()
-        df_ohlc['high'] = df[['high']].resample(srate).max()
-        df_ohlc['low'] = df[['low']].resample(srate).min()
-        df_ohlc['close'] = df[['close']].resample(srate).last()
-        df_ohlc['volume'] = df[['volume']].resample(srate).sum()
-        df = df_ohlc.copy()
-
-    maDict = movingAverage(df.close, df, start)
+        df = resampleBars(df, original_minutes)
+
+    maDict = movingAverage(df.close, df, start, key=(symbol, 'av', original_minutes))
 
     # Trim the data to the requested time frame. If we slice it all off set status message and return
     if start:
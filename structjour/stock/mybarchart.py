@@ -25,9 +25,12 @@ getHistory and to implement the APIChooser interface for it.
 '''
 import datetime as dt
 import logging
-import requests
 import pandas as pd
-from structjour.stock.utilities import ManageKeys, getLastWorkDay, movingAverage, setLimitReached, getLimitReached
+from structjour.stock import transport
+from structjour.stock.lookback import lookbackStart
+from structjour.stock.timenorm import toNYNaive
+from structjour.stock.ratelimit import getLimiter
+from structjour.stock.utilities import ManageKeys, getLastWorkDay, movingAverage, setLimitReached
 
 
 def getApiKey():
@@ -122,7 +125,7 @@ def getbc_intraday(symbol, start=None, end=None, minutes=5, showUrl=False, key=N
         seperate from request status_code.
     :raise: ValueError if response.status_code is not 200.
     '''
-    if getLimitReached('bc'):
+    if not getLimiter().acquire('bc'):
         msg = 'BarChart limit was reached'
         logging.info(msg)
         return {'code': 666, 'message': msg}, pd.DataFrame(), None
@@ -141,14 +144,13 @@ def getbc_intraday(symbol, start=None, end=None, minutes=5, showUrl=False, key=N
     start = pd.to_datetime(start)
     # startDay = start.strftime("%Y%m%d")
 
-    # Get the maximum data in order to set the 200 MA on a 60 minute chart
-    fullstart = pd.Timestamp.today()
-    fullstart = fullstart - pd.Timedelta(days=40)
+    # Get enough data to warm up the moving averages before start
+    fullstart = lookbackStart(start, minutes)
     fullstart = fullstart.strftime("%Y%m%d")
 
     params = setParams(symbol, minutes, fullstart, key=key)
 
-    response = requests.get(BASE_URL, params=params)
+    response = transport.get(BASE_URL, params=params)
     if showUrl:
         logging.info(response.url)
 
@@ -173,14 +175,9 @@ def getbc_intraday(symbol, start=None, end=None, minutes=5, showUrl=False, key=N
     meta['message'] = result['status']['message']
     df = pd.DataFrame(result['results'])
 
-    for i, row in df.iterrows():
-        d = pd.Timestamp(row['timestamp'])
-        newd = pd.Timestamp(d.year, d.month, d.day, d.hour, d.minute, d.second)
-        df.at[i, 'timestamp'] = newd
-
-    df.set_index(df.timestamp, inplace=True)
+    df.set_index(toNYNaive(df['timestamp']), inplace=True)
     df.index.rename('date', inplace=True)
-    maDict = movingAverage(df.close, df, start)
+    maDict = movingAverage(df.close, df, start, key=(symbol, 'bc', minutes))
 
     if start > df.index[0]:
         rstart = df.index[0]
@@ -21,14 +21,19 @@ Implement historicalData method from the IB API
 '''
 
 # import sys
+import asyncio
+import bisect
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
 import datetime as dt
+import itertools
 import logging
-from threading import Thread
+from threading import Event, Lock, Thread
 import queue
+import time
 import pandas as pd
 
-from PyQt5.QtCore import QSettings
-
+from structjour.config import getSettings
 from structjour.stock.utilities import checkForIbapi, excludeAfterHours
 if checkForIbapi():
 
@@ -41,6 +46,8 @@ if checkForIbapi():
 else:
     raise ImportError('\nIBAPI is not installed. The module myib cannot run.\n')
 
+from structjour.stock.lookback import lookbackStart
+from structjour.stock.resample import NATIVE, planResolution, resampleBars
 from structjour.stock.utilities import getLastWorkDay, IbSettings, movingAverage
 
 
@@ -90,7 +97,9 @@ def ni(i, minutes='minutes'):
         return (resamp, (durdict[i], i, i))
     resamp = True
     if isinstance(i, int):
-        return (resamp, ('1 min', 1, i))
+        # The largest bar size that divides evenly into the requested interval
+        n = planResolution(i, NATIVE['ib'])
+        return (resamp, (durdict[n], n, i))
     return (False, ('', 0, 0))
 
 
@@ -111,6 +120,112 @@ def validateDurString(s):
     return True
 
 
+def validateHistorical(end, dur, interval):
+    '''Log a warning and return False if the arguments for reqHistoricalData are bad'''
+    if not validateDurString(dur):
+        logging.warning("Duration must be formatted like '3 D' using S, D, W, M, or Y")
+        return False
+
+    if not isinstance(end, dt.datetime):
+        logging.warning("end must be formatted as a datetime object")
+        return False
+
+    if interval not in BAR_SIZE:
+        logging.warning('Bar size ({}) must be one of: {}'.format(interval, BAR_SIZE))
+        return False
+    return True
+
+
+def getContract(symbol, exchange='NASDAQ'):
+    '''Return a Contract for a US stock'''
+    contract = Contract()
+    contract.symbol = symbol
+    contract.secType = "STK"
+    contract.exchange = "SMART"
+    contract.currency = "USD"
+    contract.primaryExchange = exchange
+    return contract
+
+
+_reqIds = itertools.count(1000)
+
+
+def nextReqId():
+    '''Return a request id unique in this process'''
+    return next(_reqIds)
+
+
+class IbPacer:
+    '''
+    Schedule historical data requests to avoid IB pacing violations (see getLimits). A request
+    waits until it is more than identical seconds after an identical request, until fewer than
+    perContract requests for its contract were sent in the last contractPeriod seconds and
+    until fewer than maxRequests were sent in the last period seconds.
+    '''
+    def __init__(self, maxRequests=60, period=600, identical=15, perContract=5, contractPeriod=2,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.maxRequests = maxRequests
+        self.period = period
+        self.identical = identical
+        self.perContract = perContract
+        self.contractPeriod = contractPeriod
+        self.clock = clock
+        self.sleep = sleep
+        # (time, request, contract) in time order. A time can be a send reserved for later
+        self.sent = deque()
+        self.lock = Lock()
+
+    def delay(self, request, contract, now):
+        '''
+        Return the seconds request must wait from now
+        :params request: A hashable of the request arguments
+        :params contract: The contract key, e.g. the symbol
+        '''
+        while self.sent and self.sent[0][0] <= now - self.period:
+            self.sent.popleft()
+        wait = 0
+        for t, r, c in self.sent:
+            if r == request:
+                wait = max(wait, t + self.identical - now)
+        times = [t for t, r, c in self.sent if c == contract]
+        if len(times) >= self.perContract:
+            wait = max(wait, times[-self.perContract] + self.contractPeriod - now)
+        if len(self.sent) >= self.maxRequests:
+            wait = max(wait, self.sent[-self.maxRequests][0] + self.period - now)
+        return max(0, wait)
+
+    def record(self, request, contract, when):
+        bisect.insort(self.sent, (when, request, contract), key=lambda x: x[0])
+
+    def acquire(self, request, contract):
+        '''
+        Reserve the next allowed time for request and sleep until then. Other requests can
+        reserve later times while this one sleeps.
+        :return: The seconds waited
+        '''
+        with self.lock:
+            now = self.clock()
+            wait = self.delay(request, contract, now)
+            self.record(request, contract, now + wait)
+        if wait > 0:
+            logging.info(f'Waiting {wait:.1f} seconds to avoid an IB pacing violation')
+            self.sleep(wait)
+        return wait
+
+
+PACER = IbPacer()
+
+# Error codes IB sends as notices. They do not end a request, e.g. 2104 market data farm
+# connection is OK, 10167 displaying delayed market data, 10197 no market data during competing
+# live session
+NOTICE_CODES = (10167, 10197)
+
+
+def isNotice(errorCode):
+    '''Return True if errorCode is a warning or a notice rather than an error'''
+    return 2100 <= errorCode < 2200 or errorCode in NOTICE_CODES
+
+
 class TestClient(EClient):
     '''
     Inherit from the sample code
@@ -118,7 +233,6 @@ class TestClient(EClient):
 
     def __init__(self, wrapprr):
         EClient.__init__(self, wrapprr)
-        self.storage = queue.Queue()
 
 
 class TestWrapper(wrapper.EWrapper):
@@ -128,8 +242,10 @@ class TestWrapper(wrapper.EWrapper):
     def __init__(self):
         wrapper.EWrapper.__init__(self)
 
-        self.counter = 0
-        self.data = []
+        # reqId: IbBarStream for the keepUpToDate requests
+        self.streams = dict()
+        # reqId: (rows, Future) for each historical request in flight
+        self.pending = dict()
 
     def contractDetails(self, reqId, contractDetails):
         '''
@@ -143,30 +259,64 @@ class TestWrapper(wrapper.EWrapper):
         '''
         Overriden method to return all errors to us
         '''
+        if isNotice(errorCode):
+            logging.info(f"Notice: {reqId} {errorCode} {errorString}")
+            return
         if reqId != -1:
             logging.error(f"Error: {reqId} {errorCode} {errorString}")
+        # An error for a request ends it. The caller gets an empty DataFrame
+        if reqId in self.pending:
+            rows, future = self.pending.pop(reqId)
+            if not future.done():
+                future.set_result(pd.DataFrame())
+
+    def connectionClosed(self):
+        '''
+        Overriden callback. Fail the requests still waiting for data and end the streams
+        '''
+        for reqId in list(self.pending):
+            rows, future = self.pending.pop(reqId)
+            if not future.done():
+                future.set_exception(ConnectionError('The IB connection closed'))
+        for reqId in list(self.streams):
+            self.streams.pop(reqId).onClosed()
 
     def historicalData(self, reqId: int, bar):
         '''
         Overriden Callback from EWrapper. Drops off data 1 bar at a time in each call.
         '''
-        if self.counter == 0:
-            dat = []
-            dat.append(bar)
-        self.counter = self.counter + 1
-        self.data.append([bar.date, bar.open, bar.high,
-                          bar.low, bar.close, bar.volume])
+        if reqId in self.streams:
+            self.streams[reqId].onBar(bar, False)
+            return
+        if reqId in self.pending:
+            self.pending[reqId][0].append([bar.date, bar.open, bar.high,
+                                           bar.low, bar.close, bar.volume])
 
     def historicalDataEnd(self, reqId: int, start: str, end: str):
         '''
         Overriden callback is called when all bars have been delivered to historicalData provided
-        keepUpToDate=False, parameter in reqHistoricalData.
+        keepUpToDate=False, parameter in reqHistoricalData. For a stream, it marks the end of
+        the initial bars.
         '''
 
         super().historicalDataEnd(reqId, start, end)
-        df = pd.DataFrame(self.data,
-                          columns=['date', 'open', 'high', 'low', 'close', 'volume'])
-        self.storage.put(df)
+        if reqId in self.streams:
+            self.streams[reqId].onLoaded()
+            return
+        if reqId in self.pending:
+            rows, future = self.pending.pop(reqId)
+            df = pd.DataFrame(rows, columns=['date', 'open', 'high', 'low', 'close', 'volume'])
+            df.set_index('date', inplace=True)
+            if not future.done():
+                future.set_result(df)
+
+    def historicalDataUpdate(self, reqId: int, bar):
+        '''
+        Overriden callback is called with the candle in progress and with each new candle for a
+        request made with keepUpToDate=True.
+        '''
+        if reqId in self.streams:
+            self.streams[reqId].onBar(bar, True)
 
 
 class TestApp(TestWrapper, TestClient):
@@ -207,16 +357,7 @@ class TestApp(TestWrapper, TestClient):
         # get value for exclue afterhours, 1==RTH only
         AFTERHOURS = 1 if excludeAfterHours() else 0
 
-        if not validateDurString(dur):
-            logging.warning("Duration must be formatted like '3 D' using S, D, W, M, or Y")
-            return pd.DataFrame()
-
-        if not isinstance(end, dt.datetime):
-            logging.warning("end must be formatted as a datetime object")
-            return pd.DataFrame()
-
-        if interval not in BAR_SIZE:
-            logging.warning('Bar size ({}) must be one of: {}'.format(interval, BAR_SIZE))
+        if not validateHistorical(end, dur, interval):
             return pd.DataFrame()
 
         # app = Ib()
@@ -225,12 +366,7 @@ class TestApp(TestWrapper, TestClient):
         clientId = self.cid
         self.connect(host, port, clientId)
 
-        contract = Contract()
-        contract.symbol = symbol
-        contract.secType = "STK"
-        contract.exchange = "SMART"
-        contract.currency = "USD"
-        contract.primaryExchange = exchange
+        contract = getContract(symbol, exchange)
 
         # app.reqContractDetails(10, contract)
 
@@ -238,7 +374,11 @@ class TestApp(TestWrapper, TestClient):
         # self.reqHistoricalData(18002, ContractSamples.ContFut(), timeStr,
         #                        "1 Y", "1 month", "TRADES", 0, 1, False, []);
         # queryTime = DateTime.Now.AddMonths(-6).ToString("yyyyMMdd HH:mm:ss");
-        self.reqHistoricalData(port, contract, timeStr, dur,
+        reqId = nextReqId()
+        future = Future()
+        self.pending[reqId] = ([], future)
+        PACER.acquire((symbol, timeStr, dur, interval), symbol)
+        self.reqHistoricalData(reqId, contract, timeStr, dur,
                                interval, "TRADES", AFTERHOURS, 1, False, [])
         # client.reqHistoricalData(4002, ContractSamples.EuropeanStock(), queryTime,
         #                          "10 D", "1 min", "TRADES", 1, 1, false, null);
@@ -250,15 +390,308 @@ class TestApp(TestWrapper, TestClient):
         setattr(self, "_thread", thread)
 
         try:
-            x = self.storage.get(timeout=10)
-            x.set_index('date', inplace=True)
-            return x
-        except queue.Empty as ex:
+            return future.result(timeout=10)
+        except (FutureTimeout, ConnectionError) as ex:
             logging.error(f"Request came back empty {ex.__class__.__name__}")
             logging.error(ex)
+            self.pending.pop(reqId, None)
             return pd.DataFrame()
 
 
+class IbBarStream:
+    '''
+    Stream the candles for one symbol over the IbManager connection. The bars for dur are
+    delivered first. Then IB sends the candle in progress and each new candle as it
+    happens (reqHistoricalData with keepUpToDate=True). Each bar is passed to callback and
+    queued for the updates generator and the async iterator.
+    Usage:
+        with IbBarStream('SQ', 5, callback=onBar) as stream:
+            for bar, isUpdate in stream.updates():
+                ...
+    '''
+    def __init__(self, symbol, minutes=1, dur='1 D', callback=None, exchange='NASDAQ', manager=None):
+        '''
+        :params symbol: The stock to stream
+        :params minutes: The candle length. Must be one of IB's bar sizes (see ni)
+        :params dur: The duration of the initial bars e.g. '1 D'
+        :params callback: A callable(bar, isUpdate). bar is a dict with the keys date, open,
+            high, low, close and volume. isUpdate is False for the initial bars.
+        :params manager: The IbManager whose connection carries the stream. Defaults to
+            getIbManager()
+        :raise ValueError: If dur is badly formed or minutes is not one of IB's bar sizes
+        '''
+        if not validateDurString(dur):
+            raise ValueError("Duration must be formatted like '3 D' using S, D, W, M, or Y")
+        (resamp, (interval, minutes, origminutes)) = ni(minutes)
+        if resamp:
+            raise ValueError(f'Cannot stream {origminutes} minute candles. Use one of IB bar sizes')
+        self.symbol = symbol
+        self.minutes = minutes
+        self.interval = interval
+        self.dur = dur
+        self.callback = callback
+        self.exchange = exchange
+        self.manager = manager
+        self.reqId = None
+        self.rows = OrderedDict()
+        self.lock = Lock()
+        self.queue = queue.Queue()
+        self.loaded = Event()
+
+    def start(self):
+        '''
+        Connect if need be and subscribe.
+        :return: True if connected.
+        '''
+        if self.manager is None:
+            self.manager = getIbManager()
+        self.reqId = self.manager.stream(self, self.symbol, self.dur, self.interval, self.exchange)
+        if self.reqId is None:
+            logging.error('Failed to connect to IB. Cannot stream')
+            return False
+        return True
+
+    def stop(self):
+        '''Cancel the subscription and end the iterators. The connection stays open'''
+        if self.reqId is not None:
+            self.manager.cancelStream(self.reqId)
+            self.reqId = None
+        self.queue.put(None)
+
+    def __enter__(self):
+        if not self.start():
+            raise ConnectionError('IB is not connected')
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def onBar(self, bar, isUpdate):
+        '''Called from the reader thread for each bar'''
+        row = {'date': bar.date, 'open': bar.open, 'high': bar.high, 'low': bar.low,
+               'close': bar.close, 'volume': bar.volume}
+        with self.lock:
+            # An update for the candle in progress replaces it
+            self.rows[bar.date] = row
+        if self.callback:
+            try:
+                self.callback(row, isUpdate)
+            except Exception as ex:
+                logging.error(f'IbBarStream callback failed: {ex}')
+        self.queue.put((row, isUpdate))
+
+    def onLoaded(self):
+        self.loaded.set()
+
+    def onClosed(self):
+        '''Called when the connection closes. Ends the iterators'''
+        self.reqId = None
+        self.queue.put(None)
+
+    def frame(self):
+        '''Return a DataFrame of the bars received so far, the last candle may be in progress'''
+        with self.lock:
+            rows = list(self.rows.values())
+        df = pd.DataFrame(rows, columns=['date', 'open', 'high', 'low', 'close', 'volume'])
+        df.set_index('date', inplace=True)
+        df.index = pd.to_datetime(df.index)
+        return df
+
+    def updates(self, timeout=None):
+        '''
+        Generate (bar, isUpdate) as they arrive until stop is called.
+        :params timeout: Seconds to wait for a bar before giving up. Waits forever by default
+        '''
+        while True:
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                return
+            if item is None:
+                return
+            yield item
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        loop = asyncio.get_running_loop()
+        item = await loop.run_in_executor(None, self.queue.get)
+        if item is None:
+            raise StopAsyncIteration
+        return item
+
+
+class IbManager:
+    '''
+    Hold one IB connection and reader thread for the process. Historical requests and the
+    IbBarStreams share the connection. Each historical request gets its own reqId and a Future
+    that is resolved by historicalDataEnd.
+    Use getIbManager() to get the process wide instance.
+    '''
+    def __init__(self, pacer=None):
+        self.app = None
+        self.thread = None
+        self.lock = Lock()
+        self.pacer = pacer or PACER
+
+    def connect(self):
+        '''
+        Return the connected TestApp, connecting if it is not connected.
+        :return: TestApp or None if IB is not configured or is not running
+        '''
+        with self.lock:
+            if self.app is not None and self.app.isConnected():
+                return self.app
+            ibs = IbSettings().getIbSettings()
+            if not ibs:
+                return None
+            app = TestApp(ibs['port'], ibs['id'], ibs['host'])
+            app.connect(ibs['host'], ibs['port'], ibs['id'])
+            if not app.isConnected():
+                return None
+            self.thread = Thread(target=app.run, daemon=True)
+            self.thread.start()
+            setattr(app, "_thread", self.thread)
+            self.app = app
+            return app
+
+    def isConnected(self, connect=True):
+        '''
+        Check the connection. This is cheap when the connection is up.
+        :params connect: If not connected, try to connect. The connection is kept for the
+            next request.
+        '''
+        if self.app is not None and self.app.isConnected():
+            return True
+        if not connect:
+            return False
+        return self.connect() is not None
+
+    def request(self, symbol, end, dur, interval, exchange='NASDAQ'):
+        '''
+        Send a historical data request.
+        :params end: datetime object for the end time requested
+        :params dur: a string for how long before end should the chart begin "1 D"
+        :params interval: candle len
+        :return: A Future for the DataFrame or None if not connected
+        '''
+        app = self.connect()
+        if app is None:
+            return None
+        AFTERHOURS = 1 if excludeAfterHours() else 0
+        timeStr = end.strftime('%Y%m%d %H:%M:%S')
+        reqId = nextReqId()
+        future = Future()
+        future.reqId = reqId
+        self.pacer.acquire((symbol, timeStr, dur, interval), symbol)
+        with self.lock:
+            app.pending[reqId] = ([], future)
+            app.reqHistoricalData(reqId, getContract(symbol, exchange), timeStr,
+                                  dur, interval, "TRADES", AFTERHOURS, 1, False, [])
+        return future
+
+    def getHistoricalMany(self, requests, exchange='NASDAQ', timeout=10):
+        '''
+        Request historical data for a batch of symbols over the shared connection. The requests
+        are in flight together, paced by the pacer. Identical requests are sent once.
+        :params requests: A list of (symbol, end, dur, interval)
+        :params timeout: Seconds to wait for each result after the last request is sent
+        :return: A list of DataFrames in the order of requests, empty for failures
+        '''
+        futures = dict()
+        for req in requests:
+            symbol, end, dur, interval = req
+            if req in futures or not validateHistorical(end, dur, interval):
+                continue
+            futures[req] = self.request(symbol, end, dur, interval, exchange)
+        results = dict()
+        for req, future in futures.items():
+            results[req] = pd.DataFrame()
+            if future is None:
+                continue
+            try:
+                results[req] = future.result(timeout=timeout)
+            except FutureTimeout:
+                logging.error(f'Request for {req[0]} timed out after {timeout} seconds')
+                self.cancel(future.reqId)
+            except ConnectionError as ex:
+                logging.error(ex)
+        return [results.get(req, pd.DataFrame()) for req in requests]
+
+    def getHistorical(self, symbol, end, dur, interval, exchange='NASDAQ', timeout=10):
+        '''
+        Request and wait for historical data. Has the same arguments as TestApp.getHistorical
+        :params timeout: Seconds to wait for the data
+        :return: A DataFrame, empty on failure
+        '''
+        if not validateHistorical(end, dur, interval):
+            return pd.DataFrame()
+        future = self.request(symbol, end, dur, interval, exchange)
+        if future is None:
+            return pd.DataFrame()
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            logging.error(f'Request for {symbol} timed out after {timeout} seconds')
+            self.cancel(future.reqId)
+        except ConnectionError as ex:
+            logging.error(ex)
+        return pd.DataFrame()
+
+    def stream(self, stream, symbol, dur, interval, exchange='NASDAQ'):
+        '''
+        Send a keepUpToDate request whose bars go to stream.onBar.
+        :params stream: An IbBarStream
+        :return: The reqId or None if not connected
+        '''
+        app = self.connect()
+        if app is None:
+            return None
+        AFTERHOURS = 1 if excludeAfterHours() else 0
+        reqId = nextReqId()
+        self.pacer.acquire((symbol, '', dur, interval), symbol)
+        with self.lock:
+            app.streams[reqId] = stream
+            app.reqHistoricalData(reqId, getContract(symbol, exchange), '', dur,
+                                  interval, "TRADES", AFTERHOURS, 1, True, [])
+        return reqId
+
+    def cancelStream(self, reqId):
+        app = self.app
+        if app is not None:
+            app.streams.pop(reqId, None)
+            if app.isConnected():
+                app.cancelHistoricalData(reqId)
+
+    def cancel(self, reqId):
+        app = self.app
+        if app is not None:
+            app.pending.pop(reqId, None)
+            if app.isConnected():
+                app.cancelHistoricalData(reqId)
+
+    def disconnect(self):
+        with self.lock:
+            if self.app is not None and self.app.isConnected():
+                self.app.disconnect()
+            self.app = None
+
+
+IBMANAGER = None
+_managerLock = Lock()
+
+
+def getIbManager():
+    '''Get the process wide IbManager'''
+    global IBMANAGER
+    if IBMANAGER is None:
+        with _managerLock:
+            if IBMANAGER is None:
+                IBMANAGER = IbManager()
+    return IBMANAGER
+
+
 def getib_intraday(symbol, start=None, end=None, minutes=1, showUrl='dummy', key=None):
     '''
     An interface API to match the other getters. In this case its a substantial
@@ -272,7 +705,7 @@ def getib_intraday(symbol, start=None, end=None, minutes=1, showUrl='dummy', key
     :params minutes: The length of the candle, 1~60 minutes. Defaults to 1 minute
     :return (length, df):A DataFrame of the requested stuff and its length
     '''
-    apiset = QSettings('zero_substance/stockapi', 'structjour')
+    apiset = getSettings('zero_substance/stockapi', 'structjour')
     if not apiset.value('gotibapi', type=bool):
         return {'message': 'ibapi is not installed', 'code': 666}, pd.DataFrame(), None
     logging.info('***** IB *****')
@@ -285,11 +718,8 @@ def getib_intraday(symbol, start=None, end=None, minutes=1, showUrl='dummy', key
     end = pd.Timestamp(end)
 
     dur = ''
-    fullstart = end
-    fullstart = fullstart - pd.Timedelta(days=5)
-    if start < fullstart:
-        delt = end - start
-        fullstart = end - delt
+    # Request enough data to warm up the moving averages before start
+    fullstart = lookbackStart(start, minutes)
 
     if (end - fullstart).days < 1:
         if ((end - fullstart).seconds // 3600) > 8:
@@ -312,12 +742,7 @@ def getib_intraday(symbol, start=None, end=None, minutes=1, showUrl='dummy', key
 
     # ib = TestApp(7496, 7878, '127.0.0.1')
     # ib = TestApp(4002, 7979, '127.0.0.1')
-    x = IbSettings()
-    ibs = x.getIbSettings()
-    if not ibs:
-        return 0, pd.DataFrame(), None
-    ib = TestApp(ibs['port'], ibs['id'], ibs['host'])
-    df = ib.getHistorical(symb, end=end, dur=dur, interval=interval, exchange='NASDAQ')
+    df = getIbManager().getHistorical(symb, end=end, dur=dur, interval=interval, exchange='NASDAQ')
     lendf = len(df)
     if lendf == 0:
         return 0, df, None
@@ -325,15 +750,9 @@ def getib_intraday(symbol, start=None, end=None, minutes=1, showUrl='dummy', key
     # Normalize the date to our favorite format
     df.index = pd.to_datetime(df.index)
     if resamp:
-        srate = f'{origminutes}T'
-        df_ohlc = df[['open']].resample(srate).first()
-        df_ohlc['high'] = df[['high']].resample(srate).max()
-        df_ohlc['low'] = df[['low']].resample(srate).min()
-        df_ohlc['close'] = df[['close']].resample(srate).last()
-        df_ohlc['volume'] = df[['volume']].resample(srate).sum()
-        df = df_ohlc.copy()
+        df = resampleBars(df, origminutes)
 
-    maDict = movingAverage(df.close, df, end)
+    maDict = movingAverage(df.close, df, end, key=(symbol, 'ib', origminutes))
 
     if start > df.index[0]:
         msg = f"Cutting off beginning: {df.index[0]} to begin at {start}"
@@ -362,25 +781,17 @@ def getib_intraday(symbol, start=None, end=None, minutes=1, showUrl='dummy', key
     for key in removeMe:
         del maDict[key]
 
-    ib.disconnect()
     return len(df), df, maDict
 
 
 def isConnected():
-    '''Call TestApp.isConnected and return result'''
-    x = IbSettings()
-    ibs = x.getIbSettings()
-    if not ibs:
+    '''
+    Check the shared IB connection, connecting if necessary. The connection is kept open for
+    the following requests
+    '''
+    if not IbSettings().getIbSettings():
         return None
-    host = ibs['host']
-    port = ibs['port']
-    clientId = ibs['id']
-    ib = TestApp(port, clientId, host)
-    ib.connect(host, port, clientId)
-    connected = ib.isConnected()
-    if connected:
-        ib.disconnect()
-    return connected
+    return getIbManager().isConnected()
 
 
 def main():
@@ -1,8 +1,19 @@
+import asyncio
+import functools
 import logging
 import pandas as pd
 
 
 class StockApi:
+    async def agetIntraday(self, ticker, start, end, resolution, showUrl=False, key=None):
+        '''
+        The coroutine version of getIntraday. By default getIntraday runs in the default
+        executor. Subclasses override this with a native async version.
+        '''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(
+            self.getIntraday, ticker, start, end, resolution, showUrl=showUrl, key=key))
+
     def trimit(self, df, maDict, start, end, meta):
         if start > df.index[0]:
             df = df[df.index >= start]
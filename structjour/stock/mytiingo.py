@@ -15,9 +15,13 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 
+import asyncio
 import logging
-import requests
-from structjour.stock.utilities import ManageKeys, dictDate2NYTime, movingAverage, excludeAfterHours
+from structjour.stock import transport
+from structjour.stock.lookback import lookbackStart
+from structjour.stock.ratelimit import getLimiter
+from structjour.stock.timenorm import toNYNaive
+from structjour.stock.utilities import ManageKeys, movingAverage, excludeAfterHours, setLimitReached
 from structjour.stock.mystockapi import StockApi
 import pandas as pd
 
@@ -28,11 +32,28 @@ def getApiKey():
     return key
 
 
-KEY = getApiKey()
 docs = 'https://api.tiingo.com/documentation/general/overview'
 developers = 'https://api.tiingo.com/documentation/appendix/developers'
 
-HEADERS = {'Content-Type': 'application/json', 'Authorization' : 'Token '+ KEY}
+
+def getHeaders(key=None):
+    '''
+    Return the request headers.
+    :params key: The api key. Defaults to the key in the database, which ApiKey keeps until a
+        key changes
+    '''
+    if not key:
+        key = getApiKey()
+    return {'Content-Type': 'application/json', 'Authorization': f'Token {key}'}
+
+
+def __getattr__(name):
+    '''KEY and HEADERS are resolved on first use'''
+    if name == 'HEADERS':
+        return getHeaders()
+    if name == 'KEY':
+        return getHeaders()['Authorization'][len('Token '):]
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 
 def getLimits():
@@ -66,14 +87,14 @@ class Tingo_REST(StockApi):
 
     def getMetadata(self, ticker):
         md = TGO_URL_METADATA.format(ticker=ticker)
-        r = requests.get(md, headers=HEADERS)
+        r = transport.get(md, headers=getHeaders())
         if r.status_code != 200:
             return {"code": r.status_code, "message": r.text}
         return r.json()
 
     def getLatestprice(self, ticker):
         lp = TGO_URL_LATESTPRICE.format(ticker=ticker)
-        r = requests.get(lp, headers=HEADERS)
+        r = transport.get(lp, headers=getHeaders())
         if r.status_code != 200:
             return {"code": r.status_code, "message": r.text}
         return r.json()
@@ -82,7 +103,7 @@ class Tingo_REST(StockApi):
         start = pd.Timestamp(start)
         end = pd.Timestamp(end)
         hp = TGO_URL_HISTPRICE.format(ticker=ticker, sd=start.strftime("%Y-%m-%d"), ed=end.strftime("%Y-%m-%d"))
-        r = requests.get(hp, headers=HEADERS)
+        r = transport.get(hp, headers=getHeaders())
         if r.status_code != 200:
             return {"code": r.status_code, "message": r.text}
         return r.json()
@@ -90,16 +111,37 @@ class Tingo_REST(StockApi):
     # Note that his endpoint is processed differently by iex
     # Note the the docs say the token goes in the url but it works to keep it in the header like the other calls
     def getIntraday(self, ticker, start, end, resolution, showUrl=False, key=None):
+        if not getLimiter().acquire('tgo'):
+            msg = 'Tiingo limit was reached'
+            logging.info(msg)
+            return {'code': 666, 'message': msg}, pd.DataFrame(), None
 
         logging.info('======= Called Tiingo -- no practical limit, 500/hour =======')
-        
+        hd, params = self.intradayParams(ticker, start, resolution)
+        r = transport.get(hd, params=params, headers=getHeaders(key))
+        return self.intradayResult(r, ticker, start, end, resolution)
+
+    async def agetIntraday(self, ticker, start, end, resolution, showUrl=False, key=None):
+        '''The coroutine version of getIntraday'''
+        if not await getLimiter().aacquire('tgo'):
+            msg = 'Tiingo limit was reached'
+            logging.info(msg)
+            return {'code': 666, 'message': msg}, pd.DataFrame(), None
+
+        # The settings, the key and the moving average state are read in the default executor
+        loop = asyncio.get_running_loop()
+        hd, params = await loop.run_in_executor(None, self.intradayParams, ticker, start, resolution)
+        headers = await loop.run_in_executor(None, getHeaders, key)
+        r = await transport.aget(hd, params=params, headers=headers)
+        return await loop.run_in_executor(None, self.intradayResult, r, ticker, start, end, resolution)
+
+    def intradayParams(self, ticker, start, resolution):
+        '''Return the url and the params for an intraday request'''
         # hd = TGO_URL_INTRADAY.format(ticker=ticker, sd='2019-01-02', interval="1min", cols="date,close,high,low,open,volume")
         hd = TGO_URL_INTRADAY0.format(ticker=ticker)
-        header = {'Content-Type': 'application/json'}
 
         start = pd.Timestamp(start)
-        startsent = start - pd.Timedelta(days=14)
-        end = pd.Timestamp(end)
+        startsent = lookbackStart(start, resolution)
         if resolution < 60:
             resolution = str(resolution) + 'min'
         else:
@@ -115,13 +157,18 @@ class Tingo_REST(StockApi):
         params['format'] = 'json'
         # params['token'] = KEY
         params['columns'] = "date,open,high,low,close,volume"
+        return hd, params
 
-
-        r = requests.get(hd, params=params, headers=HEADERS)
-
+    def intradayResult(self, r, ticker, start, end, minutes):
+        '''Process the response to an intraday request into (meta, df, maDict)'''
+        start = pd.Timestamp(start)
+        end = pd.Timestamp(end)
         meta = {'code': r.status_code}
         if r.status_code != 200:
             meta['message'] = r.content
+            if r.status_code == 429:
+                d = pd.Timestamp.now()
+                setLimitReached('tgo', d + pd.Timedelta(hours=1))
             return meta, pd.DataFrame(), None
         r = r.json()
         if len(r) == 0:
@@ -129,16 +176,15 @@ class Tingo_REST(StockApi):
             logging.error('Error: Tiingo returned no data')
             return meta, pd.DataFrame(), None
         
-        r = dictDate2NYTime(r)
         df = self.getdf(r)
-        maDict = movingAverage(df.close, df, start)
+        maDict = movingAverage(df.close, df, start, key=(ticker, 'tgo', minutes))
         meta, df, maDict = self.trimit(df, maDict, start, end, meta)
 
         return meta, df, maDict
 
     def getdf(self, j):
         df = pd.DataFrame(data=j)
-        df.set_index('date', inplace=True)
+        df.set_index(toNYNaive(df['date']), inplace=True)
         df = df[['open', 'high', 'low', 'close', 'volume']]
         return df
 
@@ -148,6 +194,12 @@ def get_intraday(symbol, start=None, end=None, minutes=5, showUrl=False, key=Non
     return t.getIntraday(symbol, start, end, minutes, showUrl, key)
 
 
+async def aget_intraday(symbol, start=None, end=None, minutes=5, showUrl=False, key=None):
+    '''The coroutine version of get_intraday'''
+    t = Tingo_REST()
+    return await t.agetIntraday(symbol, start, end, minutes, showUrl, key)
+
+
 def dometa():
     t = Tingo_REST()
     meta, result = t.getMetadata('SQ')
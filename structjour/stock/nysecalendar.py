@@ -0,0 +1,235 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''
+The NYSE trading calendar. The sessions from FIRST_YEAR to LAST_YEAR are computed once from the
+holiday rules, and every day in that range is given the index of its session, so looking up the
+previous session or the session N back is an array lookup. Early close days end the regular
+session at 13:00 and the extended session at 17:00. All times are naive New York time, so
+the DST transitions do not move the open or the close.
+
+@author: Mike Petersen
+
+@creation_date: 10/18/26
+'''
+import datetime as dt
+import threading
+
+import numpy as np
+import pandas as pd
+
+FIRST_YEAR = 1995
+LAST_YEAR = 2050
+
+# (hour, minute)
+OPEN = (9, 30)
+CLOSE = (16, 0)
+EARLY_CLOSE = (13, 0)
+EXTENDED_OPEN = (4, 0)
+EXTENDED_CLOSE = (20, 0)
+EXTENDED_EARLY_CLOSE = (17, 0)
+
+# Closings that do not follow the rules
+SPECIAL_CLOSINGS = [
+    dt.date(2001, 9, 11), dt.date(2001, 9, 12), dt.date(2001, 9, 13), dt.date(2001, 9, 14),
+    dt.date(2004, 6, 11), dt.date(2007, 1, 2), dt.date(2012, 10, 29), dt.date(2012, 10, 30),
+    dt.date(2018, 12, 5), dt.date(2025, 1, 9),
+]
+
+
+def easter(year):
+    '''Return the date of Easter Sunday (the anonymous Gregorian algorithm)'''
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return dt.date(year, month, day + 1)
+
+
+def nthWeekday(year, month, weekday, n):
+    '''Return the nth (1 based) weekday of the month. n = -1 is the last'''
+    if n > 0:
+        first = dt.date(year, month, 1)
+        return first + dt.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = dt.date(year + month // 12, month % 12 + 1, 1) - dt.timedelta(days=1)
+    return last - dt.timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def observed(day):
+    '''A holiday on Saturday is observed Friday, on Sunday it is observed Monday'''
+    if day.weekday() == 5:
+        return day - dt.timedelta(days=1)
+    if day.weekday() == 6:
+        return day + dt.timedelta(days=1)
+    return day
+
+
+def holidays(year):
+    '''Return the set of full day NYSE holidays in year'''
+    days = set()
+    newYear = dt.date(year, 1, 1)
+    # The NYSE does not close the Friday before a Saturday New Year's Day
+    if newYear.weekday() != 5:
+        days.add(observed(newYear))
+    if year >= 1998:
+        days.add(nthWeekday(year, 1, 0, 3))
+    days.add(nthWeekday(year, 2, 0, 3))
+    days.add(easter(year) - dt.timedelta(days=2))
+    days.add(nthWeekday(year, 5, 0, -1))
+    if year >= 2022:
+        days.add(observed(dt.date(year, 6, 19)))
+    days.add(observed(dt.date(year, 7, 4)))
+    days.add(nthWeekday(year, 9, 0, 1))
+    days.add(nthWeekday(year, 11, 3, 4))
+    days.add(observed(dt.date(year, 12, 25)))
+    days.update(d for d in SPECIAL_CLOSINGS if d.year == year)
+    return days
+
+
+def earlyCloses(year):
+    '''Return the set of days the NYSE closes at 13:00 in year'''
+    days = set()
+    july3 = dt.date(year, 7, 3)
+    if july3.weekday() < 4:
+        days.add(july3)
+    days.add(nthWeekday(year, 11, 3, 4) + dt.timedelta(days=1))
+    christmasEve = dt.date(year, 12, 24)
+    if christmasEve.weekday() < 4:
+        days.add(christmasEve)
+    return days
+
+
+class NyseCalendar:
+    '''
+    The sessions from first to last year, with constant time lookups by day.
+    '''
+    def __init__(self, first=FIRST_YEAR, last=LAST_YEAR):
+        self.first = dt.date(first, 1, 1)
+        self.last = dt.date(last, 12, 31)
+        closed = set()
+        early = set()
+        for year in range(first, last + 1):
+            closed |= holidays(year)
+            early |= earlyCloses(year)
+        self.holidays = frozenset(closed)
+        self.earlyCloses = frozenset(early - closed)
+
+        base = self.first.toordinal()
+        ndays = self.last.toordinal() - base + 1
+        ordinals = np.arange(base, base + ndays)
+        # 0001-01-01 is a Monday
+        weekday = (ordinals - 1) % 7
+        isSession = weekday < 5
+        for day in self.holidays:
+            if self.first <= day <= self.last:
+                isSession[day.toordinal() - base] = False
+        self.base = base
+        self.isSessionArray = isSession
+        self.sessionOrdinals = ordinals[isSession]
+        # For each day, the index of the last session on or before it. -1 before the first
+        self.atOrBefore = np.cumsum(isSession) - 1
+
+    def ordinal(self, day):
+        '''Return the offset of the day of a date, datetime, Timestamp or string in the arrays'''
+        if isinstance(day, dt.datetime):
+            day = day.date()
+        elif not isinstance(day, dt.date):
+            day = pd.Timestamp(day).date()
+        i = day.toordinal() - self.base
+        if i < 0 or i >= len(self.isSessionArray):
+            raise ValueError(f'{day} is outside the calendar {self.first} to {self.last}')
+        return i
+
+    def session(self, index):
+        '''Return the session at index as a normalized Timestamp'''
+        if index < 0 or index >= len(self.sessionOrdinals):
+            raise ValueError(f'The session is outside the calendar {self.first} to {self.last}')
+        return pd.Timestamp(dt.date.fromordinal(int(self.sessionOrdinals[index])))
+
+    def isSession(self, day):
+        return bool(self.isSessionArray[self.ordinal(day)])
+
+    def isEarlyClose(self, day):
+        day = pd.Timestamp(day).date()
+        return day in self.earlyCloses
+
+    def sessionIndex(self, day):
+        '''Return the index of the last session on or before day'''
+        return int(self.atOrBefore[self.ordinal(day)])
+
+    def sessionAtOrBefore(self, day):
+        return self.session(self.sessionIndex(day))
+
+    def previousSession(self, day):
+        '''Return the last session before the day of day'''
+        i = self.ordinal(day)
+        return self.session(int(self.atOrBefore[i]) - int(self.isSessionArray[i]))
+
+    def nextSession(self, day):
+        '''Return the first session after the day of day'''
+        return self.session(self.sessionIndex(day) + 1)
+
+    def sessionsBack(self, day, n):
+        '''
+        Return the session n sessions before day. If day is not a session, the last session
+        before it counts as the first one back.
+        '''
+        i = self.ordinal(day)
+        return self.session(int(self.atOrBefore[i]) - n + (0 if self.isSessionArray[i] else 1))
+
+    def sessions(self, start, end):
+        '''Return the sessions (normalized Timestamps) touched by the time range start to end'''
+        lo = self.ordinal(start)
+        hi = self.ordinal(end)
+        if hi < lo:
+            return []
+        first = int(self.atOrBefore[lo]) + (0 if self.isSessionArray[lo] else 1)
+        last = int(self.atOrBefore[hi])
+        return [self.session(i) for i in range(first, last + 1)]
+
+    def openClose(self, day, afterHours=False):
+        '''
+        Return the open and close of the session of day as naive Timestamps. Does not check that
+        day is a session.
+        :params afterHours: Return the bounds of the extended session
+        '''
+        day = pd.Timestamp(day).normalize()
+        early = day.date() in self.earlyCloses
+        if afterHours:
+            (oh, om), (ch, cm) = EXTENDED_OPEN, EXTENDED_EARLY_CLOSE if early else EXTENDED_CLOSE
+        else:
+            (oh, om), (ch, cm) = OPEN, EARLY_CLOSE if early else CLOSE
+        return (day + pd.Timedelta(hours=oh, minutes=om), day + pd.Timedelta(hours=ch, minutes=cm))
+
+
+CALENDAR = None
+_calendarLock = threading.Lock()
+
+
+def getCalendar():
+    '''Get the process wide NyseCalendar'''
+    global CALENDAR
+    if CALENDAR is None:
+        with _calendarLock:
+            if CALENDAR is None:
+                CALENDAR = NyseCalendar()
+    return CALENDAR
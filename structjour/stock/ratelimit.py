@@ -0,0 +1,282 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''
+Client side rate limits for the stock apis. Each api has token buckets for its documented
+budgets. A request takes a token from each bucket, waiting for the buckets to refill if
+necessary, so a batch of requests paces itself instead of getting locked out. The bucket
+levels are saved in QSettings so the budget is shared by the runs of the program.
+IB pacing is handled by myib.IbPacer, which also knows IB's identical request rules.
+
+@author: Mike Petersen
+
+@creation_date: 10/18/26
+'''
+import asyncio
+import atexit
+import json
+import logging
+import threading
+import time
+
+from structjour.config import getSettings
+
+# token: [(requests, seconds), ...]
+LIMITS = {
+    'av': [(5, 60), (500, 24 * 3600)],
+    'fh': [(60, 60)],
+    'bc': [(150, 24 * 3600)],
+    'tgo': [(500, 3600), (20000, 30 * 24 * 3600)],
+}
+
+# The settings key for the saved bucket levels
+STATE_KEY = 'rateLimitState'
+
+# Seconds a request will wait for its turn by default
+MAXWAIT = 15
+
+# Seconds between saves of the bucket levels as requests are made
+SAVE_INTERVAL = 30
+
+
+class TokenBucket:
+    '''
+    Allow capacity requests per period. The bucket refills continuously at capacity / period.
+    '''
+    def __init__(self, capacity, period, tokens=None, updated=None):
+        self.capacity = capacity
+        self.period = period
+        self.tokens = float(capacity) if tokens is None else float(tokens)
+        self.updated = updated
+
+    def refill(self, now):
+        if self.updated is not None and now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / self.period)
+        self.updated = now if self.updated is None else max(now, self.updated)
+
+    def wait(self, now):
+        '''Return the seconds until a token is available'''
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) * self.period / self.capacity
+
+    def take(self, now):
+        self.refill(now)
+        self.tokens -= 1
+
+    def empty(self, now):
+        self.refill(now)
+        self.tokens = min(self.tokens, 0)
+
+
+class RateLimiter:
+    '''
+    The token buckets for each api.
+    '''
+    def __init__(self, settings=None, limits=None, clock=time.time, sleep=time.sleep,
+                 saveInterval=SAVE_INTERVAL):
+        '''
+        :params settings: QSettings to save the bucket levels in. If None, nothing is saved
+        :params limits: dict token: [(requests, seconds), ...]. Defaults to LIMITS
+        :params saveInterval: The requests taken are saved at most once in this many seconds.
+            A block is saved at once. Call save to save the rest, getLimiter does it at exit
+        '''
+        self.settings = settings
+        self.saveInterval = saveInterval
+        self.lastSave = None
+        self.dirty = False
+        self.limits = LIMITS if limits is None else limits
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.buckets = {token: [TokenBucket(n, secs) for n, secs in limit]
+                        for token, limit in self.limits.items()}
+        # token: time the api told us our quota resets
+        self.blocked = dict()
+        self.load()
+
+    def load(self):
+        if self.settings is None:
+            return
+        state = self.settings.value(STATE_KEY, None)
+        if not state:
+            return
+        try:
+            state = json.loads(state)
+        except ValueError as ex:
+            logging.warning(f'Failed to read the rate limit state: {ex}')
+            return
+        for token, d in state.items():
+            if token not in self.buckets:
+                continue
+            saved = d.get('buckets', [])
+            if len(saved) == len(self.buckets[token]):
+                for bucket, (tokens, updated) in zip(self.buckets[token], saved):
+                    bucket.tokens = min(bucket.capacity, tokens)
+                    bucket.updated = updated
+            if d.get('blocked'):
+                self.blocked[token] = d['blocked']
+
+    def save(self):
+        '''Save the bucket levels in settings'''
+        if self.settings is None:
+            return
+        with self.lock:
+            state = dict()
+            for token, buckets in self.buckets.items():
+                state[token] = {'buckets': [[b.tokens, b.updated] for b in buckets]}
+                if token in self.blocked:
+                    state[token]['blocked'] = self.blocked[token]
+            self.dirty = False
+            self.lastSave = self.clock()
+        self.settings.setValue(STATE_KEY, json.dumps(state))
+
+    def saveDue(self, now):
+        '''Return True if there are unsaved requests and saveInterval has passed'''
+        return (self.settings is not None and self.dirty
+                and (self.lastSave is None or now - self.lastSave >= self.saveInterval))
+
+    def wait(self, token, now=None):
+        '''
+        Return the seconds until token can make a request. 0 for an api without limits.
+        '''
+        now = self.clock() if now is None else now
+        with self.lock:
+            wait = max([b.wait(now) for b in self.buckets.get(token, [])], default=0)
+            blocked = self.blocked.get(token)
+            if blocked is not None:
+                if blocked > now:
+                    wait = max(wait, blocked - now)
+                else:
+                    del self.blocked[token]
+        return wait
+
+    def remaining(self, token, now=None):
+        '''
+        Return the fraction of the budget left for token, the least of its buckets.
+        1.0 for an api without limits.
+        '''
+        now = self.clock() if now is None else now
+        if self.wait(token, now) > 0:
+            return 0.0
+        with self.lock:
+            buckets = self.buckets.get(token, [])
+            for b in buckets:
+                b.refill(now)
+            return min([max(0.0, b.tokens / b.capacity) for b in buckets], default=1.0)
+
+    def tryAcquire(self, token):
+        '''
+        Take a request from the budget of token if one is available now.
+        :return: 0 if taken, otherwise the seconds to wait before trying again
+        '''
+        with self.lock:
+            now = self.clock()
+            wait = max([b.wait(now) for b in self.buckets.get(token, [])], default=0)
+            blocked = self.blocked.get(token)
+            if blocked is not None and blocked > now:
+                wait = max(wait, blocked - now)
+            if wait <= 0:
+                for b in self.buckets.get(token, []):
+                    b.take(now)
+                self.dirty = True
+            save = self.saveDue(now)
+        if save:
+            self.save()
+        return wait
+
+    def acquire(self, token, timeout=MAXWAIT):
+        '''
+        Take a request from the budget of token, waiting up to timeout seconds for it.
+        :params timeout: Seconds to wait. None waits as long as it takes
+        :return: False if the wait would be longer than timeout. The budget is not used.
+        '''
+        while True:
+            wait = self.tryAcquire(token)
+            if wait <= 0:
+                return True
+            if timeout is not None and wait > timeout:
+                return False
+            if timeout is not None:
+                timeout -= wait
+            logging.info(f'Waiting {wait:.1f} seconds for the {token} rate limit')
+            self.sleep(wait)
+
+    async def aacquire(self, token, timeout=MAXWAIT):
+        '''
+        The same as acquire, waiting with asyncio.sleep so the event loop keeps going. The
+        budget is taken in the default executor because it may save the state in the settings.
+        '''
+        loop = asyncio.get_running_loop()
+        while True:
+            wait = await loop.run_in_executor(None, self.tryAcquire, token)
+            if wait <= 0:
+                return True
+            if timeout is not None and wait > timeout:
+                return False
+            if timeout is not None:
+                timeout -= wait
+            await asyncio.sleep(wait)
+
+    def block(self, token, resetTime):
+        '''
+        The api rejected a request for exceeding its quota. Use none of its budget until
+        resetTime.
+        :params resetTime: Unix time in seconds
+        '''
+        with self.lock:
+            now = self.clock()
+            if resetTime <= now:
+                self.blocked.pop(token, None)
+            else:
+                self.blocked[token] = resetTime
+                for b in self.buckets.get(token, []):
+                    b.empty(now)
+        self.save()
+
+
+LIMITER = None
+_limiterLock = threading.Lock()
+
+
+def getLimiter():
+    '''
+    Get the process wide RateLimiter, saving its state in the stockapi settings. The state is
+    saved again when the program exits.
+    '''
+    global LIMITER
+    if LIMITER is None:
+        with _limiterLock:
+            if LIMITER is None:
+                LIMITER = RateLimiter(getSettings('zero_substance/stockapi', 'structjour'))
+                atexit.register(LIMITER.save)
+    return LIMITER
+
+
+def orderByBudget(tokens, limiter, low=0.1):
+    '''
+    Order tokens with those that can make a request now first, then those with less than low of
+    their budget left. Otherwise the order of tokens is kept.
+    :params tokens: A list of api tokens
+    :params limiter: RateLimiter
+    :return: A new list
+    '''
+    def budget(token):
+        if token not in limiter.buckets:
+            return (False, False)
+        return (limiter.wait(token) > 0, limiter.remaining(token) < low)
+    return sorted(tokens, key=budget)
@@ -0,0 +1,132 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''
+Candle intervals shared by the apis. When an api does not have the requested interval, request
+the largest interval it does have that divides the requested one evenly, then resample. A 10
+minute chart from 5 minute candles is a fifth of the data of one from 1 minute candles.
+
+resampleBars is the one resampler for all the apis. The bins of each day are anchored at the
+9:30 open so the candle boundaries are the same whatever api the data came from. It takes a
+DataFrame or Bars; Bars are resampled without pandas.
+
+@author: Mike Petersen
+
+@creation_date: 10/18/26
+'''
+
+import numpy as np
+import pandas as pd
+
+from structjour.stock.bars import Bars
+
+OHLCV = ['open', 'high', 'low', 'close', 'volume']
+NS_PER_DAY = 24 * 3600 * 10**9
+NS_PER_MINUTE = 60 * 10**9
+# The session open, the anchor of the bins of each day
+ANCHOR = pd.Timedelta(hours=9, minutes=30).value
+
+# The minute intervals each api can return. Barchart and Tiingo take any number of minutes
+NATIVE = {
+    'av': [1, 5, 15, 30, 60],
+    'fh': [1, 5, 15, 30, 60],
+    'ib': [1, 2, 3, 5, 10, 15, 20, 30, 60],
+}
+
+
+def planResolution(minutes, native):
+    '''
+    Return the largest of the native intervals that divides minutes evenly.
+    :params minutes: The requested candle interval
+    :params native: A list of intervals in minutes the api supports. Should include 1
+    :return: An int. 1 if nothing else divides minutes
+    '''
+    fits = [n for n in native if n <= minutes and minutes % n == 0]
+    return max(fits) if fits else 1
+
+
+def binLabels(times, minutes, anchor=ANCHOR):
+    '''
+    Return the beginning of the bin of each time. The bins of each day begin at anchor. Bins
+    before anchor count back from it and are cut off at midnight.
+    :params times: int64 array of naive nanoseconds
+    :params minutes: The bin size
+    :params anchor: Nanoseconds after midnight of the first bin of the session
+    '''
+    step = minutes * NS_PER_MINUTE
+    day = (times // NS_PER_DAY) * NS_PER_DAY
+    labels = day + anchor + ((times - day - anchor) // step) * step
+    return np.maximum(labels, day)
+
+
+def groupBins(times, minutes, anchor=ANCHOR):
+    '''
+    Find the bins of sorted times.
+    :return: (labels, starts, ends), the label and the first and last position of each bin.
+        None if times are already on the bins
+    '''
+    labels = binLabels(times, minutes, anchor)
+    if np.array_equal(labels, times) and (len(times) < 2 or (np.diff(times) > 0).all()):
+        return None
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]])
+    ends = np.r_[starts[1:], len(labels)] - 1
+    return labels[starts], starts, ends
+
+
+def resampleBars(df, minutes, anchor=ANCHOR):
+    '''
+    Resample candles to minutes in one pass. The candles are grouped by bin and each column is
+    reduced once: first open, max high, min low, last close and summed volume. Bins without
+    candles are left out rather than filled with NaN. Candles that are already on the bins are
+    returned without grouping.
+    :params df: DataFrame with the columns open, high, low, close, volume and a sorted
+        DatetimeIndex, naive or tz aware. Or Bars
+    :params minutes: The new candle interval
+    :params anchor: Nanoseconds after midnight of the first bin of the session
+    :return: A new DataFrame with the same columns as OHLCV, or Bars for Bars. Bars already on
+        the bins are returned as they are
+    '''
+    if isinstance(df, Bars):
+        if len(df) == 0:
+            return df
+        bins = groupBins(df.time, minutes, anchor)
+        if bins is None:
+            return df
+        labels, starts, ends = bins
+        return Bars(labels, df.open[starts], np.fmax.reduceat(df.high, starts),
+                    np.fmin.reduceat(df.low, starts), df.close[ends], np.add.reduceat(df.volume, starts))
+    if len(df) == 0:
+        return df[OHLCV].copy()
+    index = pd.DatetimeIndex(df.index)
+    tz = index.tz
+    # Bin on the wall clock time
+    times = (index.tz_localize(None) if tz is not None else index).asi8
+    bins = groupBins(times, minutes, anchor)
+    if bins is None:
+        return df[OHLCV].copy()
+
+    labels, starts, ends = bins
+    d = dict()
+    d['open'] = df['open'].to_numpy()[starts]
+    d['high'] = np.fmax.reduceat(df['high'].to_numpy(), starts)
+    d['low'] = np.fmin.reduceat(df['low'].to_numpy(), starts)
+    d['close'] = df['close'].to_numpy()[ends]
+    d['volume'] = np.add.reduceat(df['volume'].to_numpy(), starts)
+    newIndex = pd.DatetimeIndex(labels)
+    if tz is not None:
+        newIndex = newIndex.tz_localize(tz, ambiguous='NaT', nonexistent='NaT')
+    newIndex.name = df.index.name
+    return pd.DataFrame(d, index=newIndex, columns=OHLCV)
@@ -0,0 +1,128 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''
+Coalesce identical requests that are in flight at the same time. The first caller for a key
+makes the call. Callers that arrive before it finishes wait for its result instead of making
+their own. Threads and asyncio tasks share the same calls, so a batch job mixing both still
+sends one request.
+
+@author: Mike Petersen
+
+@creation_date: 10/18/26
+'''
+import asyncio
+from concurrent.futures import Future
+import threading
+
+
+class Call:
+    '''A call in flight and the number of callers waiting on it'''
+    def __init__(self):
+        self.future = Future()
+        self.waiting = 0
+
+
+class SingleFlight:
+    '''
+    The calls in flight by key.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = dict()
+
+    def join(self, key):
+        '''
+        :return: (call, leader). The leader must call finish.
+        '''
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = self.calls[key] = Call()
+                return call, True
+            call.waiting += 1
+            return call, False
+
+    def finish(self, key, call, result=None, ex=None):
+        '''
+        Give the result or the exception to the waiting callers.
+        :return: True if any caller waited on the call
+        '''
+        with self.lock:
+            del self.calls[key]
+        if ex is not None:
+            call.future.set_exception(ex)
+        else:
+            call.future.set_result(result)
+        return call.waiting > 0
+
+    def do(self, key, fn, share=None):
+        '''
+        Call fn unless a call for key is in flight, in which case wait for its result.
+        :params key: A hashable identifying the request
+        :params fn: A callable without arguments
+        :params share: A callable that copies a result. If given, every caller that shares a
+            result gets its own copy so none of them can change what the others see.
+        :return: The result of fn
+        :raise: The exception fn raised, in every caller
+        '''
+        call, leader = self.join(key)
+        if not leader:
+            result = call.future.result()
+            return share(result) if share else result
+        try:
+            result = fn()
+        except BaseException as ex:
+            self.finish(key, call, ex=ex)
+            raise
+        shared = self.finish(key, call, result)
+        return share(result) if share and shared else result
+
+    async def ado(self, key, fn, share=None):
+        '''
+        The coroutine version of do.
+        :params fn: A coroutine function without arguments
+        '''
+        call, leader = self.join(key)
+        if not leader:
+            # Shielded so a cancelled caller does not cancel the call for the others
+            result = await asyncio.shield(asyncio.wrap_future(call.future))
+            return share(result) if share else result
+        try:
+            result = await fn()
+        except BaseException as ex:
+            self.finish(key, call, ex=ex)
+            raise
+        shared = self.finish(key, call, result)
+        return share(result) if share and shared else result
+
+    def inFlight(self):
+        with self.lock:
+            return len(self.calls)
+
+
+FLIGHT = None
+_flightLock = threading.Lock()
+
+
+def getSingleFlight():
+    '''Get the process wide SingleFlight'''
+    global FLIGHT
+    if FLIGHT is None:
+        with _flightLock:
+            if FLIGHT is None:
+                FLIGHT = SingleFlight()
+    return FLIGHT
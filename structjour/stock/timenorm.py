@@ -0,0 +1,67 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''
+Time normalization shared by the apis. Structjour charts use naive timestamps showing New York
+time. The apis send aware time strings or unix times. These functions convert whole arrays at
+once and use the New York offset of each bar, so data that spans a DST change is correct.
+
+@author: Mike Petersen
+
+@creation_date: 10/18/26
+'''
+import numpy as np
+import pandas as pd
+
+NY = 'US/Eastern'
+
+
+def toNYNaive(values, unit=None):
+    '''
+    Convert aware time strings, aware datetimes or unix times to naive New York time.
+    Strings without an offset are taken to be UTC.
+    :params values: An array like of times
+    :params unit: For numeric values, the unit of the epoch time, e.g. 's' or 'ms'
+    :return: A naive DatetimeIndex
+    '''
+    times = pd.to_datetime(values, utc=True, unit=unit)
+    if not isinstance(times, pd.DatetimeIndex):
+        times = pd.DatetimeIndex(times)
+    return times.tz_convert(NY).tz_localize(None)
+
+
+def unix2NY(values):
+    '''
+    Convert unix times in seconds to naive New York time.
+    :params values: An array like of ints
+    :return: A naive DatetimeIndex
+    '''
+    return toNYNaive(values, unit='s')
+
+
+def NY2unix(values):
+    '''
+    Convert naive New York times to unix times in seconds.
+    :params values: A naive datetime, Timestamp, time string or array like of them
+    :return: An int for a single value, otherwise an int64 ndarray
+    '''
+    scalar = not pd.api.types.is_list_like(values)
+    times = pd.DatetimeIndex([values] if scalar else values)
+    # An ambiguous time, in the hour repeated in the fall, is taken as the first (DST) hour
+    times = times.tz_localize(NY, ambiguous=np.ones(len(times), dtype=bool),
+                              nonexistent='shift_forward')
+    secs = times.asi8 // 10**9
+    return int(secs[0]) if scalar else secs
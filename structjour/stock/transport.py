@@ -0,0 +1,209 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+'''
+The HTTP transport shared by the REST apis. One requests.Session is kept for each host so the
+connections are pooled and kept alive between calls. Every request has a connect and read
+timeout and is retried with exponential backoff on 429 and 5xx responses and on connection
+failures. After the last retry the final response is returned to the caller as usual.
+aget is the coroutine version. It uses aiohttp if it is installed, otherwise it runs get in the
+default executor. aiohttp is imported on the first async request, not with this module.
+
+@author: Mike Petersen
+
+@creation_date: 10/18/26
+'''
+import asyncio
+import json
+import threading
+from urllib.parse import urlparse
+import weakref
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+
+# The aiohttp module, None if it is not installed. False until the first async request
+_aiohttp = False
+
+# (connect, read) timeout in seconds
+TIMEOUT = (5, 30)
+RETRIES = 3
+BACKOFF = 0.5
+RETRY_STATUS = (429, 500, 502, 503, 504)
+POOLSIZE = 10
+
+_sessions = dict()
+_lock = threading.Lock()
+# event loop: aiohttp.ClientSession. An aiohttp session belongs to one loop
+_asessions = weakref.WeakKeyDictionary()
+
+
+def configure(connect=None, read=None, retries=None, backoff=None, poolsize=None):
+    '''
+    Change the transport settings. Sessions already created are closed and recreated with the
+    new settings on the next request.
+    :params connect: Connect timeout in seconds
+    :params read: Read timeout in seconds
+    :params retries: The number of retries for failed connections, 429 and 5xx responses
+    :params backoff: The backoff factor. The sleep between retries is backoff * 2 ** (retry - 1)
+    :params poolsize: The number of connections kept alive for each host
+    '''
+    global TIMEOUT, RETRIES, BACKOFF, POOLSIZE
+    TIMEOUT = (connect if connect is not None else TIMEOUT[0],
+               read if read is not None else TIMEOUT[1])
+    RETRIES = retries if retries is not None else RETRIES
+    BACKOFF = backoff if backoff is not None else BACKOFF
+    POOLSIZE = poolsize if poolsize is not None else POOLSIZE
+    closeAll()
+
+
+def makeSession():
+    '''Create a Session with a pooled, retrying adapter'''
+    retry = Retry(total=RETRIES, connect=RETRIES, read=RETRIES, status=RETRIES,
+                  backoff_factor=BACKOFF, status_forcelist=RETRY_STATUS,
+                  allowed_methods=frozenset(['GET']), raise_on_status=False,
+                  respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOLSIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def getSession(url):
+    '''Get the Session for the host in url, creating it on first use'''
+    u = urlparse(url)
+    host = f'{u.scheme}://{u.netloc}'
+    session = _sessions.get(host)
+    if session is None:
+        with _lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = makeSession()
+                _sessions[host] = session
+    return session
+
+
+def get(url, params=None, headers=None, timeout=None):
+    '''
+    Send a GET request using the pooled session for the host.
+    :params timeout: Override the default (connect, read) timeout
+    :return: requests.Response
+    :raise: requests.exceptions.ConnectionError and Timeout when the retries are exhausted
+    '''
+    timeout = timeout if timeout else TIMEOUT
+    try:
+        return getSession(url).get(url, params=params, headers=headers, timeout=timeout)
+    except requests.exceptions.ConnectionError as ex:
+        # When the retries of a read timeout run out, requests raises ConnectionError for the
+        # MaxRetryError. The server is slow, not unreachable
+        reason = getattr(ex.args[0], 'reason', None) if ex.args else None
+        if isinstance(reason, ReadTimeoutError):
+            raise requests.exceptions.ReadTimeout(ex, request=ex.request, response=ex.response) from ex
+        raise
+
+
+def closeAll():
+    '''Close all the pooled sessions'''
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+class AsyncResponse:
+    '''The parts of requests.Response the apis use, for the responses from aiohttp'''
+    def __init__(self, status_code, content, url, headers):
+        self.status_code = status_code
+        self.content = content
+        self.url = url
+        self.headers = headers
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def getAiohttp():
+    '''Import aiohttp on first use. None if it is not installed'''
+    global _aiohttp
+    if _aiohttp is False:
+        try:
+            import aiohttp
+        except ImportError:
+            aiohttp = None
+        _aiohttp = aiohttp
+    return _aiohttp
+
+
+def getAsyncSession():
+    '''Get the aiohttp session for the running event loop, creating it on first use'''
+    aiohttp = getAiohttp()
+    loop = asyncio.get_running_loop()
+    session = _asessions.get(loop)
+    if session is None or session.closed:
+        timeout = aiohttp.ClientTimeout(sock_connect=TIMEOUT[0], sock_read=TIMEOUT[1])
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit_per_host=POOLSIZE),
+                                        timeout=timeout)
+        _asessions[loop] = session
+    return session
+
+
+async def aget(url, params=None, headers=None, timeout=None):
+    '''
+    Send a GET request without blocking the event loop. Retries like get.
+    :params timeout: Override the default (connect, read) timeout
+    :return: requests.Response or AsyncResponse. Both have status_code, content, text, url
+        and json()
+    :raise: requests.exceptions.ConnectionError and Timeout when the retries are exhausted
+    '''
+    aiohttp = getAiohttp()
+    if aiohttp is None:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: get(url, params=params, headers=headers,
+                                                            timeout=timeout))
+    timeout = timeout if timeout else TIMEOUT
+    ctimeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+    session = getAsyncSession()
+    for retry in range(RETRIES + 1):
+        sleep = BACKOFF * 2 ** retry
+        try:
+            async with session.get(url, params=params, headers=headers, timeout=ctimeout) as r:
+                content = await r.read()
+                if r.status not in RETRY_STATUS or retry == RETRIES:
+                    return AsyncResponse(r.status, content, str(r.url), r.headers)
+                after = r.headers.get('Retry-After', '')
+                if after.isdigit():
+                    sleep = max(sleep, int(after))
+        except asyncio.TimeoutError as ex:
+            if retry == RETRIES:
+                raise requests.exceptions.Timeout(str(ex))
+        except aiohttp.ClientConnectionError as ex:
+            if retry == RETRIES:
+                raise requests.exceptions.ConnectionError(str(ex))
+        await asyncio.sleep(sleep)
+
+
+async def acloseAll():
+    '''Close the aiohttp session of the running event loop'''
+    session = _asessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
@@ -29,54 +29,44 @@ import logging
 import os
 import random
 import sys
+import time
 
-from structjour.models.meta import ModelBase
-from structjour.models.api_keymodel import ApiKey
+from structjour.config import getSettings
+from structjour.stock.nysecalendar import getCalendar
+from structjour.stock.ratelimit import getLimiter, MAXWAIT
+from structjour.stock.timenorm import toNYNaive
 
 import numpy as np
 import pandas as pd
-from sqlalchemy.sql import text
-from PyQt5.QtCore import QSettings, QDate, QDateTime
-from PyQt5.QtWidgets import QMessageBox
-from PyQt5.QtGui import QIcon
 
 
-def setLimitReached(token, resetTime, settings=None):
-    if token not in ['av', 'bc', 'fh']:
+def setLimitReached(token, resetTime):
+    '''
+    The api rejected us for exceeding its quota. Block requests to it until resetTime.
+    :params resetTime: Naive local time
+    '''
+    if token not in ['av', 'bc', 'fh', 'tgo']:
         raise ValueError(f'Not a valid stock api token: {token}')
-    if settings is None:
-        settings = QSettings('zero_substance/stockapi', 'structjour')
-    token = token + 'limitreached'
     resetTime = pd.Timestamp(resetTime)
-    now = pd.Timestamp.now()
-    if now > resetTime:
-        settings.remove(token)
-    else:
-        settings.setValue(token, resetTime)
-
+    getLimiter().block(token, time.mktime(resetTime.timetuple()))
 
-def getLimitReached(token, settings=None):
 
+def getLimitReached(token, maxWait=MAXWAIT):
+    '''
+    Return True if the api is blocked or its rate limit would make a request wait longer
+    than maxWait seconds.
+    '''
     if token not in ['av', 'bc', 'fh', 'tgo']:
         raise ValueError(f'Not a valid stock api token: {token}')
-    if token == 'tgo':
-        # Tiingo limit is 500/hr, 20k/month. For now while building it, treat as no limit
-        return False
-    if settings is None:
-        settings = QSettings('zero_substance/stockapi', 'structjour')
-
-    resetTime = settings.value(token + 'limitreached', None)
-    if resetTime is None: return False
-
-    now = pd.Timestamp.now()
-    if now <= resetTime:
-        return True
-    settings.remove(token + 'limitreached')
-    return False
+    return getLimiter().wait(token) > maxWait
 
 
 def qtime2pd(qdt):
     '''Return a pandas Timestamp from a QDateTime'''
+    try:
+        from PyQt5.QtCore import QDate, QDateTime
+    except ImportError:
+        return qdt
     if isinstance(qdt, QDateTime):
         d = pd.Timestamp(qdt.date().year(),
                          qdt.date().month(),
@@ -98,6 +88,7 @@ def pd2qtime(pdt, qdate=False):
     Return a QDateTime or a QDate from a time object of Timestamp
     :qdate: Return QDateTime if False (by default) and QDate if True
     '''
+    from PyQt5.QtCore import QDate, QDateTime
     if not qdate:
         if isinstance(pdt, (QDate, QDateTime)):
             return QDateTime(pdt)
@@ -123,13 +114,14 @@ def getMAKeys():
 
 
 def getMASettings():
-    chartSet = QSettings('zero_substance/chart', 'structjour')
-    mas = chartSet.value('getmas', list)
+    chartSet = getSettings('zero_substance/chart', 'structjour')
+    mas = chartSet.value('getmas', [[], []])
     maDict = OrderedDict()
-    for ma in mas[0]:
+    for ma in (mas[0] if mas else []):
         maDict[ma[1]] = [ma[0], ma[2]]
     vwap = []
-    if mas[1]:
+    # [] or ['vwap', color] when VWAP is on
+    if mas and len(mas) > 1 and mas[1] and len(mas[1]) > 1:
         vwap.append(['vwap', mas[1][1]])
 
     return maDict, vwap
@@ -159,24 +151,34 @@ def vwap(df, bd=None):
 
 
 def excludeAfterHours(string=False):
-    chartSet = QSettings('zero_substance/chart', 'structjour')
+    chartSet = getSettings('zero_substance/chart', 'structjour')
     if string:
         return chartSet.value('afterhours', 'false')
     return chartSet.value('afterhours', False, type=bool)
 
 
-def movingAverage(values, df, beginDay=None):
+def movingAverage(values, df, beginDay=None, key=None):
     '''
     Creates a dictionary of moving averages based settings values. All window values in
     chartSettings will be processed. Returns a dict of MA: SMA for windows of 20 or less
     and EMA for windows greater than 20, and it always process and returns VWAP.
     :values:
+    :params key: (symbol, api, interval). If given, the IndicatorEngine keeps the result and
+        later calls for the same candles with new candles appended only compute the new ones.
     :return: A tuple (maDict, vwap). Keys for maDict are the window val
     '''
     mas = getMASettings()
     windows = list()
     windows = list(mas[0].keys())
 
+    if key is not None:
+        # Keyed like the bar store, whose days the engine resumes from. Imported here, the store
+        # needs pyarrow
+        from structjour.stock.barstore import storeInterval
+        symbol, api, interval = key
+        key = (symbol, api, storeInterval(interval, not excludeAfterHours()))
+        return getIndicatorEngine().movingAverages(key, df, windows, bool(mas[1]), beginDay)
+
     maDict = OrderedDict()
 
     for ma in windows:
@@ -202,6 +204,12 @@ def movingAverage(values, df, beginDay=None):
     return maDict
 
 
+def getIndicatorEngine():
+    '''Get the IndicatorEngine, using the bar store for its saved state if it is in use'''
+    from structjour.stock.indicators import getEngine
+    return getEngine()
+
+
 def makeupEntries(df, minutes):
     if df.empty:
         return []
@@ -241,23 +249,20 @@ def makeupEntries(df, minutes):
 
 def getLastWorkDay(d=None):
     '''
-    Retrieve the last biz day from today or from d if the arg is given. Holidays are ignored
+    Retrieve the last NYSE session from today or from d if the arg is given.
     :params d: A datetime object.
-    :return: A datetime object of the last biz day.
+    :return: A datetime object of the last biz day, keeping the time of d.
     '''
     now = dt.datetime.today() if not d else d
-    deltDays = 0
-    if now.weekday() > 4:
-        deltDays = now.weekday() - 4
-    bizday = now - dt.timedelta(days=deltDays)
+    session = getCalendar().sessionAtOrBefore(now)
+    bizday = now - dt.timedelta(days=(now.date() - session.date()).days)
     return bizday
 
 
 def getPrevTuesWed(td):
     '''
-    Utility method to get a probable market open day prior to td. The least likely
-    closed days are Tuesday and Wednesday. This will occassionally return  a closed
-    day but wtf.
+    Utility method to get a market open day prior to td. The least likely
+    closed days are Tuesday and Wednesday. If that one is a holiday, go back a week.
     :params td: A Datetime object
     '''
     deltdays = 7
@@ -270,32 +275,42 @@ def getPrevTuesWed(td):
     else:
         deltdays = 4
     before = td - dt.timedelta(deltdays)
+    cal = getCalendar()
+    while not cal.isSession(before):
+        before = before - dt.timedelta(7)
     return before
 
 
 def clearTables(db):
+    from sqlalchemy.sql import text
+    from structjour.models.meta import ModelBase
     statements = ['delete from chart', 'delete from holidays', 'delete from ib_covered',
                  'delete from ib_trades', 'delete from ib_positions', 'delete from trade_sum']
     for statement in statements:
         ModelBase.engine.execute(text(statement))
 
+# The db files whose api_keys table has been created in this process
+_keyTables = set()
+
+
 class ManageKeys:
     def __init__(self, create=False, db=None):
-        self.settings = QSettings('zero_substance', 'structjour')
-        self.apiset = QSettings('zero_substance/stockapi', 'structjour')
+        self.settings = getSettings('zero_substance', 'structjour')
+        self.apiset = getSettings('zero_substance/stockapi', 'structjour')
         self.db = db
         if not self.db:
             self.setDB()
 
-        if self.db or create:
+        if create or (self.db and self.db not in _keyTables):
             self.createTables()
+            _keyTables.add(self.db)
 
     def getKeyDict(self):
+        from structjour.models.api_keymodel import ApiKey
+        keys = ApiKey.loadKeys()
         keydict = {}
-        keydict['bc'] = self.getKey('bc')
-        keydict['av'] = self.getKey('av')
-        keydict['fh'] = self.getKey('fh')
-        keydict['tgo'] = self.getKey('tgo')
+        for api in ['bc', 'av', 'fh', 'tgo']:
+            keydict[api] = keys.get(api)
         return keydict
 
     def getDB(self):
@@ -306,20 +321,27 @@ class ManageKeys:
         Creates the api_keys if it doesnt exist then adds a row for each api that requires a key
         if they dont exist
         '''
+        from structjour.models.meta import ModelBase
+        from structjour.models.api_keymodel import ApiKey
         ModelBase.connect(new_session=True)
 
         ModelBase.createAll()
         curapis = ['fh', 'av', 'bc', 'tgo']      # When this info changes, Use the apisettings control to abstract the data
-        addit = False
+        keys = ApiKey.loadKeys()
         for api in curapis:
-            key = ApiKey.getKey(api, keyonly=False)
-            if not key:
+            if api not in keys:
                 ApiKey.addKey(api)
 
     def updateKey(self, api, key):
+        from structjour.models.api_keymodel import ApiKey
         return ApiKey.updateKey(api, key)
 
+    def removeKey(self, api):
+        from structjour.models.api_keymodel import ApiKey
+        return ApiKey.removeKey(api)
+
     def getKey(self, api):
+        from structjour.models.api_keymodel import ApiKey
         return ApiKey.getKey(api)
 
     def setDB(self, db=None):
@@ -337,6 +359,15 @@ class ManageKeys:
                    '<p>Please set a valid location when calling setDB or you may select or '
                    'create a new location by selecting file->filesettings</p>')
 
+            try:
+                from PyQt5.QtWidgets import QApplication, QMessageBox
+                from PyQt5.QtGui import QIcon
+            except ImportError:
+                QApplication = None
+            if QApplication is None or QApplication.instance() is None:
+                # No gui to show it in, a worker or the command line
+                logging.warning('The trade db location does not exist. Set it in file->filesettings')
+                return
             msgbx = QMessageBox(QMessageBox.Warning, title, msg, QMessageBox.Ok)
             msgbx.setWindowIcon(QIcon("structjour/images/ZSLogo.png"))
             msgbx.exec()
@@ -353,7 +384,7 @@ class ManageKeys:
 
 class IbSettings:
     def __init__(self):
-        self.apiset = QSettings('zero_substance/stockapi', 'structjour')
+        self.apiset = getSettings('zero_substance/stockapi', 'structjour')
         p = self.apiset.value('APIPref')
         if p:
             p = p.replace(' ', '')
@@ -387,37 +418,36 @@ class IbSettings:
         return d
 
 
+_gotIbapi = None
+
+
 def checkForIbapi():
     '''
-    If the ibapi is not installed or available, disable its use.
+    If the ibapi is not installed or available, disable its use. The check is done once.
     '''
-    apisettings = QSettings('zero_substance/stockapi', 'structjour')
+    global _gotIbapi
+    if _gotIbapi is not None:
+        return _gotIbapi
+    apisettings = getSettings('zero_substance/stockapi', 'structjour')
     try:
         import ibapi     # noqa: F401
-        apisettings.setValue('gotibapi', True)
-        return True
-
+        _gotIbapi = True
     except ImportError:
-        apisettings.setValue('gotibapi', False)
-        return False
+        _gotIbapi = False
+    apisettings.setValue('gotibapi', _gotIbapi)
+    return _gotIbapi
 
 def dictDate2NYTime(d):
     '''
-    Get the offset for ny time on the last index time and set
-    the date values to a naive Timestamp adjusted from Grenwich (Aware) to NY Naive
-    Note this returns the time index in terms of the end time. 
+    Set the date values to a naive Timestamp adjusted from Grenwich (Aware) to NY Naive. Each
+    date gets its own New York offset so data spanning a DST change is correct.
+    Note this returns the time index in terms of the end time.
     :params d: A list of dict that includes 'date' as a key
     '''
-    # Creates an aware ts from date string 
-    end = pd.Timestamp(d[-1]['date'])
-    # Gets the delta for end in NY tz
-    delt = pd.Timestamp(end.strftime('%Y-%m-%d %H:%M:%S'), tz='US/Eastern').utcoffset() 
-    # add the delta to each date and create a naive ts 
-    for t in d:
-        newdate = pd.Timestamp(t['date'])
-        t['date'] = pd.Timestamp(newdate.strftime('%Y-%m-%d %H:%M:%S')) + delt
+    dates = toNYNaive([t['date'] for t in d])
+    for t, newdate in zip(d, dates):
+        t['date'] = newdate
     return d
-    
 
 
 def notmain():
@@ -0,0 +1,61 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Fake candles and a fake clock shared by the tests. Nothing here goes to the network.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+import numpy as np
+import pandas as pd
+
+
+def makeCandles(start='2020-12-01 09:30', periods=78, minutes=1, seed=7):
+    '''Return a DataFrame of periods random candles beginning at start'''
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 0.2, periods))
+    opn = np.r_[100, close[:-1]]
+    high = np.maximum(opn, close) + rng.uniform(0, 0.2, periods)
+    low = np.minimum(opn, close) - rng.uniform(0, 0.2, periods)
+    volume = rng.integers(100, 1000, periods)
+    index = pd.date_range(start, periods=periods, freq=f'{minutes}min')
+    return pd.DataFrame({'open': opn, 'high': high, 'low': low, 'close': close, 'volume': volume},
+                        index=index)
+
+
+def makeDays(days, minutes=1, seed=7):
+    '''Return the regular session candles, 9:30 to 16:00, for each of days'''
+    frames = []
+    for i, day in enumerate(days):
+        start = pd.Timestamp(day) + pd.Timedelta(hours=9, minutes=30)
+        frames.append(makeCandles(start, 390 // minutes, minutes, seed + i))
+    return pd.concat(frames)
+
+
+class Clock:
+    '''A clock that moves only when it is told to or when sleep is called'''
+    def __init__(self, now=0.0):
+        self.now = now
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, secs):
+        self.slept.append(secs)
+        self.now += secs
@@ -0,0 +1,336 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Test code for the apichooser module. The apis are replaced by fake data methods, so nothing
+goes to the network.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import requests
+
+from structjour import config
+from structjour.stock.apichooser import APIChooser, asyncProvider
+from structjour.stock import transport
+from structjour.stock.barstore import BarStore, storeInterval
+from structjour.stock.intradaycache import IntradayCache
+from structjour.stock.singleflight import SingleFlight
+from structjour.stock.utilities import getMASettings
+
+from helpers import makeDays
+
+KEYS = {'bc': 'key', 'av': 'key', 'fh': 'key', 'tgo': 'key'}
+
+
+def runVwap(df):
+    '''VWAP from the open of the first day, carried across the days like a provider does it'''
+    price = (df.high + df.low + df.close) / 3
+    return (df.volume * price).cumsum() / df.volume.cumsum()
+
+
+def dayVwap(df, day):
+    day = df.loc[df.index.normalize() == pd.Timestamp(day)]
+    return runVwap(day)
+
+
+class Provider:
+    '''A fake data method returning the candles in df and the moving averages in the settings'''
+    def __init__(self, df, delay=0, ex=None):
+        self.df = df
+        self.delay = delay
+        self.ex = ex
+        self.calls = []
+
+    def __call__(self, symbol, start, end, minutes, key=None):
+        self.calls.append((symbol, pd.Timestamp(start), pd.Timestamp(end), minutes))
+        if self.delay:
+            time.sleep(self.delay)
+        if self.ex is not None:
+            raise self.ex
+        df = self.df.loc[(self.df.index >= pd.Timestamp(start)) & (self.df.index <= pd.Timestamp(end))]
+        ma = {w: df.close.rolling(w).mean() for w in getMASettings()[0]}
+        ma['vwap'] = runVwap(df)
+        return {'code': 200, 'message': 'fake'}, df.copy(), ma
+
+
+class ChooserTest(unittest.TestCase):
+    '''Runs with headless settings and a temporary bar store'''
+
+    def setUp(self):
+        self.saved = config.BACKEND
+        config.setBackend(config.DictBackend({
+            'chart': {'getmas': [[], ['vwap', 'yellow']], 'afterhours': False},
+            'stockapi': {'APIPref': 'fh', 'useIntradayCache': False, 'useBarStore': False}}), env=False)
+        self.root = tempfile.mkdtemp()
+        self.store = BarStore(self.root, 'pkl')
+
+    def tearDown(self):
+        config.BACKEND = self.saved
+        shutil.rmtree(self.root)
+
+    def chooser(self, providers, **kw):
+        chooser = APIChooser(config.getSettings('zero_substance/stockapi'), orprefs=list(providers),
+                             keydict=KEYS, store=kw.pop('store', self.store), flight=SingleFlight(), **kw)
+        patcher = mock.patch.object(chooser, 'apiChooser', lambda api=None: providers[api or chooser.api])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return chooser
+
+
+class TestStore(ChooserTest):
+
+    def test_multiDayVwap(self):
+        '''A run of two days is stored with each day's VWAP beginning at its own open'''
+        df = makeDays(['2020-12-01', '2020-12-02'])
+        fake = Provider(df)
+        chooser = self.chooser({'fh': fake})
+        meta, got, ma = chooser.fetchIntraday('SQ', '2020-12-01 09:30', '2020-12-02 16:00', 1, 'fh')
+        self.assertEqual(len(fake.calls), 1)
+
+        expected = dayVwap(df, '2020-12-02')
+        # What the provider returned for day 2 is not the day's VWAP
+        self.assertFalse(np.allclose(runVwap(df).loc[expected.index], expected))
+        stored = self.store.getDay('SQ', 'fh', 1, '2020-12-02')
+        np.testing.assert_allclose(stored['vwap'], expected)
+        np.testing.assert_allclose(ma['vwap'].loc[expected.index], expected)
+
+        # A later request for day 2 alone is served from the store
+        meta, got, ma = chooser.get_intraday('SQ', '2020-12-02 09:30', '2020-12-02 16:00', 1)
+        self.assertEqual(len(fake.calls), 1)
+        np.testing.assert_allclose(ma['vwap'], expected)
+
+    def test_newMa(self):
+        '''Stored days without a moving average added to the settings are fetched again'''
+        df = makeDays(['2020-12-01', '2020-12-02'])
+        fake = Provider(df)
+        chooser = self.chooser({'fh': fake})
+        chooser.get_intraday('SQ', '2020-12-01 09:30', '2020-12-02 16:00', 1)
+        self.assertEqual(len(fake.calls), 1)
+
+        config.getSettings('zero_substance/chart').setValue('getmas', [[[9, 9, 'red']], ['vwap', 'yellow']])
+        meta, got, ma = chooser.get_intraday('SQ', '2020-12-01 09:30', '2020-12-02 16:00', 1)
+        self.assertEqual(meta['code'], 200)
+        self.assertEqual(len(got), len(df))
+        self.assertEqual(len(fake.calls), 2)
+        self.assertIn(9, ma)
+        self.assertIn('ma9', self.store.getDay('SQ', 'fh', 1, '2020-12-02').columns)
+
+        chooser.get_intraday('SQ', '2020-12-01 09:30', '2020-12-02 16:00', 1)
+        self.assertEqual(len(fake.calls), 2)
+
+    def test_afterHoursKey(self):
+        '''Days requested without the after hours data do not serve requests with it'''
+        df = makeDays(['2020-12-01'])
+        fake = Provider(df)
+        chooser = self.chooser({'fh': fake})
+        chooser.fetchIntraday('SQ', '2020-12-01 09:30', '2020-12-01 16:00', 1, 'fh')
+        self.assertTrue(self.store.hasDay('SQ', 'fh', storeInterval(1, True), '2020-12-01'))
+
+        config.getSettings('zero_substance/chart').setValue('afterhours', True)
+        self.assertIsNone(chooser.getStoredIntraday('SQ', '2020-12-01 09:30', '2020-12-01 16:00', 1))
+        chooser.fetchIntraday('SQ', '2020-12-01 09:30', '2020-12-01 16:00', 1, 'fh')
+        self.assertEqual(len(fake.calls), 2)
+        self.assertTrue(self.store.hasDay('SQ', 'fh', storeInterval(1, False), '2020-12-01'))
+
+
+class TestCache(ChooserTest):
+
+    def test_afterHoursKey(self):
+        '''A result cached without the after hours data does not serve a request with it'''
+        df = makeDays(['2020-12-01'])
+        fake = Provider(df)
+        chooser = self.chooser({'fh': fake}, store=None, cache=IntradayCache())
+        for i in range(2):
+            chooser.get_intraday('SQ', '2020-12-01 09:30', '2020-12-01 16:00', 1)
+        self.assertEqual(len(fake.calls), 1)
+
+        config.getSettings('zero_substance/chart').setValue('afterhours', True)
+        chooser.get_intraday('SQ', '2020-12-01 09:30', '2020-12-01 16:00', 1)
+        self.assertEqual(len(fake.calls), 2)
+
+
+class TestHedge(ChooserTest):
+    '''getHedgedIntraday with fake apis'''
+    START = pd.Timestamp('2020-12-01 09:30')
+    END = pd.Timestamp('2020-12-01 16:00')
+
+    def hedged(self, providers, hedge=2):
+        chooser = self.chooser(providers, store=None, hedge=hedge)
+        patcher = mock.patch.object(chooser, 'apiChooserList', return_value=(False, [], list(providers)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return chooser
+
+    def test_fastest(self):
+        '''The first good response wins and the slow api is not waited on'''
+        df = makeDays(['2020-12-01'])
+        slow = Provider(df, delay=1.0)
+        fast = Provider(df.iloc[:100])
+        chooser = self.hedged({'fh': slow, 'tgo': fast})
+        t = time.perf_counter()
+        meta, got, ma = chooser.getIntradayUncached('SQ', self.START, self.END, 1)
+        self.assertLess(time.perf_counter() - t, 0.9)
+        self.assertEqual(chooser.api, 'tgo')
+        self.assertEqual(len(got), 100)
+        self.assertEqual(len(slow.calls), 1)
+
+    def test_raising(self):
+        '''An api that raises anything is a failed leg, not a failed request'''
+        df = makeDays(['2020-12-01'])
+        chooser = self.hedged({'fh': Provider(df, ex=KeyError('c')), 'tgo': Provider(df, delay=0.1)})
+        meta, got, ma = chooser.getIntradayUncached('SQ', self.START, self.END, 1)
+        self.assertEqual(chooser.api, 'tgo')
+        self.assertEqual(len(got), len(df))
+
+    def test_fallback(self):
+        '''When every hedged api fails, the others are tried one at a time'''
+        df = makeDays(['2020-12-01'])
+        empty = Provider(df.iloc[:0])
+        later = Provider(df)
+        chooser = self.hedged({'fh': Provider(df, ex=ValueError('bad json')), 'tgo': empty, 'bc': later})
+        meta, got, ma = chooser.getIntradayUncached('SQ', self.START, self.END, 1)
+        self.assertEqual(chooser.api, 'bc')
+        self.assertEqual(len(got), len(df))
+        self.assertEqual(len(empty.calls), 1)
+        self.assertEqual(len(later.calls), 1)
+
+
+class TestAsync(ChooserTest):
+    '''aget_intraday with fake apis run through asyncProvider'''
+
+    def achooser(self, providers):
+        chooser = self.chooser(providers)
+        patcher = mock.patch.object(chooser, 'aapiChooser',
+                                    lambda api=None: asyncProvider(providers[api or chooser.api]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(chooser, 'apiChooserList', return_value=(False, [], list(providers)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return chooser
+
+    def offLoop(self, obj, name):
+        '''Record the threads that call obj.name'''
+        threads = []
+        method = getattr(obj, name)
+
+        def wrapper(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return method(*args, **kwargs)
+        patcher = mock.patch.object(obj, name, wrapper)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return threads
+
+    def test_fetch(self):
+        '''The missing days are fetched and stored by day without the loop doing the store io'''
+        df = makeDays(['2020-12-01', '2020-12-02'])
+        fake = Provider(df)
+        chooser = self.achooser({'fh': fake})
+        threads = self.offLoop(self.store, 'putFrame')
+        meta, got, ma = asyncio.run(chooser.aget_intraday('SQ', '2020-12-01 09:30', '2020-12-02 16:00', 1))
+        self.assertEqual(len(fake.calls), 1)
+        self.assertEqual(len(got), len(df))
+        expected = dayVwap(df, '2020-12-02')
+        np.testing.assert_allclose(self.store.getDay('SQ', 'fh', 1, '2020-12-02')['vwap'], expected)
+        self.assertTrue(threads)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_storeHit(self):
+        '''Stored days are read in the executor and no api is called'''
+        df = makeDays(['2020-12-01'])
+        fake = Provider(df)
+        chooser = self.achooser({'fh': fake})
+        chooser.fetchIntraday('SQ', '2020-12-01 09:30', '2020-12-01 16:00', 1, 'fh')
+        threads = self.offLoop(self.store, 'getDays')
+        meta, got, ma = asyncio.run(chooser.aget_intraday('SQ', '2020-12-01 10:00', '2020-12-01 12:00', 1))
+        self.assertEqual(len(fake.calls), 1)
+        self.assertEqual(got.index[0], pd.Timestamp('2020-12-01 10:00'))
+        self.assertEqual(got.index[-1], pd.Timestamp('2020-12-01 12:00'))
+        self.assertTrue(threads)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_timeout(self):
+        '''An api that times out is skipped for the next one'''
+        df = makeDays(['2020-12-01'])
+        slow = Provider(df, ex=requests.exceptions.ReadTimeout('read timed out'))
+        later = Provider(df)
+        chooser = self.achooser({'fh': slow, 'tgo': later})
+        meta, got, ma = asyncio.run(chooser.aget_intraday('SQ', '2020-12-01 09:30', '2020-12-01 16:00', 1))
+        self.assertEqual(len(slow.calls), 1)
+        self.assertEqual(len(later.calls), 1)
+        self.assertEqual(len(got), len(df))
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    '''Answers after a second'''
+    def do_GET(self):
+        time.sleep(1)
+        try:
+            self.send_response(200)
+            self.end_headers()
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTimeout(ChooserTest):
+    '''An api that times out is skipped for the next one'''
+
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/intraday'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.retries = (transport.RETRIES, transport.BACKOFF)
+        transport.configure(retries=1, backoff=0.01)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        transport.configure(retries=self.retries[0], backoff=self.retries[1])
+        super().tearDown()
+
+    def test_slowApi(self):
+        df = makeDays(['2020-12-01'])
+
+        def slow(symbol, start, end, minutes, key=None):
+            transport.get(self.url, timeout=(1, 0.1))
+
+        later = Provider(df)
+        chooser = self.chooser({'fh': slow, 'tgo': later}, store=None)
+        meta, got, ma = chooser.getIntradayUncached('SQ', '2020-12-01 09:30', '2020-12-01 16:00', 1)
+        self.assertEqual(chooser.api, 'tgo')
+        self.assertEqual(len(got), len(df))
+
+
+if __name__ == '__main__':
+    unittest.main()
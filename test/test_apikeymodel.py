@@ -0,0 +1,108 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Test code for the api_keymodel module.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from structjour.models.api_keymodel import ApiKey
+from structjour.models.meta import ModelBase
+from structjour.stock import mytiingo
+from structjour.stock.utilities import ManageKeys
+
+
+class TestApiKey(unittest.TestCase):
+    '''Test the cached api keys. Uses a temporary db and restores the tradeDb setting'''
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = os.path.join(self.dir, 'keys.sqlite')
+        open(self.db, 'w').close()
+        self.saved = ModelBase.settings.value('tradeDb')
+        ModelBase.settings.setValue('tradeDb', self.db)
+        ApiKey.invalidate()
+
+    def tearDown(self):
+        if self.saved is None:
+            ModelBase.settings.remove('tradeDb')
+        else:
+            ModelBase.settings.setValue('tradeDb', self.saved)
+        ApiKey.invalidate()
+        shutil.rmtree(self.dir)
+
+    def test_getKeys(self):
+        '''One query loads the keys. Changing a key reloads them'''
+        mk = ManageKeys(create=True)
+        self.assertEqual(mk.getKeyDict(), {'bc': '', 'av': '', 'fh': '', 'tgo': ''})
+
+        connect = ModelBase.connect
+        calls = []
+
+        def spy(*args, **kwargs):
+            calls.append(1)
+            return connect(*args, **kwargs)
+        ModelBase.connect = spy
+        try:
+            for i in range(3):
+                mk.getKey('fh')
+                mk.getKeyDict()
+            self.assertEqual(calls, [])
+            mk.updateKey('fh', 'abc')
+            self.assertEqual(mk.getKey('fh'), 'abc')
+            self.assertEqual(mk.getKey('fh'), 'abc')
+            mk.removeKey('fh')
+            self.assertIsNone(mk.getKey('fh'))
+        finally:
+            ModelBase.connect = connect
+        # update, its reload, remove and its reload
+        self.assertEqual(len(calls), 4)
+
+    def test_readDuringChange(self):
+        '''A read as the cache is cleared does not keep the old key'''
+        mk = ManageKeys(create=True)
+        mk.updateKey('fh', 'old')
+        invalidate = ApiKey.invalidate.__func__
+
+        def reread(cls):
+            invalidate(cls)
+            cls.loadKeys()
+        with mock.patch.object(ApiKey, 'invalidate', classmethod(reread)):
+            mk.updateKey('fh', 'new')
+            self.assertEqual(mk.getKey('fh'), 'new')
+            mk.removeKey('fh')
+            self.assertIsNone(mk.getKey('fh'))
+
+    def test_tiingoKey(self):
+        '''Tiingo uses the key in the database after it changes'''
+        mk = ManageKeys(create=True)
+        mk.updateKey('tgo', 'one')
+        self.assertEqual(mytiingo.getHeaders()['Authorization'], 'Token one')
+        mk.updateKey('tgo', 'two')
+        self.assertEqual(mytiingo.getHeaders()['Authorization'], 'Token two')
+        self.assertEqual(mytiingo.getHeaders('three')['Authorization'], 'Token three')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Test code for the backfill module.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from structjour import config
+from structjour.stock import backfill as bf
+from structjour.stock.apichooser import APIChooser
+from structjour.stock.barstore import BarStore, sessionDays
+from structjour.stock.ratelimit import RateLimiter
+from structjour.stock.singleflight import SingleFlight
+
+from helpers import makeDays
+
+
+class Chooser:
+    '''Stands in for APIChooser, storing a bar for each requested day'''
+    def __init__(self, store, tokens):
+        self.store = store
+        self.suggested = tokens
+        self.calls = []
+
+    def apiChooserList(self, start, end):
+        return False, [], list(self.suggested)
+
+    def fetchIntraday(self, symbol, start, end, minutes, token):
+        self.calls.append((symbol, token, start, end))
+        if symbol == 'BAD':
+            raise KeyError('c')
+        idx = [d + pd.Timedelta(hours=9, minutes=30) for d in sessionDays(start, end)]
+        df = pd.DataFrame({'open': 1.0, 'high': 1.0, 'low': 1.0, 'close': 1.0, 'volume': 1},
+                          index=pd.DatetimeIndex(idx))
+        self.store.putFrame(symbol, token, minutes, df)
+        return {'code': 200}, df, {}
+
+
+def vwap(df):
+    price = (df.high + df.low + df.close) / 3
+    return (df.volume * price).cumsum() / df.volume.cumsum()
+
+
+class Provider:
+    '''A fake data method with VWAP carried across the days of the request like an api does'''
+    def __init__(self, df):
+        self.df = df
+        self.calls = []
+
+    def __call__(self, symbol, start, end, minutes, key=None):
+        self.calls.append((symbol, pd.Timestamp(start), pd.Timestamp(end)))
+        df = self.df.loc[(self.df.index >= pd.Timestamp(start)) & (self.df.index <= pd.Timestamp(end))]
+        return {'code': 200, 'message': 'fake'}, df.copy(), {'vwap': vwap(df)}
+
+
+class TestBackfill(unittest.TestCase):
+    '''Test the backfill planning and progress'''
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_makeChunks(self):
+        '''Chunks are consecutive weekdays no longer than size'''
+        days = sessionDays('2020-11-02', '2020-11-13')
+        del days[3]
+        chunks = bf.makeChunks(days, 2)
+        self.assertEqual([len(c) for c in chunks], [2, 1, 2, 2, 2])
+
+    def test_assignApis(self):
+        '''The api with more budget gets more of the symbols'''
+        limiter = RateLimiter()
+        symbols = [f'S{i}' for i in range(200)]
+        # AlphaVantage's 500 a day allows one request in 172.8 seconds, Finnhub one a second
+        assigned = bf.assignApis(symbols, ['av', 'fh'], limiter)
+        self.assertEqual(len(assigned['av']), 1)
+        self.assertEqual(len(assigned['fh']), 199)
+
+    def test_run_resume(self):
+        '''A second run does not request the days already done'''
+        chooser = Chooser(BarStore(self.root), ['fh', 'tgo'])
+        progress = os.path.join(self.root, 'backfill.json')
+        b = bf.Backfill(['SQ', 'aapl'], '2020-11-02', '2020-11-20', 1, progress=progress,
+                        chooser=chooser, limiter=RateLimiter())
+        self.assertEqual(b.run(), [])
+        # 15 days in chunks of 5 for each symbol
+        self.assertEqual(len(chooser.calls), 6)
+        self.assertTrue(chooser.store.hasDay('AAPL', 'fh', 1, pd.Timestamp('2020-11-20')))
+
+        chooser.calls = []
+        b = bf.Backfill(['SQ', 'AAPL'], '2020-11-02', '2020-11-23', 1, progress=progress,
+                        chooser=chooser, limiter=RateLimiter())
+        b.run()
+        self.assertEqual(len(chooser.calls), 2)
+        self.assertEqual(chooser.calls[0][2], pd.Timestamp('2020-11-23'))
+
+    def test_failedChunk(self):
+        '''A chunk that raises is recorded as failed and the other chunks go on'''
+        chooser = Chooser(BarStore(self.root), ['fh'])
+        progress = os.path.join(self.root, 'backfill.json')
+        b = bf.Backfill(['BAD', 'SQ'], '2020-11-02', '2020-11-13', 1, progress=progress,
+                        chooser=chooser, limiter=RateLimiter())
+        failed = b.run()
+        self.assertEqual([f[0] for f in failed], ['BAD', 'BAD'])
+        self.assertEqual([c[0] for c in chooser.calls], ['BAD', 'BAD', 'SQ', 'SQ'])
+        self.assertTrue(chooser.store.hasDay('SQ', 'fh', 1, pd.Timestamp('2020-11-13')))
+
+        chooser.calls = []
+        bf.Backfill(['BAD', 'SQ'], '2020-11-02', '2020-11-13', 1, progress=progress,
+                    chooser=chooser, limiter=RateLimiter()).run()
+        self.assertEqual([c[0] for c in chooser.calls], ['BAD', 'BAD'])
+
+    def test_chunkVwap(self):
+        '''A chunk of several days through APIChooser is stored with the VWAP of each day'''
+        saved = config.BACKEND
+        config.setBackend(config.DictBackend({'chart': {'getmas': [[], ['vwap', 'yellow']], 'afterhours': False}}),
+                          env=False)
+        self.addCleanup(setattr, config, 'BACKEND', saved)
+        days = sessionDays('2020-11-02', '2020-11-06')
+        df = makeDays(days)
+        fake = Provider(df)
+        store = BarStore(self.root, 'pkl')
+        chooser = APIChooser(config.getSettings('zero_substance/stockapi'), orprefs=['fh'], keydict={'fh': 'key'},
+                             store=store, flight=SingleFlight())
+        for name, value in [('apiChooser', lambda api=None: fake),
+                            ('apiChooserList', lambda start, end, api=None: (False, [], ['fh']))]:
+            patcher = mock.patch.object(chooser, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        b = bf.Backfill(['SQ'], '2020-11-02', '2020-11-06', 1, chooser=chooser, limiter=RateLimiter())
+        self.assertEqual(b.run(), [])
+        self.assertEqual(len(fake.calls), 1)
+        for day in days[1:]:
+            expected = vwap(df.loc[df.index.normalize() == day])
+            np.testing.assert_allclose(store.getDay('SQ', 'fh', 1, day)['vwap'], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
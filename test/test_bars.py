@@ -0,0 +1,76 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Test code for the bars module.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import matplotlib.dates as mdates
+import numpy as np
+import pandas as pd
+
+from structjour.stock.bars import Bars
+
+from helpers import makeDays
+
+
+class TestBars(unittest.TestCase):
+    '''Test the Bars container'''
+
+    def test_fromFrame(self):
+        '''float64 columns are not copied. The dates match matplotlib'''
+        df = makeDays(['2020-12-01'], 5)
+        bars = Bars.fromFrame(df)
+        self.assertEqual(len(bars), len(df))
+        self.assertTrue(np.shares_memory(bars.close, df['close'].values))
+        self.assertEqual(bars.volume.dtype, np.float64)
+        np.testing.assert_allclose(bars.dates(), mdates.date2num(df.index.to_pydatetime()))
+        pd.testing.assert_frame_equal(bars.toFrame(), df, check_dtype=False, check_freq=False)
+
+    def test_between(self):
+        bars = Bars.fromFrame(makeDays(['2020-12-01'], 5))
+        part = bars.between('2020-12-01 10:00', '2020-12-01 11:00')
+        self.assertEqual(len(part), 13)
+        self.assertEqual(part.time[0], pd.Timestamp('2020-12-01 10:00').value)
+        self.assertTrue(np.shares_memory(part.open, bars.open))
+
+    def test_save_load(self):
+        '''Loaded bars are a read only memory map'''
+        d = tempfile.mkdtemp()
+        try:
+            path = os.path.join(d, 'SQ.npy')
+            bars = Bars.fromFrame(makeDays(['2020-12-01'], 5))
+            bars.save(path)
+            loaded = Bars.load(path)
+            self.assertIsInstance(loaded.close.base, np.memmap)
+            self.assertFalse(loaded.close.flags.writeable)
+            np.testing.assert_array_equal(loaded.time, bars.time)
+            np.testing.assert_array_equal(loaded.volume, bars.volume)
+            del loaded
+        finally:
+            shutil.rmtree(d)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Test code for the barstore module.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+from structjour.stock import barstore as bs
+
+from helpers import makeDays
+
+
+class TestBarStore(unittest.TestCase):
+    '''Test the BarStore class and the module functions'''
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = bs.BarStore(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_putFrame(self):
+        '''Only completed days are written'''
+        df = makeDays(['2020-12-01', '2020-12-02'], 5)
+        now = pd.Timestamp('2020-12-02 12:00')
+        written = self.store.putFrame('sq', 'fh', 5, df, now=now)
+        self.assertEqual(written, [pd.Timestamp('2020-12-01')])
+        self.assertTrue(self.store.hasDay('SQ', 'fh', 5, '2020-12-01'))
+        self.assertFalse(self.store.hasDay('SQ', 'fh', 5, '2020-12-02'))
+
+    def test_getDays(self):
+        df = makeDays(['2020-12-01'], 5)
+        self.store.putDay('SQ', 'fh', 5, '2020-12-01', df)
+        days = bs.sessionDays('2020-12-01 10:00', '2020-12-02 11:00')
+        found, missing = self.store.getDays('SQ', 'fh', 5, days)
+        self.assertEqual(list(found.keys()), [pd.Timestamp('2020-12-01')])
+        self.assertEqual(missing, [pd.Timestamp('2020-12-02')])
+        pd.testing.assert_frame_equal(found[pd.Timestamp('2020-12-01')], df, check_freq=False)
+
+    def test_concurrentPut(self):
+        '''Threads writing the same day do not trip over each other's temporary file'''
+        df = makeDays(['2020-12-01'], 5)
+
+        def put(i):
+            for j in range(50):
+                self.store.putDay('SQ', 'fh', 5, '2020-12-01', df)
+        with ThreadPoolExecutor(4) as pool:
+            list(pool.map(put, range(4)))
+        pd.testing.assert_frame_equal(self.store.getDay('SQ', 'fh', 5, '2020-12-01'), df, check_freq=False)
+
+    @unittest.skipIf(bs.pa is None, 'pyarrow is not installed')
+    def test_formats(self):
+        '''Each format reads back the bars for a time range. A day in another format is found'''
+        df = makeDays(['2020-12-01'], 5)
+        start = pd.Timestamp('2020-12-01 10:00')
+        end = pd.Timestamp('2020-12-01 11:00')
+        for fmt in ['feather', 'parquet', 'pkl']:
+            store = bs.BarStore(self.root, fmt)
+            store.putDay('SQ', 'fh', 5, '2020-12-01', df)
+            self.assertTrue(store.dayPath('SQ', 'fh', 5, '2020-12-01').endswith(fmt))
+            got = store.getDay('SQ', 'fh', 5, '2020-12-01')
+            pd.testing.assert_frame_equal(got, df, check_freq=False)
+            got = store.getDay('SQ', 'fh', 5, '2020-12-01', start, end)
+            self.assertEqual(got.index[0], start)
+            self.assertEqual(got.index[-1], end)
+            self.assertEqual(len(got), 13)
+
+        # The day was last written as a pickle
+        store = bs.BarStore(self.root, 'feather')
+        self.assertTrue(store.hasDay('SQ', 'fh', 5, '2020-12-01'))
+        store.removeDays('SQ', 'fh', 5, ['2020-12-01'])
+        self.assertFalse(store.hasDay('SQ', 'fh', 5, '2020-12-01'))
+
+    def test_dayRuns(self):
+        days = bs.sessionDays('2020-12-03', '2020-12-10')
+        del days[2]
+        runs = bs.dayRuns(days)
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(runs[0], [pd.Timestamp('2020-12-03'), pd.Timestamp('2020-12-04')])
+        self.assertEqual(runs[1][0], pd.Timestamp('2020-12-08'))
+
+    def test_joinMas(self):
+        df = makeDays(['2020-12-01'], 5)
+        ema = df.close.ewm(span=9, adjust=False, min_periods=9).mean()
+        vwap = df.close.loc[df.index >= pd.Timestamp('2020-12-01 10:00')]
+        frame = bs.joinMas(df, {9: ema, 'vwap': vwap})
+
+        d, maDict = bs.splitMas(frame, [9])
+        self.assertEqual(list(d.columns), ['open', 'high', 'low', 'close', 'volume'])
+        self.assertEqual(list(maDict.keys()), [9])
+
+        d, maDict = bs.splitMas(frame.loc[frame.index >= pd.Timestamp('2020-12-01 10:00')], [9])
+        self.assertEqual(list(maDict.keys()), [9, 'vwap'])
+
+        d, maDict = bs.splitMas(frame, [9, 20])
+        self.assertIsNone(maDict)
+
+
+if __name__ == '__main__':
+    unittest.main()
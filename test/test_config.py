@@ -0,0 +1,153 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Test code for the config module.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from structjour import config
+
+
+class FakeQSettings:
+    '''Counts the reads of a QSettings'''
+    store = dict()
+    reads = 0
+
+    def __init__(self, org, app):
+        self.scope = (org, app)
+
+    def contains(self, key):
+        return (self.scope, key) in self.store
+
+    def value(self, key):
+        FakeQSettings.reads += 1
+        return self.store[(self.scope, key)]
+
+    def setValue(self, key, value):
+        self.store[(self.scope, key)] = value
+
+    def remove(self, key):
+        self.store.pop((self.scope, key), None)
+
+
+class TestConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_value(self):
+        '''Defaults and the type conversions of QSettings.value'''
+        s = config.Settings('zero_substance/chart', backend=config.DictBackend())
+        self.assertIsNone(s.value('afterhours'))
+        self.assertEqual(s.value('afterhours', False, bool), False)
+        self.assertFalse(s.contains('afterhours'))
+        for stored, expected in [('true', True), ('false', False), (1, True), (False, False)]:
+            s.setValue('afterhours', stored)
+            self.assertIs(s.value('afterhours', type=bool), expected)
+        s.setValue('interval', '5')
+        self.assertEqual(s.value('interval', type=int), 5)
+        s.setValue('APIPref', 'fh')
+        self.assertEqual(s.value('APIPref', type=list), ['fh'])
+        s.remove('APIPref')
+        self.assertFalse(s.contains('APIPref'))
+
+    def test_file(self):
+        '''A JSON file is read in sections and written back'''
+        path = os.path.join(self.dir, 'structjour.json')
+        with open(path, 'w') as f:
+            json.dump({'main': {'tradeDb': '/data/trades.sqlite'},
+                       'stockapi': {'APIPref': 'fh,tgo'}}, f)
+        backend = config.FileBackend(path)
+        main = config.Settings('zero_substance', backend=backend)
+        apiset = config.Settings('zero_substance/stockapi', backend=backend)
+        self.assertEqual(main.value('tradeDb'), '/data/trades.sqlite')
+        self.assertEqual(apiset.value('APIPref'), 'fh,tgo')
+        self.assertIsNone(main.value('APIPref'))
+
+        apiset.setValue('useBarStore', True)
+        apiset = config.Settings('zero_substance/stockapi', backend=config.FileBackend(path))
+        self.assertIs(apiset.value('useBarStore', type=bool), True)
+
+    def test_env(self):
+        '''Environment variables override the backend'''
+        data = config.DictBackend({'stockapi': {'APIPref': 'fh'}})
+        environ = {'STRUCTJOUR_STOCKAPI_APIPREF': 'tgo,av',
+                   'STRUCTJOUR_CHART_GETMAS': '[[[9, 9, "red"]], []]',
+                   'STRUCTJOUR_MAIN_TRADEDB': '/tmp/trades.sqlite'}
+        backend = config.EnvBackend(data, environ)
+        self.assertEqual(config.Settings('zero_substance/stockapi', backend=backend).value('APIPref'),
+                         'tgo,av')
+        self.assertEqual(config.Settings('zero_substance/chart', backend=backend).value('getmas'),
+                         [[[9, 9, 'red']], []])
+        self.assertEqual(config.Settings('zero_substance', backend=backend).value('tradeDb'),
+                         '/tmp/trades.sqlite')
+        del environ['STRUCTJOUR_STOCKAPI_APIPREF']
+        self.assertEqual(config.Settings('zero_substance/stockapi', backend=backend).value('APIPref'),
+                         'fh')
+
+    def test_qsettingsCache(self):
+        '''QSettings is read once per key until the ttl passes or the key is written'''
+        now = [0.0]
+        backend = config.QSettingsBackend.__new__(config.QSettingsBackend)
+        backend.QSettings = FakeQSettings
+        backend.ttl = 2.0
+        backend.clock = lambda: now[0]
+        backend.settings = dict()
+        backend.cache = dict()
+        backend.lock = config.threading.Lock()
+        FakeQSettings.reads = 0
+
+        s = config.Settings('zero_substance/chart', backend=backend)
+        s.setValue('interval', 5)
+        for i in range(10):
+            self.assertEqual(s.value('interval'), 5)
+        self.assertEqual(FakeQSettings.reads, 1)
+
+        # A dialog writes QSettings directly. It is seen when the ttl passes
+        FakeQSettings('zero_substance/chart', 'structjour').setValue('interval', 1)
+        self.assertEqual(s.value('interval'), 5)
+        now[0] = 2.5
+        self.assertEqual(s.value('interval'), 1)
+
+        s.setValue('interval', 15)
+        self.assertEqual(s.value('interval'), 15)
+        self.assertEqual(FakeQSettings.reads, 3)
+
+    def test_setBackend(self):
+        '''Settings created before setBackend use the new backend'''
+        saved = config.BACKEND
+        try:
+            s = config.getSettings('zero_substance/stockapi')
+            config.setBackend(config.DictBackend({'stockapi': {'APIPref': 'bc'}}), env=False)
+            self.assertEqual(s.value('APIPref'), 'bc')
+        finally:
+            config.BACKEND = saved
+
+
+if __name__ == '__main__':
+    unittest.main()
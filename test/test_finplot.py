@@ -0,0 +1,144 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Test drawing charts with FinPlot from data already retrieved. No api is called.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from structjour.stock.bars import Bars
+from structjour.stock.graphstuff import FinPlot, barColors, barVerts
+
+from helpers import makeCandles
+
+
+class Chooser:
+    '''Stands in for APIChooser. Fails for the symbol BAD'''
+    def __init__(self, df):
+        self.df = df
+        self.api = 'fh'
+        self.calls = []
+
+    def get_intraday(self, symbol, start=None, end=None, minutes=5):
+        self.calls.append((symbol, start, end, minutes))
+        if symbol == 'BAD':
+            raise ValueError('A malformed response')
+        df = self.df.loc[(self.df.index >= start) & (self.df.index <= end)]
+        return {'code': 200}, df, {}
+
+
+class TestFinPlot(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fp = FinPlot()
+        self.fp.chartSet.setValue('interactive', False)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def plot(self, df, name):
+        save = os.path.join(self.dir, name)
+        return self.fp.plotChart('SQ', 'fh', df, None, df.index[0], df.index[-1], 1, save=save)
+
+    def test_reuseFigure(self):
+        '''Each chart is drawn on the same Figure and none is left in pyplot'''
+        figures = plt.get_fignums()
+        df = makeCandles('2020-11-30 09:30', 120)
+        first = self.plot(df, 'first.png')
+        fig = self.fp.figure
+        second = self.plot(df.iloc[20:], 'second.png')
+        self.assertIs(self.fp.figure, fig)
+        self.assertEqual(len(fig.axes), 2)
+        self.assertTrue(os.path.getsize(first) > 0)
+        self.assertTrue(os.path.getsize(second) > 0)
+        self.assertEqual(plt.get_fignums(), figures)
+
+    def test_existingFile(self):
+        '''A chart does not overwrite an existing file'''
+        df = makeCandles('2020-11-30 09:30', 120)
+        first = self.plot(df, 'trade.png')
+        second = self.plot(df, 'trade.png')
+        self.assertEqual(os.path.basename(second), 'trade(1).png')
+        self.assertNotEqual(first, second)
+
+    def test_barVerts(self):
+        verts = barVerts(np.array([1.0, 2.0]), np.array([10.0, 20.0]), np.array([11.0, 22.0]), 0.5)
+        np.testing.assert_allclose(verts[1], [[1.75, 20], [1.75, 22], [2.25, 22], [2.25, 20]])
+        self.assertEqual(verts.shape, (2, 4, 2))
+
+    def test_barColors(self):
+        '''Up, down and flat candles. Flat candles default to the up color'''
+        bars = Bars.fromFrame(makeCandles('2020-11-30 09:30', 10))
+        bars.close[:3] = bars.open[:3] + np.array([1, -1, 0])
+        colors = barColors(bars[:3], 'g', 'r', 'k')
+        np.testing.assert_allclose(colors[:, :3], [[0, .5, 0], [1, 0, 0], [0, 0, 0]])
+        np.testing.assert_allclose(barColors(bars[:3], 'g', 'r')[2, :3], [0, .5, 0])
+
+    def test_collections(self):
+        '''The candles and the volume are a few collections however many candles there are'''
+        df = makeCandles('2020-11-30 09:30', 300)
+        self.plot(df, 'collections.png')
+        ax1, ax2 = self.fp.figure.axes
+        self.assertEqual(len(ax1.patches) + len(ax2.patches), 0)
+        self.assertEqual(len(ax1.collections), 2)
+        self.assertEqual(len(ax2.collections), 1)
+        self.assertEqual(len(ax2.collections[0].get_paths()), 300)
+        self.assertEqual(ax2.get_ylim()[0], 0)
+
+    def test_graph_candlesticks(self):
+        '''Jobs of a symbol, day and interval share one request. A failed job stops only itself'''
+        df = makeCandles('2020-11-30 09:30', 240)
+        chooser = Chooser(df)
+        jobs = [{'symbol': 'SQ', 'start': '2020-11-30 09:40', 'end': '2020-11-30 10:30',
+                 'save': os.path.join(self.dir, 'one.png')},
+                {'symbol': 'SQ', 'start': '2020-11-30 10:00', 'end': '2020-11-30 11:30',
+                 'save': os.path.join(self.dir, 'two.png')},
+                {'symbol': 'BAD', 'start': '2020-11-30 10:00', 'end': '2020-11-30 11:00',
+                 'save': os.path.join(self.dir, 'bad.png')},
+                {'symbol': 'SQ', 'start': '2020-11-30 10:00', 'end': '2020-11-30 11:00',
+                 'save': os.path.join(self.dir, 'nodir', 'three.png')},
+                {'symbol': 'SQ', 'start': '2020-11-30 12:00', 'end': '2020-11-30 13:00',
+                 'save': os.path.join(self.dir, 'four.png')}]
+        results = self.fp.graph_candlesticks(jobs, chooser)
+
+        self.assertEqual([c[0] for c in chooser.calls], ['SQ', 'BAD'])
+        self.assertEqual(chooser.calls[0][1:3], (pd.Timestamp('2020-11-30 09:40'), pd.Timestamp('2020-11-30 13:00')))
+        self.assertEqual(results[0], jobs[0]['save'])
+        self.assertEqual(results[1], jobs[1]['save'])
+        self.assertIsInstance(results[2], ValueError)
+        self.assertIsInstance(results[3], OSError)
+        self.assertEqual(results[4], jobs[4]['save'])
+        self.assertTrue(os.path.exists(jobs[4]['save']))
+
+    def test_maxCandles(self):
+        df = makeCandles('2020-11-30 09:30', self.fp.max_candles + 1)
+        self.assertIsNone(self.plot(df, 'big.png'))
+
+
+if __name__ == '__main__':
+    unittest.main()
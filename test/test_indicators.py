@@ -0,0 +1,141 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Test code for the indicators module.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from structjour import config
+from structjour.stock import indicators as ind
+from structjour.stock.barstore import BarStore, joinMas
+
+from helpers import makeCandles
+
+
+def fullEma(df, window):
+    return df['close'].ewm(span=window, adjust=False, min_periods=window, ignore_na=True).mean()
+
+
+def fullVwap(df, begin):
+    dfv = df.loc[df.index >= begin]
+    return (dfv['volume'] * (dfv['high'] + dfv['low'] + dfv['close']) / 3).cumsum() / dfv['volume'].cumsum()
+
+
+class TestIndicators(unittest.TestCase):
+    '''Test the incremental moving averages'''
+
+    def test_extendEma(self):
+        '''Extending the state matches computing from the beginning, NaNs included'''
+        df = makeCandles('2020-12-01 09:30', 100)
+        df.iloc[[3, 50], df.columns.get_loc('close')] = np.nan
+        expected = fullEma(df, 9)
+        first, state = ind.ema(df['close'].iloc[:5], 9)
+        second, state = ind.extendEma(state, df['close'].iloc[5:])
+        result = pd.concat([first, second])
+        np.testing.assert_allclose(result.values, expected.values)
+        self.assertEqual(state.count, 98)
+
+    def test_movingAverages(self):
+        '''A second call with new candles reuses the first'''
+        engine = ind.IndicatorEngine()
+        df = makeCandles('2020-12-01 09:30', 300)
+        key = ('SQ', 'fh', 1)
+        first = engine.movingAverages(key, df.iloc[:200], [9, 20], True)
+        np.testing.assert_allclose(first[20].values, fullEma(df.iloc[:200], 20).values)
+
+        df2 = df.iloc[10:]
+        calls = []
+        extend = ind.extendEma
+
+        def spy(state, closes):
+            calls.append(len(closes))
+            return extend(state, closes)
+        ind.extendEma = spy
+        try:
+            second = engine.movingAverages(key, df2, [9, 20], True)
+        finally:
+            ind.extendEma = extend
+        self.assertEqual(calls, [100, 100])
+        self.assertEqual(len(second[9]), len(df2))
+        np.testing.assert_allclose(second[9].values, fullEma(df, 9).iloc[10:].values)
+        begin = pd.Timestamp('2020-12-01 09:30')
+        # VWAP continues from the open even though the new candles begin later
+        np.testing.assert_allclose(second['vwap'].values, fullVwap(df, begin).iloc[10:].values)
+
+    def test_changedData(self):
+        '''Different candles are computed from the beginning'''
+        engine = ind.IndicatorEngine()
+        key = ('SQ', 'fh', 1)
+        df = makeCandles('2020-12-01 09:30', 100)
+        engine.movingAverages(key, df, [9])
+        df2 = df.copy()
+        df2.iloc[50, df2.columns.get_loc('close')] += 1
+        result = engine.movingAverages(key, df2, [9])
+        np.testing.assert_allclose(result[9].values, fullEma(df2, 9).values)
+
+    def test_resumeStored(self):
+        '''A new engine resumes from the stored days and the saved day end state'''
+        root = tempfile.mkdtemp()
+        try:
+            store = BarStore(root)
+            key = ('SQ', 'fh', 5)
+            day1 = makeCandles('2020-12-01 09:30', 78, 5)
+            day2 = makeCandles('2020-12-02 09:30', 78, 5, seed=8)
+            df = pd.concat([day1, day2])
+            engine = ind.IndicatorEngine(store)
+            mas = engine.movingAverages(key, day1, [9])
+            store.putFrame('SQ', 'fh', 5, joinMas(day1, mas))
+
+            engine = ind.IndicatorEngine(store)
+            prior = engine.getPrior(key, df, [9])
+            self.assertIsNotNone(prior)
+            self.assertEqual(prior[0].index[-1], day1.index[-1])
+            result = engine.movingAverages(key, df, [9])
+            np.testing.assert_allclose(result[9].values, fullEma(df, 9).values)
+        finally:
+            shutil.rmtree(root)
+
+    def test_getEngine(self):
+        '''The store of the settings is created with the engine, not on each call'''
+        saved = config.BACKEND
+        root = tempfile.mkdtemp()
+        config.setBackend(config.DictBackend({'stockapi': {'barStoreDir': root}}), env=False)
+        try:
+            with mock.patch.object(ind, 'ENGINE', None), \
+                    mock.patch.object(ind, 'BarStore', wraps=BarStore) as makeStore:
+                engine = ind.getEngine()
+                for i in range(3):
+                    self.assertIs(ind.getEngine(), engine)
+                self.assertEqual(makeStore.call_count, 1)
+                self.assertEqual(engine.store.root, root)
+        finally:
+            config.BACKEND = saved
+            shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Test code for the intradaycache module.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+from collections import OrderedDict
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from structjour.stock.intradaycache import IntradayCache, frameBytes
+
+from helpers import Clock
+
+
+def makeResult(periods=100):
+    idx = pd.date_range('2020-12-01 09:30', periods=periods, freq='1T')
+    close = np.arange(periods, dtype=float)
+    df = pd.DataFrame({'open': close, 'high': close, 'low': close, 'close': close,
+                       'volume': close}, index=idx)
+    maDict = OrderedDict([(9, df['close'].rolling(9).mean())])
+    return {'code': 200}, df, maDict
+
+
+class TestIntradayCache(unittest.TestCase):
+    '''Test the in memory cache of intraday results'''
+
+    def setUp(self):
+        self.clock = Clock()
+        self.closedEnd = pd.Timestamp('2020-12-01 16:00')
+        # No end is taken as the most recent data
+        self.liveEnd = None
+
+    def test_copies(self):
+        '''Changing a result does not change the cache'''
+        cache = IntradayCache(clock=self.clock)
+        meta, df, maDict = makeResult()
+        cache.put('k', 'fh', meta, df, maDict, self.closedEnd)
+        df.iloc[0, 0] = -1
+        api, (meta2, df2, ma2) = cache.get('k')
+        self.assertEqual(api, 'fh')
+        self.assertEqual(df2.iloc[0, 0], 0)
+        df2.iloc[1, 0] = -1
+        ma2[9].iloc[-1] = -1
+        api, (meta3, df3, ma3) = cache.get('k')
+        self.assertEqual(df3.iloc[1, 0], 1)
+        self.assertNotEqual(ma3[9].iloc[-1], -1)
+
+    def test_ttl(self):
+        '''A live window expires, a closed window does not'''
+        cache = IntradayCache(liveTtl=30, clock=self.clock)
+        cache.put('closed', 'fh', *makeResult(), self.closedEnd)
+        cache.put('live', 'fh', *makeResult(), self.liveEnd)
+        self.clock.now = 29
+        self.assertIsNotNone(cache.get('live'))
+        self.clock.now = 31
+        self.assertIsNone(cache.get('live'))
+        self.clock.now = 10**9
+        self.assertIsNotNone(cache.get('closed'))
+
+    def test_lru_bytes(self):
+        '''The least recently used results are dropped to stay within the byte budget'''
+        size = frameBytes(*makeResult()[1:])
+        cache = IntradayCache(maxBytes=int(size * 2.5), clock=self.clock)
+        cache.put('a', 'fh', *makeResult(), self.closedEnd)
+        cache.put('b', 'fh', *makeResult(), self.closedEnd)
+        cache.get('a')
+        cache.put('c', 'fh', *makeResult(), self.closedEnd)
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+        self.assertLessEqual(cache.nbytes, cache.maxBytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Test code for the lookback module.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from structjour.stock import lookback as lb
+
+
+class TestLookback(unittest.TestCase):
+    '''Test the moving average warm up planning'''
+
+    def test_emaWarmup(self):
+        '''After the warmup the seed has less than the tolerance of weight'''
+        self.assertEqual(lb.emaWarmup(9), 21)
+        self.assertEqual(lb.emaWarmup(200), 461)
+        for window in [9, 20, 50, 200]:
+            n = lb.emaWarmup(window)
+            alpha = 2 / (window + 1)
+            self.assertLess((1 - alpha) ** n, lb.EMA_TOLERANCE)
+            self.assertGreaterEqual((1 - alpha) ** (n - 1), lb.EMA_TOLERANCE)
+        self.assertEqual(lb.lookbackBars([9, 20]), lb.emaWarmup(20))
+        self.assertEqual(lb.lookbackBars([]), 0)
+
+    def test_converged(self):
+        '''An EMA begun at the lookback is within the tolerance of one begun much earlier'''
+        np.random.seed(7)
+        close = pd.Series(100 + np.cumsum(np.random.randn(2000)))
+        n = lb.emaWarmup(20)
+        full = close.ewm(span=20, adjust=False).mean()
+        part = close.iloc[-n:].ewm(span=20, adjust=False).mean()
+        spread = close.max() - close.min()
+        self.assertLess(abs(full.iloc[-1] - part.iloc[-1]), lb.EMA_TOLERANCE * spread)
+
+    def test_lookbackStart(self):
+        '''Count candles in the sessions, skipping nights and weekends'''
+        tests = [
+            # The same session has enough candles
+            (('2020-12-02 11:00', 1, [9, 20], False), '2020-12-02 10:13'),
+            # 47 minutes back from the open is the previous afternoon
+            (('2020-12-02 09:30', 1, [9, 20], False), '2020-12-01 15:13'),
+            # Monday goes back to Friday
+            (('2020-12-07 09:30', 1, [9, 20], False), '2020-12-04 15:13'),
+            # 461 five minute candles. 5 full sessions, the 42 candles of the early close and 29
+            (('2020-12-07 09:30', 5, [200], False), '2020-11-25 13:35'),
+            # The extended session is 16 hours. 21 candles are 16 and 5 from the session before
+            (('2020-12-02 04:00', 60, [9], True), '2020-11-30 15:00'),
+            # Skip Thanksgiving. The day after closes at 13:00
+            (('2020-11-30 09:30', 1, [9, 20], False), '2020-11-27 12:13'),
+            (('2020-11-30 09:30', 1, [200], False), '2020-11-25 11:49'),
+        ]
+        for args, expected in tests:
+            self.assertEqual(lb.lookbackStart(*args), pd.Timestamp(expected), args)
+        self.assertEqual(lb.lookbackStart('2020-12-02 10:00', 1, [], False),
+                         pd.Timestamp('2020-12-02 10:00'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -133,9 +133,11 @@ class TestMyalphavantage(unittest.TestCase):
         '''
         results = [
             (True, ('1min', 1, 3)),
-            (True, ('30min', 30, 45)),
-            (True, ('60min', 60, 112)),
-            (True, ('5min', 5, 11)),
+            (True, ('15min', 15, 45)),
+            (True, ('60min', 60, 120)),
+            (True, ('1min', 1, 112)),
+            (True, ('5min', 5, 10)),
+            (True, ('1min', 1, 11)),
             (False, ('1min', 1, 1)),
             (False, ('30min', 30, 30)),
         ]
@@ -21,11 +21,15 @@
 @creation_date: 2018-12-23
 '''
 
+import asyncio
 import datetime as dt
 import random
+from types import SimpleNamespace
 import unittest
+from unittest import mock
 import pandas as pd
 
+from structjour import config
 from structjour.stock import myib as ib
 from structjour.stock import utilities as util
 # pylint: disable = C0103
@@ -45,29 +49,64 @@ class TestMyib(unittest.TestCase):
         tests = [(False, ('1 min', 1, 1)),
                  (False, ('2 mins', 2, 2)),
                  (False, ('3 mins', 3, 3)),
-                 (True, ('1 min', 1, 4)),
+                 (True, ('2 mins', 2, 4)),
                  (False, ('5 mins', 5, 5)),
-                 (True, ('1 min', 1, 6)),
+                 (True, ('3 mins', 3, 6)),
                  (True, ('1 min', 1, 7)),
-                 (True, ('1 min', 1, 8)),
-                 (True, ('1 min', 1, 9)),
+                 (True, ('2 mins', 2, 8)),
+                 (True, ('3 mins', 3, 9)),
                  (False, ('10 mins', 10, 10)),
                  (True, ('1 min', 1, 11)),
-                 (True, ('1 min', 1, 12)),
+                 (True, ('3 mins', 3, 12)),
                  (True, ('1 min', 1, 13)),
-                 (True, ('1 min', 1, 14)),
+                 (True, ('2 mins', 2, 14)),
                  (False, ('15 mins', 15, 15)),
-                 (True, ('1 min', 1, 16)),
+                 (True, ('2 mins', 2, 16)),
                  (False, ('20 mins', 20, 20)),
-                 (True, ('1 min', 1, 21)),
+                 (True, ('3 mins', 3, 21)),
                  (False, ('30 mins', 30, 30)),
                  (True, ('1 min', 1, 31)),
+                 (True, ('20 mins', 20, 40)),
                  (False, ('1 hour', 60, 60)),
-                 (True, ('1 min', 1, 180))]
+                 (True, ('1 hour', 60, 180))]
 
         for x in tests:
             self.assertEqual(ib.ni(x[1][2]), x)
 
+    def test_IbPacer(self):
+        '''Test the delays IbPacer gives for the IB pacing rules'''
+        pacer = ib.IbPacer()
+        req = ('SQ', '20201201 16:00:00', '1 D', '1 min')
+        self.assertEqual(pacer.delay(req, 'SQ', 0), 0)
+        pacer.record(req, 'SQ', 0)
+        # Identical requests wait 15 seconds
+        self.assertEqual(pacer.delay(req, 'SQ', 5), 10)
+
+        # The sixth request for a contract within 2 seconds waits
+        for i in range(1, 5):
+            pacer.record(('SQ', i), 'SQ', 0)
+        self.assertEqual(pacer.delay(('SQ', 5), 'SQ', 1), 1)
+        self.assertEqual(pacer.delay(('AAPL', 5), 'AAPL', 1), 0)
+
+        # The 61st request in 10 minutes waits
+        pacer = ib.IbPacer()
+        for i in range(60):
+            pacer.record(('AAPL', i), f'S{i}', i * 3)
+        self.assertEqual(pacer.delay(('AAPL', 60), 'AAPL', 180), 420)
+        self.assertEqual(pacer.delay(('AAPL', 60), 'AAPL', 601), 0)
+
+    def test_IbPacerReserved(self):
+        '''A send reserved for later does not keep earlier sends from expiring'''
+        pacer = ib.IbPacer(maxRequests=3, period=100, identical=15, clock=lambda: 0, sleep=lambda secs: None)
+        pacer.acquire('r1', 'SQ')
+        self.assertEqual(pacer.acquire('r1', 'SQ'), 15)
+        self.assertEqual(pacer.acquire('r2', 'AAPL'), 0)
+        self.assertEqual(pacer.acquire('r3', 'MSFT'), 100)
+        times = [t for t, r, c in pacer.sent]
+        self.assertEqual(times, sorted(times))
+        # Only the sends at 15 and 100 are in the last 100 seconds
+        self.assertEqual(pacer.delay('r4', 'AMD', 100.5), 0)
+
     def test_getib_intraday(self):
         '''
         This will provide time based failures on market holidays. If you are woking on a holiday,
@@ -153,6 +192,227 @@ class TestMyib(unittest.TestCase):
                 self.assertLessEqual(delt2, delt)
 
 
+class FakeApp(ib.TestWrapper):
+    '''
+    A TestWrapper that records the requests instead of sending them to IB. If respond is set,
+    it is called with each request.
+    '''
+    def __init__(self, port=None, cid=None, host=None, respond=None):
+        ib.TestWrapper.__init__(self)
+        self.requests = []
+        self.cancelled = []
+        self.respond = respond
+        self.connected = True
+
+    def connect(self, host, port, cid):
+        self.connected = True
+
+    def isConnected(self):
+        return self.connected
+
+    def disconnect(self):
+        self.connected = False
+
+    def run(self):
+        pass
+
+    def reqHistoricalData(self, reqId, contract, end, dur, interval, what, rth, fmt, keepUpToDate, opts):
+        self.requests.append((reqId, contract.symbol, dur, interval, keepUpToDate))
+        if self.respond:
+            self.respond(self, reqId, contract.symbol)
+
+    def cancelHistoricalData(self, reqId):
+        self.cancelled.append(reqId)
+
+
+def sendBars(app, reqId, symbol):
+    '''Answer a historical request with two bars'''
+    app.historicalData(reqId, bar('20201201  09:30:00', 10))
+    app.historicalData(reqId, bar('20201201  09:31:00', 11))
+    app.historicalDataEnd(reqId, '', '')
+
+
+class TestIbManager(unittest.TestCase):
+    '''IbManager with FakeApp in place of TestApp'''
+
+    def setUp(self):
+        self.saved = config.BACKEND
+        config.setBackend(config.DictBackend({'chart': {'afterhours': False}}), env=False)
+        self.apps = []
+
+        def makeApp(port, cid, host):
+            app = FakeApp(port, cid, host, respond=sendBars)
+            self.apps.append(app)
+            return app
+        ibs = {'port': 7496, 'id': 7878, 'host': '127.0.0.1'}
+        for name, value in [('TestApp', makeApp),
+                            ('IbSettings', lambda: SimpleNamespace(getIbSettings=lambda: ibs))]:
+            patcher = mock.patch.object(ib, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.manager = ib.IbManager(pacer=ib.IbPacer(sleep=lambda secs: None))
+        self.end = dt.datetime(2020, 12, 1, 16, 0)
+
+    def tearDown(self):
+        config.BACKEND = self.saved
+
+    def test_connect(self):
+        '''The connection is made once and made again after it closes'''
+        self.assertFalse(self.manager.isConnected(connect=False))
+        app = self.manager.connect()
+        self.assertIs(self.manager.connect(), app)
+        self.assertTrue(self.manager.isConnected())
+        self.assertEqual(len(self.apps), 1)
+
+        app.disconnect()
+        self.assertFalse(self.manager.isConnected(connect=False))
+        self.assertTrue(self.manager.isConnected())
+        self.assertEqual(len(self.apps), 2)
+        self.assertIsNot(self.manager.app, app)
+
+    def test_noSettings(self):
+        with mock.patch.object(ib, 'IbSettings', lambda: SimpleNamespace(getIbSettings=lambda: None)):
+            self.assertIsNone(self.manager.connect())
+            self.assertTrue(self.manager.getHistorical('SQ', self.end, '1 D', '1 min').empty)
+
+    def test_getHistorical(self):
+        df = self.manager.getHistorical('SQ', self.end, '1 D', '1 min')
+        self.assertEqual(list(df.close), [10, 11])
+        self.assertEqual(self.apps[0].requests[0][1:], ('SQ', '1 D', '1 min', False))
+        self.assertEqual(self.apps[0].pending, {})
+
+        # A bad request is not sent
+        self.assertTrue(self.manager.getHistorical('SQ', self.end, '1 Day', '1 min').empty)
+        self.assertEqual(len(self.apps[0].requests), 1)
+
+    def test_interleaved(self):
+        '''The bars of requests in flight together go to the Future of their reqId'''
+        app = self.manager.connect()
+        app.respond = None
+        first = self.manager.request('SQ', self.end, '1 D', '1 min')
+        second = self.manager.request('AAPL', self.end, '1 D', '1 min')
+        app.historicalData(first.reqId, bar('20201201  09:30:00', 10))
+        app.historicalData(second.reqId, bar('20201201  09:30:00', 50))
+        app.historicalData(first.reqId, bar('20201201  09:31:00', 11))
+        app.historicalDataEnd(second.reqId, '', '')
+        self.assertFalse(first.done())
+        app.historicalData(second.reqId, bar('20201201  09:31:00', 51))
+        app.historicalDataEnd(first.reqId, '', '')
+        self.assertEqual(list(first.result(0).close), [10, 11])
+        self.assertEqual(list(second.result(0).close), [50])
+
+    def test_getHistoricalMany(self):
+        '''Identical requests are sent once. A request that times out is cancelled'''
+        def respond(app, reqId, symbol):
+            if symbol != 'SLOW':
+                sendBars(app, reqId, symbol)
+        app = self.manager.connect()
+        app.respond = respond
+        requests = [('SQ', self.end, '1 D', '1 min'), ('SLOW', self.end, '1 D', '1 min'),
+                    ('SQ', self.end, '1 D', '1 min'), ('AAPL', self.end, '1 Day', '1 min')]
+        results = self.manager.getHistoricalMany(requests, timeout=0.1)
+        self.assertEqual([r[1] for r in app.requests], ['SQ', 'SLOW'])
+        self.assertEqual([len(df) for df in results], [2, 0, 2, 0])
+        self.assertEqual(app.cancelled, [app.requests[1][0]])
+        self.assertEqual(app.pending, {})
+
+
+class TestError(unittest.TestCase):
+
+    def test_notice(self):
+        '''A warning or a notice leaves the request pending, an error ends it'''
+        app = FakeApp()
+        future = ib.Future()
+        app.pending[1] = ([], future)
+        for code in (2104, 2106, 2158, 10167, 10197):
+            app.error(1, code, 'A notice')
+        self.assertFalse(future.done())
+        self.assertIn(1, app.pending)
+
+        app.error(1, 162, 'Historical Market Data Service error message')
+        self.assertTrue(future.result(0).empty)
+        self.assertNotIn(1, app.pending)
+
+
+def bar(date, close, volume=100):
+    return SimpleNamespace(date=date, open=close, high=close + 0.1, low=close - 0.1, close=close,
+                           volume=volume)
+
+
+class TestIbBarStream(unittest.TestCase):
+    '''IbBarStream over an IbManager whose connection is a FakeApp'''
+
+    def setUp(self):
+        self.saved = config.BACKEND
+        config.setBackend(config.DictBackend({'chart': {'afterhours': False}}), env=False)
+        self.app = FakeApp()
+        self.manager = ib.IbManager(pacer=ib.IbPacer())
+        self.manager.app = self.app
+        self.received = []
+
+    def tearDown(self):
+        config.BACKEND = self.saved
+
+    def stream(self):
+        stream = ib.IbBarStream('SQ', 5, callback=lambda row, isUpdate: self.received.append((row, isUpdate)),
+                                manager=self.manager)
+        self.assertTrue(stream.start())
+        return stream
+
+    def test_shared(self):
+        '''Streams are sent over the manager's connection, each with its own reqId'''
+        first = self.stream()
+        second = self.stream()
+        self.assertNotEqual(first.reqId, second.reqId)
+        self.assertEqual([r[0] for r in self.app.requests], [first.reqId, second.reqId])
+        self.assertEqual(self.app.requests[0][1:], ('SQ', '1 D', '5 mins', True))
+
+        reqId = first.reqId
+        first.stop()
+        self.assertEqual(self.app.cancelled, [reqId])
+        self.assertNotIn(reqId, self.app.streams)
+        self.assertIn(second.reqId, self.app.streams)
+        self.assertIs(self.manager.app, self.app)
+
+    def test_updates(self):
+        '''The initial bars then the updates reach the callback, frame and updates'''
+        stream = self.stream()
+        self.app.historicalData(stream.reqId, bar('20201201  09:30:00', 10))
+        self.app.historicalData(stream.reqId, bar('20201201  09:35:00', 11))
+        self.app.historicalDataEnd(stream.reqId, '', '')
+        self.assertTrue(stream.loaded.is_set())
+
+        # The candle in progress, then the same candle finished
+        self.app.historicalDataUpdate(stream.reqId, bar('20201201  09:40:00', 12, 50))
+        self.app.historicalDataUpdate(stream.reqId, bar('20201201  09:40:00', 13, 80))
+        self.assertEqual([isUpdate for row, isUpdate in self.received], [False, False, True, True])
+        self.assertEqual(self.received[-1][0]['close'], 13)
+
+        df = stream.frame()
+        self.assertEqual(len(df), 3)
+        self.assertEqual(df.index[-1], pd.Timestamp('2020-12-01 09:40'))
+        self.assertEqual(df.iloc[-1].volume, 80)
+
+        stream.stop()
+        got = list(stream.updates(timeout=1))
+        self.assertEqual(len(got), 4)
+        self.assertEqual(got[2][0]['close'], 12)
+
+    def test_anext(self):
+        '''The async iterator gets the bars and ends when the connection closes'''
+        stream = self.stream()
+        self.app.historicalData(stream.reqId, bar('20201201  09:30:00', 10))
+        self.app.historicalDataUpdate(stream.reqId, bar('20201201  09:35:00', 11))
+        self.app.connectionClosed()
+
+        async def collect():
+            return [item async for item in stream]
+
+        got = asyncio.run(collect())
+        self.assertEqual([(row['close'], isUpdate) for row, isUpdate in got], [(10, False), (11, True)])
+        self.assertEqual(self.app.streams, {})
+
+
 def notmain():
     '''Run some local code'''
     t = TestMyib()
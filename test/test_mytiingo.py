@@ -21,12 +21,21 @@ Test code for mytiingo module.
 @creation_date: 12/11/20
 '''
 
+import asyncio
+import threading
 import unittest
+from unittest import mock
 import random
 import datetime as dt
+
+from structjour import config
+from structjour.stock import indicators, mytiingo
 from structjour.stock.mytiingo import Tingo_REST
+from structjour.stock.ratelimit import RateLimiter
 from structjour.stock.utilities import getPrevTuesWed
 
+from helpers import makeCandles
+
 class TestTingo_REST(unittest.TestCase):
     '''Test methods and functions from the Tingo_REST class'''
     tickers = ['NIO', 'BA', 'ACB', 'IMMP', 'TSLA', 'XPEV', 'PLTR', 'GME', 'APPL', 'NCLH', 'CCL']
@@ -100,6 +109,70 @@ class TestTingo_REST(unittest.TestCase):
         self.assertLessEqual((enddiff.seconds) // 60, interval)
 
 
+class FakeResponse:
+    def __init__(self, rows):
+        self.status_code = 200
+        self.rows = rows
+
+    def json(self):
+        return self.rows
+
+
+class TestAsync(unittest.TestCase):
+    '''agetIntraday with a fake response. Nothing goes to the network'''
+
+    def setUp(self):
+        self.saved = config.BACKEND
+        config.setBackend(config.DictBackend({
+            'chart': {'getmas': [[[9, 9, 'red']], ['vwap', 'yellow']], 'afterhours': False},
+            'stockapi': {'useBarStore': False}}), env=False)
+        df = makeCandles('2020-12-01 09:30', 390)
+        rows = df.reset_index().rename(columns={'index': 'date'})
+        rows['date'] = rows['date'].dt.tz_localize('America/New_York').dt.tz_convert('UTC').astype(str)
+        self.rows = rows.to_dict('records')
+        self.threads = dict()
+        self.limiter = RateLimiter()
+        for obj, name in [(Tingo_REST, 'intradayParams'), (Tingo_REST, 'intradayResult'),
+                          (mytiingo, 'getHeaders'), (self.limiter, 'tryAcquire')]:
+            self.record(obj, name)
+
+        async def aget(url, params=None, headers=None, timeout=None):
+            self.headers = headers
+            return FakeResponse(self.rows)
+        for obj, name, value in [(mytiingo, 'getLimiter', lambda: self.limiter),
+                                 (mytiingo.transport, 'aget', aget),
+                                 (indicators, 'ENGINE', indicators.IndicatorEngine())]:
+            patcher = mock.patch.object(obj, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        config.BACKEND = self.saved
+
+    def record(self, obj, name):
+        '''Record the threads that call obj.name'''
+        method = getattr(obj, name)
+
+        def wrapper(*args, **kwargs):
+            self.threads.setdefault(name, []).append(threading.current_thread())
+            return method(*args, **kwargs)
+        patcher = mock.patch.object(obj, name, wrapper)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_agetIntraday(self):
+        '''The settings, the key and the results are handled off the event loop'''
+        meta, df, maDict = asyncio.run(mytiingo.aget_intraday('SQ', '2020-12-01 10:00', '2020-12-01 12:00', 1,
+                                                              key='abc'))
+        self.assertEqual(meta['code'], 200)
+        self.assertEqual(df.index[0], dt.datetime(2020, 12, 1, 10, 0))
+        self.assertIn(9, maDict)
+        self.assertEqual(self.headers['Authorization'], 'Token abc')
+        self.assertEqual(sorted(self.threads), ['getHeaders', 'intradayParams', 'intradayResult', 'tryAcquire'])
+        for name, threads in self.threads.items():
+            self.assertNotIn(threading.main_thread(), threads, name)
+
+
 if __name__ == '__main__':
     t = TestTingo_REST()
     # t.test_getHistoricalDailyPrice()
@@ -0,0 +1,77 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Test code for the nysecalendar module.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+import datetime as dt
+import unittest
+
+import pandas as pd
+
+from structjour.stock.nysecalendar import NyseCalendar, holidays
+
+
+class TestNyseCalendar(unittest.TestCase):
+    '''Test the NYSE sessions, holidays and early closes'''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cal = NyseCalendar(2019, 2026)
+
+    def test_holidays(self):
+        '''The published holidays, including the observed ones'''
+        expected = {
+            2021: ['01-01', '01-18', '02-15', '04-02', '05-31', '07-05', '09-06', '11-25', '12-24'],
+            2022: ['01-17', '02-21', '04-15', '05-30', '06-20', '07-04', '09-05', '11-24', '12-26'],
+            2024: ['01-01', '01-15', '02-19', '03-29', '05-27', '06-19', '07-04', '09-02', '11-28',
+                   '12-25'],
+        }
+        for year, days in expected.items():
+            self.assertEqual(sorted(d.strftime('%m-%d') for d in holidays(year)), days, year)
+
+    def test_earlyCloses(self):
+        early = sorted(d.isoformat() for d in self.cal.earlyCloses if d.year in (2020, 2021, 2024))
+        self.assertEqual(early, ['2020-11-27', '2020-12-24', '2021-11-26', '2024-07-03',
+                                 '2024-11-29', '2024-12-24'])
+        self.assertEqual(self.cal.openClose('2020-11-27'),
+                         (pd.Timestamp('2020-11-27 09:30'), pd.Timestamp('2020-11-27 13:00')))
+        self.assertEqual(self.cal.openClose('2020-11-30', afterHours=True)[1],
+                         pd.Timestamp('2020-11-30 20:00'))
+
+    def test_lookups(self):
+        cal = self.cal
+        self.assertFalse(cal.isSession('2020-11-26'))
+        self.assertTrue(cal.isSession(dt.datetime(2020, 11, 27, 12)))
+        self.assertEqual(cal.previousSession('2020-11-27'), pd.Timestamp('2020-11-25'))
+        self.assertEqual(cal.previousSession('2020-11-29'), pd.Timestamp('2020-11-27'))
+        self.assertEqual(cal.sessionAtOrBefore('2020-11-26 10:00'), pd.Timestamp('2020-11-25'))
+        self.assertEqual(cal.nextSession('2020-11-25'), pd.Timestamp('2020-11-27'))
+        self.assertEqual(cal.sessionsBack('2020-11-30', 2), pd.Timestamp('2020-11-25'))
+        self.assertEqual(cal.sessionsBack('2020-11-29', 1), pd.Timestamp('2020-11-27'))
+        self.assertEqual(cal.sessions('2020-12-24 10:00', '2020-12-28 12:00'),
+                         [pd.Timestamp('2020-12-24'), pd.Timestamp('2020-12-28')])
+        self.assertEqual(cal.sessions('2020-12-25', '2020-12-27'), [])
+        with self.assertRaises(ValueError):
+            cal.isSession('2030-01-02')
+
+
+if __name__ == '__main__':
+    unittest.main()
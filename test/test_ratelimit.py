@@ -0,0 +1,113 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Test code for the ratelimit module.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+import asyncio
+import unittest
+
+from structjour.config import DictBackend, Settings
+from structjour.stock import ratelimit as rl
+
+from helpers import Clock
+
+
+class TestRateLimit(unittest.TestCase):
+    '''Test the token bucket rate limits'''
+
+    def setUp(self):
+        self.clock = Clock(1000.0)
+        self.limiter = rl.RateLimiter(clock=self.clock, sleep=self.clock.sleep)
+
+    def test_acquire(self):
+        '''AlphaVantage allows 5 a minute. The sixth waits 12 seconds'''
+        for i in range(5):
+            self.assertTrue(self.limiter.acquire('av'))
+        self.assertEqual(self.clock.slept, [])
+        self.assertAlmostEqual(self.limiter.wait('av'), 12)
+        self.assertTrue(self.limiter.acquire('av'))
+        self.assertEqual(len(self.clock.slept), 1)
+        self.assertAlmostEqual(self.clock.slept[0], 12)
+
+    def test_timeout(self):
+        '''A wait longer than timeout fails without using the budget'''
+        for i in range(5):
+            self.limiter.acquire('av')
+        self.assertFalse(self.limiter.acquire('av', timeout=5))
+        self.assertEqual(self.clock.slept, [])
+        self.assertTrue(self.limiter.acquire('ib', timeout=0))
+
+    def test_aacquire(self):
+        '''The coroutine version waits with asyncio.sleep'''
+        limiter = rl.RateLimiter(limits={'fh': [(2, 1)]})
+
+        async def run():
+            return [await limiter.aacquire('fh') for i in range(3)]
+        self.assertEqual(asyncio.run(run()), [True] * 3)
+        self.assertFalse(asyncio.run(limiter.aacquire('fh', timeout=0)))
+
+    def test_block(self):
+        '''A rejected api is blocked until its reset time'''
+        self.limiter.block('fh', self.clock.now + 120)
+        self.assertAlmostEqual(self.limiter.wait('fh'), 120)
+        self.assertEqual(self.limiter.remaining('fh'), 0)
+        self.clock.now += 121
+        self.assertEqual(self.limiter.wait('fh'), 0)
+
+    def test_orderByBudget(self):
+        '''Apis that must wait or are nearly out of budget go last'''
+        for i in range(5):
+            self.limiter.acquire('av')
+        for i in range(140):
+            self.limiter.acquire('bc')
+        order = rl.orderByBudget(['av', 'bc', 'ib', 'fh', 'tgo'], self.limiter)
+        self.assertEqual(order, ['ib', 'fh', 'tgo', 'bc', 'av'])
+
+    def test_persist(self):
+        '''A new limiter with the same settings continues the budget'''
+        settings = Settings('zero_substance/stockapi', backend=DictBackend())
+        limiter = rl.RateLimiter(settings, clock=self.clock, sleep=self.clock.sleep)
+        for i in range(5):
+            limiter.acquire('av')
+        limiter.save()
+        limiter = rl.RateLimiter(settings, clock=self.clock, sleep=self.clock.sleep)
+        self.assertAlmostEqual(limiter.wait('av'), 12)
+
+    def test_throttleSave(self):
+        '''Requests are saved at most once in saveInterval seconds. A block is saved at once'''
+        backend = DictBackend()
+        settings = Settings('zero_substance/stockapi', backend=backend)
+        writes = []
+        setValue = backend.set
+        backend.set = lambda *args: writes.append(args) or setValue(*args)
+        limiter = rl.RateLimiter(settings, clock=self.clock, sleep=self.clock.sleep, saveInterval=30)
+        for i in range(50):
+            limiter.acquire('fh')
+        self.assertEqual(len(writes), 1)
+        self.clock.now += 30
+        limiter.acquire('fh')
+        self.assertEqual(len(writes), 2)
+        limiter.block('fh', self.clock.now + 60)
+        self.assertEqual(len(writes), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
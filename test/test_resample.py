@@ -0,0 +1,102 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Test code for the resample module.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+import unittest
+
+import pandas as pd
+
+from structjour.stock.bars import Bars
+from structjour.stock.resample import NATIVE, planResolution, resampleBars
+
+from helpers import makeCandles
+
+
+def pandasResample(df, minutes):
+    '''The five pass resample the apis used, anchored at 9:30 and without the empty bins'''
+    r = df.resample(f'{minutes}T', offset='9h30min')
+    result = pd.DataFrame({'open': r['open'].first(), 'high': r['high'].max(), 'low': r['low'].min(),
+                           'close': r['close'].last(), 'volume': r['volume'].sum()})
+    return result.loc[r['open'].count() > 0]
+
+
+class TestResample(unittest.TestCase):
+    '''Test the candle interval planning and resampling'''
+
+    def test_planResolution(self):
+        '''The largest native interval that divides the request'''
+        tests = [(10, 'av', 5), (45, 'av', 15), (90, 'av', 30), (120, 'av', 60), (7, 'av', 1),
+                 (12, 'fh', 1), (25, 'fh', 5), (4, 'ib', 2), (40, 'ib', 20), (180, 'ib', 60),
+                 (13, 'ib', 1)]
+        for minutes, token, expected in tests:
+            self.assertEqual(planResolution(minutes, NATIVE[token]), expected, (minutes, token))
+        self.assertEqual(planResolution(7, []), 1)
+
+    def test_resampleBars(self):
+        '''Matches pandas for intervals that divide the day and leaves out empty bins'''
+        df = pd.concat([makeCandles('2020-12-01 09:30', 390), makeCandles('2020-12-02 09:30', 390, seed=8)])
+        df = df.drop(df.index[100:130])
+        for minutes in [2, 5, 10, 15, 30, 60]:
+            result = resampleBars(df, minutes)
+            pd.testing.assert_frame_equal(result, pandasResample(df, minutes), check_freq=False,
+                                          check_names=False)
+        self.assertFalse(resampleBars(df, 5).isnull().any().any())
+
+    def test_anchor(self):
+        '''Every day's bins begin at 9:30, whatever the interval'''
+        df = pd.concat([makeCandles('2020-12-01 09:00', 420), makeCandles('2020-12-02 09:30', 390, seed=8)])
+        result = resampleBars(df, 7)
+        self.assertIn(pd.Timestamp('2020-12-01 09:30'), result.index)
+        self.assertIn(pd.Timestamp('2020-12-02 09:30'), result.index)
+        self.assertEqual(result.index[0], pd.Timestamp('2020-12-01 08:55'))
+        first = result.loc['2020-12-02 09:30']
+        day2 = df.loc['2020-12-02 09:30':'2020-12-02 09:36']
+        self.assertEqual(first['volume'], day2['volume'].sum())
+        self.assertEqual(first['high'], day2['high'].max())
+        self.assertEqual(result['volume'].sum(), df['volume'].sum())
+
+    def test_aligned(self):
+        '''Candles already on the bins come back unchanged. tz aware indexes keep their zone'''
+        df = makeCandles('2020-12-01 09:30', 78, 5)
+        pd.testing.assert_frame_equal(resampleBars(df, 5), df)
+        aware = df.tz_localize('US/Eastern')
+        result = resampleBars(aware, 15)
+        self.assertEqual(str(result.index.tz), 'US/Eastern')
+        self.assertEqual(result.index[0], pd.Timestamp('2020-12-01 09:30', tz='US/Eastern'))
+        self.assertEqual(len(result), 26)
+
+    def test_resampleBarsArrays(self):
+        '''Bars are resampled to the same candles as the DataFrame'''
+        df = pd.concat([makeCandles('2020-12-01 09:30', 390), makeCandles('2020-12-02 09:30', 390, seed=8)])
+        df = df.drop(df.index[100:130]).astype('float64')
+        bars = Bars.fromFrame(df)
+        for minutes in [1, 5, 7, 30]:
+            result = resampleBars(bars, minutes)
+            self.assertIsInstance(result, Bars)
+            pd.testing.assert_frame_equal(result.toFrame(), resampleBars(df, minutes), check_freq=False,
+                                          check_names=False)
+        self.assertIs(resampleBars(bars, 1), bars)
+        self.assertEqual(len(resampleBars(bars[:0], 5)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Test code for the singleflight module.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import unittest
+
+from structjour.stock.singleflight import SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    '''Test coalescing identical calls'''
+
+    def test_do(self):
+        '''Concurrent callers share one call and each gets its own copy'''
+        flight = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return [1, 2, 3]
+
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            futures = [pool.submit(flight.do, 'SQ', fetch, list) for i in range(5)]
+            while flight.calls and flight.calls['SQ'].waiting < 4:
+                time.sleep(.01)
+            release.set()
+            results = [f.result() for f in futures]
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [[1, 2, 3]] * 5)
+        self.assertEqual(len(set(id(r) for r in results)), 5)
+        self.assertEqual(flight.inFlight(), 0)
+
+        # A finished call is not reused
+        flight.do('SQ', fetch)
+        self.assertEqual(len(calls), 2)
+
+    def test_exception(self):
+        '''The waiting callers get the exception too'''
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def fail():
+            release.wait(5)
+            raise ValueError('no data')
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            futures = [pool.submit(flight.do, 'SQ', fail) for i in range(3)]
+            while flight.calls and flight.calls['SQ'].waiting < 2:
+                time.sleep(.01)
+            release.set()
+            for future in futures:
+                with self.assertRaises(ValueError):
+                    future.result()
+        self.assertEqual(flight.inFlight(), 0)
+
+    def test_ado(self):
+        '''Tasks share one call, different keys do not'''
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch(key):
+            calls.append(key)
+            await asyncio.sleep(.05)
+            return key
+
+        async def run():
+            return await asyncio.gather(*[flight.ado(k, lambda k=k: fetch(k))
+                                          for k in ['SQ', 'SQ', 'AAPL', 'SQ']])
+        results = asyncio.run(run())
+        self.assertEqual(results, ['SQ', 'SQ', 'AAPL', 'SQ'])
+        self.assertEqual(sorted(calls), ['AAPL', 'SQ'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Test code for the timenorm module.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+import unittest
+
+import pandas as pd
+
+from structjour.stock import timenorm as tn
+
+
+class TestTimenorm(unittest.TestCase):
+    '''Test the time normalization functions'''
+
+    def test_toNYNaive_dst(self):
+        '''Each bar gets its own offset. DST ended 11/1/20'''
+        utc = ['2020-10-30T13:30:00.000Z', '2020-11-02T14:30:00.000Z']
+        times = tn.toNYNaive(utc)
+        self.assertIsNone(times.tz)
+        self.assertEqual(list(times), [pd.Timestamp('2020-10-30 09:30'), pd.Timestamp('2020-11-02 09:30')])
+
+    def test_toNYNaive_offset(self):
+        '''Barchart style times with an offset keep the wall time'''
+        times = tn.toNYNaive(pd.Series(['2020-12-01T09:30:00-05:00', '2020-12-01T09:31:00-05:00']))
+        self.assertEqual(times[0], pd.Timestamp('2020-12-01 09:30'))
+        self.assertEqual(times[1], pd.Timestamp('2020-12-01 09:31'))
+
+    def test_unix_roundtrip(self):
+        times = pd.DatetimeIndex(['2020-03-06 09:30', '2020-03-09 09:30', '2020-11-02 16:00'])
+        unix = tn.NY2unix(times)
+        self.assertEqual(unix[1] - unix[0], 3 * 24 * 3600 - 3600)
+        self.assertTrue((tn.unix2NY(unix) == times).all())
+        self.assertEqual(tn.NY2unix(times[0]), unix[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
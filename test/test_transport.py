@@ -0,0 +1,125 @@
+# Structjour -- a daily trade review helper
+# Copyright (C) 2019 Zero Substance Trading
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+'''
+Test code for the transport module using a local http server.
+@author: Mike Petersen
+@creation_date: 10/18/26
+'''
+
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+import unittest
+
+import requests
+
+from structjour.stock import transport
+
+
+class Handler(BaseHTTPRequestHandler):
+    '''
+    Answer with the status codes in the class list codes, then 200. The path /slow answers
+    after delay seconds.
+    '''
+    codes = []
+    hits = 0
+    delay = 1.0
+
+    def do_GET(self):
+        Handler.hits += 1
+        if self.path.startswith('/slow'):
+            time.sleep(Handler.delay)
+        code = Handler.codes.pop(0) if Handler.codes else 200
+        try:
+            self.send_response(code)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'ok')
+        except OSError:
+            # The client gave up
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTransport(unittest.TestCase):
+    '''Test the pooled, retrying transport'''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        cls.url = f'http://127.0.0.1:{cls.server.server_port}/test'
+        cls.slowurl = f'http://127.0.0.1:{cls.server.server_port}/slow'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        transport.configure(backoff=0.01, retries=3)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        transport.closeAll()
+
+    def setUp(self):
+        Handler.hits = 0
+
+    def test_retry(self):
+        '''5xx and 429 responses are retried'''
+        Handler.codes = [503, 429]
+        r = transport.get(self.url, params={'symbol': 'SQ'})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(Handler.hits, 3)
+
+    def test_retry_exhausted(self):
+        '''After the last retry, the failed response is returned'''
+        Handler.codes = [500] * 4
+        r = transport.get(self.url)
+        self.assertEqual(r.status_code, 500)
+        self.assertEqual(Handler.hits, 4)
+
+    def test_readTimeout(self):
+        '''A server that is too slow raises Timeout once the retries run out, not ConnectionError'''
+        with self.assertRaises(requests.exceptions.Timeout) as cm:
+            transport.get(self.slowurl, timeout=(1, 0.1))
+        self.assertNotIsInstance(cm.exception, requests.exceptions.ConnectionError)
+        self.assertEqual(Handler.hits, 4)
+
+    def test_aget(self):
+        '''The coroutine version retries the same way'''
+        Handler.codes = [502]
+
+        async def run():
+            r = await transport.aget(self.url, params={'symbol': 'SQ'})
+            await transport.acloseAll()
+            return r
+        r = asyncio.run(run())
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.text, 'ok')
+        self.assertEqual(Handler.hits, 2)
+
+    def test_getSession(self):
+        '''One session per host'''
+        s1 = transport.getSession(self.url)
+        s2 = transport.getSession(self.url + '?x=1')
+        s3 = transport.getSession('https://api.tiingo.com/iex/')
+        self.assertIs(s1, s2)
+        self.assertIsNot(s1, s3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,10 +4,13 @@
 @creation_date: 2019-01-17
 '''
 import datetime as dt
+import logging
+import os
 import types
 import unittest
 
-from stock import utilities as util
+from structjour import config
+from structjour.stock import utilities as util
 # pylint: disable = C0103
 
 
@@ -28,6 +31,29 @@ class TestUtilities(unittest.TestCase):
             self.assertTrue(dd.isoweekday() < 6)
             self.assertTrue(dd.isoweekday() > 0)
 
+    def test_getMASettings(self):
+        '''Missing or partial chart settings give no moving averages and no VWAP'''
+        saved = config.BACKEND
+        try:
+            for getmas in [None, [], [[]], [[], []], [[], ['vwap']]]:
+                data = {'chart': {'getmas': getmas}} if getmas is not None else {}
+                config.setBackend(config.DictBackend(data), env=False)
+                self.assertEqual(util.getMASettings(), ({}, []))
+            config.setBackend(config.DictBackend(
+                {'chart': {'getmas': [[[9, 9, 'red'], [20, 20, 'blue']], ['vwap', 'yellow']]}}), env=False)
+            maDict, vwap = util.getMASettings()
+            self.assertEqual(maDict, {9: [9, 'red'], 20: [20, 'blue']})
+            self.assertEqual(vwap, [['vwap', 'yellow']])
+        finally:
+            config.BACKEND = saved
+
+    def test_setDBWithoutGui(self):
+        '''A missing db is logged when there is no gui to show it in'''
+        mk = util.ManageKeys.__new__(util.ManageKeys)
+        mk.settings = config.getSettings('zero_substance')
+        with self.assertLogs(level=logging.WARNING):
+            mk.setDB(os.path.join(os.path.dirname(__file__), 'no_such.sqlite'))
+
 def notmain():
     '''Run some local code'''
     t = TestUtilities()